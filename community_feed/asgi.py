@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'community_feed.settings')
 
 application = get_asgi_application()
+
+# Server processes only; apps.ready() also runs for every management command
+from feed.apps import start_background_threads  # noqa: E402
+
+start_background_threads()
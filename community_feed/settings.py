@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'feed.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -87,6 +88,60 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local-memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'community-feed'),
+    }
+}
+
+# Post detail payloads are keyed by Post.version; the timeout only bounds how
+# stale the embedded karma figures can get
+POST_DETAIL_CACHE_TIMEOUT = int(os.environ.get('POST_DETAIL_CACHE_TIMEOUT', '60'))
+
+# Leaderboard snapshots (seconds). With a shared CACHE_BACKEND, run
+# `manage.py refresh_leaderboard` as a worker process (e.g. a Procfile
+# `worker:` entry); otherwise set LEADERBOARD_REFRESH_THREAD=True to refresh
+# in-process. The command refuses to run against a process-local cache.
+# In-process threads (this refresher, the like buffer flusher) are started by
+# community_feed.wsgi/asgi, never by management commands.
+LEADERBOARD_SNAPSHOT_MAX_AGE = int(os.environ.get('LEADERBOARD_SNAPSHOT_MAX_AGE', '30'))
+LEADERBOARD_REFRESH_INTERVAL = int(os.environ.get('LEADERBOARD_REFRESH_INTERVAL', '15'))
+LEADERBOARD_REFRESH_LOCK_TIMEOUT = int(os.environ.get('LEADERBOARD_REFRESH_LOCK_TIMEOUT', '30'))
+LEADERBOARD_REFRESH_THREAD = os.environ.get('LEADERBOARD_REFRESH_THREAD', 'False') == 'True'
+
+# Write-behind likes: queue like/unlike in memory and flush in batches.
+# Answers clicks with 202 immediately; best for viral spikes on hot posts.
+# Duplicate clicks are only rejected within one process; across processes the
+# flush skips likes that already exist.
+LIKE_WRITE_BEHIND = os.environ.get('LIKE_WRITE_BEHIND', 'False') == 'True'
+LIKE_BUFFER_FLUSH_INTERVAL_MS = int(os.environ.get('LIKE_BUFFER_FLUSH_INTERVAL_MS', '50'))
+
+# Async views (/api/async/...) run independent queries concurrently, each on
+# its own worker-thread connection; False keeps them on one connection
+ASYNC_PARALLEL_QUERIES = os.environ.get('ASYNC_PARALLEL_QUERIES', 'True') == 'True'
+
+# Live stream (/api/stream/, ASGI only): deltas are coalesced and sent at
+# most once per tick; idle connections get an SSE comment as a keepalive
+STREAM_TICK_SECONDS = float(os.environ.get('STREAM_TICK_SECONDS', '1.0'))
+STREAM_KEEPALIVE_SECONDS = int(os.environ.get('STREAM_KEEPALIVE_SECONDS', '15'))
+STREAM_RETRY_MS = int(os.environ.get('STREAM_RETRY_MS', '3000'))
+
+# Per-route request metrics for /api/, scraped from /api/_metrics. A request
+# running more than its query budget logs a warning; QUERY_BUDGETS overrides
+# the default per URL name, e.g. {'posts-detail': 10}
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS', 'True') == 'True'
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '50'))
+QUERY_BUDGETS = {}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -11,8 +11,8 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'community_feed.settings')
 django.setup()
 
-from feed.models import User, Post, Comment, Like
-from django.contrib.contenttypes.models import ContentType
+from feed.models import User, Post, Comment, PostLike, CommentLike
+from feed.utils import record_like_change
 import random
 
 def create_sample_data():
@@ -62,31 +62,25 @@ def create_sample_data():
         )
 
     # Create likes for posts
-    post_content_type = ContentType.objects.get_for_model(Post)
     for _ in range(30):
         user = random.choice(users)
         post = random.choice(posts)
-        Like.objects.get_or_create(
-            user=user,
-            content_type=post_content_type,
-            object_id=post.id
-        )
+        like, created = PostLike.objects.get_or_create(user=user, post=post)
+        if created:
+            record_like_change(post, like, 1)
 
     # Create likes for comments
-    comment_content_type = ContentType.objects.get_for_model(Comment)
     for _ in range(50):
         user = random.choice(users)
         comment = random.choice(comments)
-        Like.objects.get_or_create(
-            user=user,
-            content_type=comment_content_type,
-            object_id=comment.id
-        )
+        like, created = CommentLike.objects.get_or_create(user=user, comment=comment)
+        if created:
+            record_like_change(comment, like, 1)
 
     print(f"Created {User.objects.count()} users")
     print(f"Created {Post.objects.count()} posts")
     print(f"Created {Comment.objects.count()} comments")
-    print(f"Created {Like.objects.count()} likes")
+    print(f"Created {PostLike.objects.count() + CommentLike.objects.count()} likes")
     print("Sample data ready!")
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Post, Comment, Like
+from .models import User, Post, Comment, PostLike, CommentLike, KarmaBucket
 
 
 @admin.register(User)
@@ -13,7 +13,8 @@ class PostAdmin(admin.ModelAdmin):
     list_display = ['id', 'author', 'content_preview', 'like_count', 'created_at']
     list_filter = ['created_at', 'author']
     search_fields = ['content', 'author__username']
-    readonly_fields = ['created_at', 'updated_at']
+    # Counters and cache validators are maintained by the app, never by hand
+    readonly_fields = ['created_at', 'updated_at', 'like_count', 'version', 'last_activity_at']
     
     def content_preview(self, obj):
         return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
@@ -25,16 +26,34 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ['id', 'author', 'post', 'content_preview', 'parent', 'like_count', 'created_at']
     list_filter = ['created_at', 'author', 'post']
     search_fields = ['content', 'author__username']
-    readonly_fields = ['created_at', 'updated_at']
+    # path/depth are derived from the parent when the comment is created
+    readonly_fields = ['created_at', 'updated_at', 'like_count', 'path', 'depth']
     
     def content_preview(self, obj):
         return obj.content[:30] + "..." if len(obj.content) > 30 else obj.content
     content_preview.short_description = 'Content Preview'
 
 
-@admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'content_type', 'object_id', 'content_object', 'karma_value', 'created_at']
-    list_filter = ['created_at', 'content_type']
+@admin.register(PostLike)
+class PostLikeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'post', 'created_at']
+    list_filter = ['created_at']
     search_fields = ['user__username']
+    raw_id_fields = ['post']
     readonly_fields = ['created_at']
+
+
+@admin.register(CommentLike)
+class CommentLikeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'comment', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['user__username']
+    raw_id_fields = ['comment']
+    readonly_fields = ['created_at']
+
+
+@admin.register(KarmaBucket)
+class KarmaBucketAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'bucket_start', 'karma']
+    list_filter = ['bucket_start']
+    search_fields = ['user__username']
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class FeedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'feed'
+
+    def ready(self):
+        from . import conditional, likes  # Register the signal receivers
+
+
+def start_background_threads():
+    """
+    Start the in-process leaderboard refresher and like buffer flusher if
+    enabled. Called from the WSGI/ASGI entry points only, so management
+    commands and the test runner never spawn them.
+    """
+    if getattr(settings, 'LEADERBOARD_REFRESH_THREAD', False):
+        from .leaderboard import start_leaderboard_refresher
+        start_leaderboard_refresher()
+    if getattr(settings, 'LIKE_WRITE_BEHIND', False):
+        from .like_buffer import start_like_buffer_flusher
+        start_like_buffer_flusher()
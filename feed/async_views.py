@@ -0,0 +1,259 @@
+"""
+Async read endpoints for ASGI deployments
+
+Mirrors the post list, post detail and leaderboard under ``/api/async/``
+so a slow query parks a coroutine instead of pinning a worker. Responses,
+ETags and the post detail cache are shared with the DRF endpoints. The
+live stream (``/api/stream/``) is served from here too.
+
+Django's async ORM runs every query on one thread per request, so queries
+that don't depend on each other (a page and its count, the karma map and
+the viewer's likes, the post payload and the viewer's likes) go through
+``gather_queries`` instead, which runs them concurrently on worker threads
+with their own connections. Set ASYNC_PARALLEL_QUERIES=False to run them
+one after another on the request's connection.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import get_cached_post_detail, overlay_is_liked
+from .conditional import (
+    feed_validators,
+    leaderboard_validators,
+    not_modified,
+    post_detail_state,
+    post_detail_validators,
+    set_validators
+)
+from .events import event_stream
+from .leaderboard import get_leaderboard_snapshot
+from .pagination import FeedCursorPagination
+from .serializers import PostListSerializer, PostSerializer
+from .utils import (
+    KARMA_WINDOWS,
+    get_karma_map,
+    get_liked_objects,
+    get_liked_objects_in_post,
+    get_optimized_posts_queryset,
+    get_page_author_ids,
+    get_viewer,
+    iter_page_comments
+)
+from .views import (
+    StandardResultsSetPagination,
+    build_post_detail,
+    overlay_buffered_likes,
+    parse_max_depth,
+    parse_preview_size,
+    post_detail_variant,
+    wants_cursor_pagination
+)
+
+
+def _on_own_connection(func):
+    def run():
+        try:
+            return func()
+        finally:
+            # Worker threads outlive the request; honour CONN_MAX_AGE here
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*funcs):
+    """Run independent sync ORM callables concurrently; results in order"""
+    if not getattr(settings, 'ASYNC_PARALLEL_QUERIES', True):
+        return [await sync_to_async(func)() for func in funcs]
+    return await asyncio.gather(*(
+        sync_to_async(_on_own_connection(func), thread_sensitive=False)()
+        for func in funcs
+    ))
+
+
+def _page_bounds(request):
+    """``(page, page_size)`` with the same limits as the DRF post list"""
+    pagination = StandardResultsSetPagination
+    try:
+        page_size = int(request.GET.get(pagination.page_size_query_param, pagination.page_size))
+    except ValueError:
+        page_size = pagination.page_size
+    page_size = max(1, min(page_size, pagination.max_page_size))
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+    return page, page_size
+
+
+def _page_link(request, page):
+    url = request.build_absolute_uri()
+    if page == 1:
+        return remove_query_param(url, 'page')
+    return replace_query_param(url, 'page', page)
+
+
+@require_GET
+async def post_list(request):
+    """
+    Async ``GET /api/posts/``: same pages (numbered, or keyset with
+    ``?pagination=cursor``), preview and ETag behaviour
+    """
+    etag, last_modified = await sync_to_async(feed_validators)(request)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return set_validators(cached, etag, last_modified)
+
+    drf_request = Request(request)
+    expand_comments = 'comments' in request.GET.get('expand', '').split(',')
+    queryset = get_optimized_posts_queryset(
+        expand_comments=expand_comments,
+        preview_size=parse_preview_size(request)
+    ).order_by('-created_at')
+
+    if wants_cursor_pagination(request.GET):
+        paginator = FeedCursorPagination()
+        try:
+            posts, viewer = await gather_queries(
+                lambda: paginator.paginate_queryset(queryset, drf_request),
+                lambda: get_viewer(request)
+            )
+        except NotFound as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=404)
+        envelope = {
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link()
+        }
+    else:
+        page, page_size = _page_bounds(request)
+        offset = (page - 1) * page_size
+        total, viewer = await gather_queries(queryset.count, lambda: get_viewer(request))
+        if page < 1 or (offset >= total and page != 1):
+            return JsonResponse({'detail': 'Invalid page.'}, status=404)
+        posts = [post async for post in queryset[offset:offset + page_size]]
+        envelope = {
+            'count': total,
+            'next': _page_link(request, page + 1) if offset + page_size < total else None,
+            'previous': _page_link(request, page - 1) if page > 1 else None
+        }
+
+    karma_map, liked_objects = await gather_queries(
+        lambda: get_karma_map(get_page_author_ids(posts)),
+        lambda: get_liked_objects(
+            viewer,
+            post_ids=[post.id for post in posts],
+            comment_ids=[comment.id for comment in iter_page_comments(posts)]
+        )
+    )
+    context = {
+        'request': drf_request,
+        'karma_map': karma_map,
+        'liked_objects': liked_objects
+    }
+    serializer_class = PostSerializer if expand_comments else PostListSerializer
+
+    def serialize():
+        data = serializer_class(posts, many=True, context=context).data
+        return overlay_buffered_likes(request, data, 'post')
+
+    response = JsonResponse({**envelope, 'results': await sync_to_async(serialize)()})
+    return set_validators(response, etag, last_modified)
+
+
+@require_GET
+async def post_detail(request, pk):
+    """
+    Async ``GET /api/posts/{id}/``
+    The cached payload and the viewer's likes are fetched concurrently
+    """
+    try:
+        max_depth = parse_max_depth(Request(request))
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=400)
+
+    row = await sync_to_async(post_detail_state)(pk)
+    if row is None:
+        return JsonResponse({'error': 'Post not found'}, status=404)
+
+    version, created_at, _, _ = row
+    etag, last_modified = await sync_to_async(post_detail_validators)(request, *row)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return set_validators(cached, etag, last_modified)
+
+    variant = post_detail_variant(request, created_at, max_depth)
+    drf_request = Request(request)
+    viewer = await sync_to_async(get_viewer)(request)
+    payload, liked_objects = await gather_queries(
+        lambda: get_cached_post_detail(
+            pk, version, variant,
+            lambda: build_post_detail(drf_request, pk, max_depth)
+        ),
+        lambda: get_liked_objects_in_post(viewer, pk)
+    )
+    if payload is None:
+        return JsonResponse({'error': 'Post not found'}, status=404)
+
+    overlay_is_liked(payload, liked_objects)
+    await sync_to_async(overlay_buffered_likes)(request, [payload], 'post')
+    return set_validators(JsonResponse(payload), etag, last_modified)
+
+
+@require_GET
+async def leaderboard(request):
+    """Async ``GET /api/leaderboard/``: the top 5 from the current snapshot"""
+    window_key = request.GET.get('window', '24h')
+    if window_key not in KARMA_WINDOWS:
+        return JsonResponse(
+            {
+                'error': f"Unsupported window '{window_key}'",
+                'allowed_windows': list(KARMA_WINDOWS)
+            },
+            status=400
+        )
+
+    snapshot = await sync_to_async(get_leaderboard_snapshot)(window_key)
+    etag, last_modified = leaderboard_validators(snapshot)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return set_validators(cached, etag, last_modified)
+
+    return set_validators(JsonResponse({
+        'leaderboard': snapshot['leaderboard'],
+        'period': snapshot['period'],
+        'window': window_key,
+        'updated_at': snapshot['updated_at']
+    }), etag, last_modified)
+
+
+@require_GET
+async def stream(request):
+    """
+    ``GET /api/stream/``: Server-Sent Events with live deltas, one
+    ``delta`` event per tick at most::
+
+        {"likes": {"post": {"12": 40}, "comment": {"7": 3}},
+         "comments": {"12": [98, 99]},
+         "leaderboard": {"24h": {"leaderboard": [...], "updated_at": "..."}}}
+
+    Keys are present only when something changed. Needs the ASGI app; a
+    WSGI worker would be pinned for the life of every connection.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'The live stream is only served by the ASGI application'},
+            status=501
+        )
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,204 @@
+"""
+Helpers for the benchmark commands: concurrent drivers, latency summaries
+and comparison of JSON reports between runs
+"""
+import http.client
+import resource
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.test import Client
+
+# Relative change beyond which a metric counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# metric -> True if larger is better
+COMPARED_METRICS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'queries_per_request': False,
+    'peak_rss_mb': False,
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def process_peak_rss_mb(pid):
+    """Peak RSS of another process from /proc (Linux), or None"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+class QueryCounter:
+    """Thread-safe ``execute_wrapper`` counting queries across worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class InProcessDriver:
+    """Requests through Django's test client, one client per worker thread"""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.queries = QueryCounter()
+
+    def request(self, method, path):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+        with connection.execute_wrapper(self.queries):
+            return getattr(client, method.lower())(path).status_code
+
+    def close(self):
+        connection.close()
+
+
+class HttpDriver:
+    """Requests to a running server over keep-alive connections, one per thread"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.local = threading.local()
+
+    def request(self, method, path):
+        return self.fetch(method, path)[0]
+
+    def fetch(self, method, path):
+        """``(status, body)``; retries once if an idle keep-alive socket was closed"""
+        for attempt in (1, 2):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                conn.request(method, self.prefix + path)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+
+def run_endpoint(driver, sample, requests, concurrency):
+    """
+    Call ``sample(driver, i)`` for i in ``range(requests)`` across
+    ``concurrency`` threads; returns ``(latencies, failures, elapsed)``.
+    A sample may make several requests and returns their statuses.
+    """
+    indexes = iter(range(requests))
+    lock = threading.Lock()
+    latencies, failures = [], []
+
+    def worker():
+        samples, failed = [], 0
+        try:
+            while True:
+                with lock:
+                    i = next(indexes, None)
+                if i is None:
+                    break
+                began = time.perf_counter()
+                try:
+                    statuses = sample(driver, i)
+                except Exception:
+                    statuses = [599]
+                samples.append(time.perf_counter() - began)
+                failed += any(status >= 400 for status in statuses)
+        finally:
+            # Each worker holds its own DB connection or socket
+            driver.close()
+        with lock:
+            latencies.extend(samples)
+            failures.append(failed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(failures), time.perf_counter() - began
+
+
+def scraped_query_total(metrics_text):
+    """Queries recorded by every route in a /api/_metrics scrape"""
+    total = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith('feed_request_queries_sum{'):
+            total += float(line.rsplit(' ', 1)[1])
+    return total
+
+
+def summarize(latencies, failures, elapsed):
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(ms),
+        'errors': failures,
+        'throughput_rps': round(len(ms) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(ms), 2),
+        'p50_ms': round(statistics.median(ms), 2),
+        'p95_ms': round(percentile(ms, 0.95), 2),
+        'p99_ms': round(percentile(ms, 0.99), 2),
+    }
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    ``(endpoint, metric, old, new, change, regressed)`` rows for every
+    metric both reports have. Any rise in queries per request regresses;
+    other metrics regress when they worsen by more than ``threshold``.
+    """
+    rows = []
+    for endpoint, new in current['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = old.get(metric), new.get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            if metric == 'queries_per_request':
+                regressed = after > before
+            else:
+                regressed = worse > threshold
+            rows.append((endpoint, metric, before, after, change, regressed))
+    return rows
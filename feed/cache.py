@@ -0,0 +1,95 @@
+"""
+Versioned response cache for the post detail payload
+
+Entries are keyed by ``Post.version``, which every write to the post, its
+comments or their likes bumps, so a stale payload is simply never looked up
+again (and ages out via the timeout). Payloads are viewer-neutral: per-viewer
+fields such as ``is_liked`` are overlaid after the cached fetch.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for one cache namespace (per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+post_detail_stats = CacheStats()
+
+
+def get_post_detail_cache():
+    return caches[getattr(settings, 'POST_DETAIL_CACHE_ALIAS', 'default')]
+
+
+def post_detail_cache_key(post_id, version, variant=''):
+    """``variant`` covers query params that change the payload shape"""
+    return f'post-detail:{post_id}:v{version}:{variant}'
+
+
+def get_cached_post_detail(post_id, version, variant, build):
+    """
+    Return the cached payload for this post version, building and storing
+    it with ``build()`` on a miss. ``build`` may return None (not found).
+    """
+    cache = get_post_detail_cache()
+    key = post_detail_cache_key(post_id, version, variant)
+
+    payload = cache.get(key)
+    post_detail_stats.record(hit=payload is not None)
+    if payload is not None:
+        return payload
+
+    payload = build()
+    if payload is not None:
+        cache.set(key, payload, getattr(settings, 'POST_DETAIL_CACHE_TIMEOUT', 60))
+    return payload
+
+
+def iter_payload_comments(payload):
+    """Every comment node in a serialized post detail payload"""
+    stack = list(payload.get('comments', ()))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.get('replies', ()))
+
+
+def overlay_is_liked(payload, liked_objects):
+    """
+    Set the viewer's ``is_liked`` flags on a viewer-neutral payload in place
+    ``liked_objects`` holds ``(kind, id)`` pairs from ``get_liked_objects``
+    """
+    if 'is_liked' in payload:
+        payload['is_liked'] = ('post', payload['id']) in liked_objects
+    for node in iter_payload_comments(payload):
+        if 'is_liked' in node:
+            node['is_liked'] = ('comment', node['id']) in liked_objects
+    return payload
@@ -0,0 +1,146 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the read endpoints
+
+Validators are computed from indexed version/timestamp columns with a single
+query and no serialization, so an ``If-None-Match`` poll that matches is
+answered with a 304 before any heavy work runs.
+
+Feed and post payloads also embed each author's windowed karma, which moves
+with likes on the author's other content and as the window slides. Their
+validators therefore include the latest karma write and the current karma
+period (POST_DETAIL_CACHE_TIMEOUT seconds, the same bound the cached
+payloads already have), so a 304 never outlives the karma it vouches for.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Subquery
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import FeedState, KarmaBucket, Post
+
+
+def make_etag(*parts):
+    """Strong ETag over the given parts"""
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in parts).encode('utf-8'),
+        usedforsecurity=False
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def viewer_key(request):
+    """Per-viewer fields (is_liked) differ by user; anonymous requests share one"""
+    if request.user.is_authenticated:
+        return f'u{request.user.pk}'
+    return 'anon'
+
+
+def latest_karma_write():
+    """Scalar subquery for the newest ``KarmaBucket.updated_at`` (indexed)"""
+    return Subquery(KarmaBucket.objects.order_by('-updated_at').values('updated_at')[:1])
+
+
+def karma_period():
+    """``(index, start)`` of the current karma period; windowed karma slides without writes"""
+    interval = max(getattr(settings, 'POST_DETAIL_CACHE_TIMEOUT', 60), 1)
+    index = int(time.time() // interval)
+    return index, datetime.fromtimestamp(index * interval, tz=dt_timezone.utc)
+
+
+def _karma_validators(*parts, last_modified, karma_version):
+    """ETag over ``parts`` plus the karma state, and the matching Last-Modified"""
+    period, period_start = karma_period()
+    etag = make_etag(*parts, karma_version, period)
+    return etag, max(
+        moment for moment in (last_modified, karma_version, period_start) if moment
+    )
+
+
+@receiver(post_delete, sender=Post)
+def record_post_deletion(sender, instance, **kwargs):
+    FeedState.record_deletion()
+
+
+def feed_state():
+    """
+    ``{'latest', 'deletions', 'last_deletion_at', 'karma'}``: the newest
+    activity, the post deletion marker and the latest karma write, in one
+    query of indexed ``LIMIT 1`` lookups
+    """
+    latest_activity = Post.objects.order_by('-last_activity_at').values('last_activity_at')[:1]
+    state = FeedState.objects.filter(pk=FeedState.SINGLETON_ID).annotate(
+        latest=Subquery(latest_activity), karma=latest_karma_write()
+    ).values('latest', 'deletions', 'last_deletion_at', 'karma').first()
+    if state is None:
+        # Created by migration 0013; recreate it after a flush
+        FeedState.objects.get_or_create(pk=FeedState.SINGLETON_ID)
+        return feed_state()
+    return state
+
+
+def feed_validators(request):
+    """
+    (etag, last_modified) for the post list
+    Any post write, comment or like moves ``Max(last_activity_at)``,
+    deletions move the FeedState marker, and the karma state covers the
+    authors' embedded karma
+    """
+    state = feed_state()
+    activity = [moment for moment in (state['latest'], state['last_deletion_at']) if moment]
+    return _karma_validators(
+        'feed', state['latest'], state['deletions'],
+        request.get_full_path(), viewer_key(request),
+        last_modified=max(activity, default=None), karma_version=state['karma']
+    )
+
+
+def post_detail_state(post_id):
+    """
+    ``(version, created_at, last_activity_at, karma_version)`` for one post
+    in one query, or None if it doesn't exist
+    """
+    return Post.objects.filter(pk=post_id).annotate(
+        karma_version=latest_karma_write()
+    ).values_list('version', 'created_at', 'last_activity_at', 'karma_version').first()
+
+
+def post_detail_validators(request, version, created_at, last_activity_at, karma_version):
+    """(etag, last_modified) for one post from its already-fetched state row"""
+    return _karma_validators(
+        'post', created_at.timestamp(), version,
+        request.get_full_path(), viewer_key(request),
+        last_modified=last_activity_at, karma_version=karma_version
+    )
+
+
+def leaderboard_validators(snapshot):
+    """
+    (etag, last_modified) for a leaderboard snapshot
+    The snapshot is already in memory, so this costs nothing
+    """
+    etag = make_etag('leaderboard', snapshot['window'], snapshot['updated_at'])
+    return etag, datetime.fromtimestamp(snapshot['computed_at'], tz=dt_timezone.utc)
+
+
+def not_modified(request, etag, last_modified=None):
+    """304 response if the client's validators still match, else None"""
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach validators; clients must revalidate since payloads are per viewer"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, no-cache'
+    return response
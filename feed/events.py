@@ -0,0 +1,196 @@
+"""
+In-process pub/sub behind the live stream (``GET /api/stream/``)
+
+Write paths publish fresh like counts and new comment ids into a
+dict under a lock; nothing is sent from the request thread, and with no
+subscribers connected publishing returns immediately. Once per
+STREAM_TICK_SECONDS a single ticker drains the dict, so an object liked a
+hundred times in one tick appears once with its latest like_count, checks
+the leaderboard snapshots for a changed top 5, and encodes one SSE frame
+that every subscriber receives as-is. An idle subscriber is one parked
+coroutine and a small queue.
+
+Likes and comments are seen only when written by this process; leaderboard
+changes come from the snapshot cache, so they reach every process sharing
+it. A subscriber that falls too far behind gets a ``resync`` event and
+should refetch.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .leaderboard import get_snapshot_cache, snapshot_key
+from .utils import KARMA_WINDOWS
+
+SUBSCRIBER_QUEUE_SIZE = 32
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def encode_event(event, data):
+    """One SSE frame with compact JSON data"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+RESYNC_FRAME = encode_event('resync', {})
+
+
+class Subscriber:
+    """One stream connection: a bounded queue of encoded frames"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, frame):
+        """Queue a frame; on overflow drop the backlog and ask for a resync"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+
+    async def frames(self, keepalive):
+        """Frames as they arrive, with an SSE comment every ``keepalive`` seconds"""
+        while True:
+            try:
+                yield await asyncio.wait_for(self.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+
+
+class EventHub:
+    """
+    Coalescing publisher and subscriber registry
+    ``publish_*`` may be called from any thread; subscribers live on the
+    event loop serving the stream (one per process under uvicorn)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._likes = {}
+        self._comments = defaultdict(list)
+        self._leaderboards = {}
+        self._subscribers = set()
+        self._ticker = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish_like(self, kind, object_id, like_count):
+        """A post or comment now has ``like_count`` likes"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._likes[(kind, object_id)] = like_count
+
+    def publish_comment(self, post_id, comment_id):
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._comments[post_id].append(comment_id)
+
+    def drain(self):
+        """Everything published since the last drain, as a delta payload"""
+        with self._lock:
+            likes, self._likes = self._likes, {}
+            comments, self._comments = self._comments, defaultdict(list)
+
+        delta = {}
+        if likes:
+            grouped = defaultdict(dict)
+            for (kind, object_id), like_count in likes.items():
+                grouped[kind][str(object_id)] = like_count
+            delta['likes'] = dict(grouped)
+        if comments:
+            delta['comments'] = {str(post_id): ids for post_id, ids in comments.items()}
+        return delta
+
+    def leaderboard_changes(self):
+        """Windows whose cached top 5 differs from the last one seen"""
+        keys = {snapshot_key(window_key): window_key for window_key in KARMA_WINDOWS}
+        changed = {}
+        for key, snapshot in get_snapshot_cache().get_many(list(keys)).items():
+            window_key = keys[key]
+            top = snapshot['leaderboard']
+            if window_key in self._leaderboards and self._leaderboards[window_key] != top:
+                changed[window_key] = {'leaderboard': top, 'updated_at': snapshot['updated_at']}
+            self._leaderboards[window_key] = top
+        return changed
+
+    def tick(self):
+        """This tick's encoded frame, or None if nothing changed"""
+        delta = self.drain()
+        leaderboards = self.leaderboard_changes()
+        if leaderboards:
+            delta['leaderboard'] = leaderboards
+        return encode_event('delta', delta) if delta else None
+
+    def broadcast(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        running = asyncio.get_running_loop()
+        for subscriber in subscribers:
+            if subscriber.loop is running:
+                subscriber.offer(frame)
+            elif not subscriber.loop.is_closed():
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, frame)
+
+    async def _run_ticker(self):
+        interval = _setting('STREAM_TICK_SECONDS', 1.0)
+        tick = sync_to_async(self.tick, thread_sensitive=False)
+        while self._subscribers:
+            await asyncio.sleep(interval)
+            frame = await tick()
+            if frame is not None:
+                self.broadcast(frame)
+
+    def subscribe(self):
+        """Register a subscriber on the running loop, starting the ticker if idle"""
+        loop = asyncio.get_running_loop()
+        subscriber = Subscriber(loop)
+        with self._lock:
+            if not self._subscribers:
+                # Start from the current leaderboards, not whatever was seen last
+                self._leaderboards = {}
+            self._subscribers.add(subscriber)
+            ticker = self._ticker
+            if ticker is None or ticker.done() or ticker.get_loop().is_closed():
+                self._ticker = loop.create_task(self._run_ticker())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            idle = not self._subscribers
+            ticker = self._ticker if idle else None
+            if idle:
+                self._ticker = None
+        if ticker is not None and not ticker.done() and not ticker.get_loop().is_closed():
+            ticker.get_loop().call_soon_threadsafe(ticker.cancel)
+
+
+event_hub = EventHub()
+
+
+async def event_stream(hub=event_hub):
+    """
+    Async iterator of SSE frames for one client
+    Unsubscribes when the client disconnects and the response is cancelled
+    """
+    subscriber = hub.subscribe()
+    try:
+        # Sets the client's reconnect delay and gets the headers out at once
+        yield f"retry: {_setting('STREAM_RETRY_MS', 3000)}\n\n"
+        async for frame in subscriber.frames(_setting('STREAM_KEEPALIVE_SECONDS', 15)):
+            yield frame
+    finally:
+        hub.unsubscribe(subscriber)
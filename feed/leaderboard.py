@@ -0,0 +1,280 @@
+"""
+Precomputed leaderboard snapshots
+
+The top-N for each karma window is materialized into the cache and served
+in O(1). Snapshots are refreshed by a background refresher (management
+command or in-process thread) and, failing that, on read once they are
+older than LEADERBOARD_SNAPSHOT_MAX_AGE. Refreshes are single-flight: one
+caller recomputes while everyone else keeps serving the previous snapshot
+(or waits for the first one), so an expiry under load never stampedes.
+
+Only the background refresher also writes the full ranking to
+LeaderboardEntry for rank lookups and deep pages; a read request never
+rewrites O(users) rows. Writers serialize on the window's
+LeaderboardWindow row, since the cache lock is per process with a local
+cache. A snapshot records whether its ranking was stored; when it wasn't,
+lookups and deep pages read the live ranking instead.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import KarmaBucket, LeaderboardEntry, LeaderboardWindow, User
+from .utils import KARMA_WINDOWS, get_karma_ranking
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SIZE = 5
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_snapshot_cache():
+    return caches[_setting('LEADERBOARD_CACHE_ALIAS', 'default')]
+
+
+def snapshot_cache_is_shared():
+    """Whether snapshots cached by one process are visible to the others"""
+    return not isinstance(get_snapshot_cache(), (LocMemCache, DummyCache))
+
+
+def snapshot_key(window_key):
+    return f'leaderboard-snapshot:{window_key}'
+
+
+def _karma_version():
+    """Latest karma write; unchanged means the ranking can only have aged"""
+    latest = KarmaBucket.objects.aggregate(latest=Max('updated_at'))['latest']
+    return latest.isoformat() if latest else None
+
+
+def _ranked(user, rank, karma):
+    user.rank = rank
+    user.karma_24h = karma  # Field name kept for API stability
+    return user
+
+
+def store_leaderboard_ranking(window_key, ranking, computed_at):
+    """
+    Replace a window's LeaderboardEntry rows with ``(user_id, karma)`` in
+    rank order, unless a ranking computed later is already stored
+    Returns whether the rows were written
+    """
+    with transaction.atomic():
+        # Row lock: a concurrent refresher waits here, then sees our rows
+        lock, _ = LeaderboardWindow.objects.select_for_update().get_or_create(window=window_key)
+        if lock.computed_at is not None and lock.computed_at >= computed_at:
+            return False
+        lock.computed_at = computed_at
+        lock.save(update_fields=['computed_at'])
+        LeaderboardEntry.objects.filter(window=window_key).delete()
+        LeaderboardEntry.objects.bulk_create(
+            [
+                LeaderboardEntry(window=window_key, rank=rank, user_id=user_id, karma=karma)
+                for rank, (user_id, karma) in enumerate(ranking, start=1)
+            ],
+            batch_size=1000,
+        )
+    return True
+
+
+def compute_leaderboard_snapshot(window_key, store=False):
+    """
+    Rank every author for a window and package the top for the cache
+    With ``store`` (background refreshes only) the full ranking also
+    replaces the window's entries
+    """
+    from .serializers import LeaderboardUserSerializer
+
+    window, label = KARMA_WINDOWS[window_key]
+    karma_version = _karma_version()
+    computed = timezone.now()
+    ranking = get_karma_ranking(window)
+    stored = store and store_leaderboard_ranking(window_key, ranking, computed)
+
+    top = ranking[:LEADERBOARD_SIZE]
+    users = User.objects.in_bulk([user_id for user_id, _ in top])
+    top_users = [
+        _ranked(users[user_id], rank, karma)
+        for rank, (user_id, karma) in enumerate(top, start=1)
+        if user_id in users
+    ]
+    now = timezone.now()
+    return {
+        'leaderboard': LeaderboardUserSerializer(top_users, many=True).data,
+        'period': label,
+        'window': window_key,
+        'ranked_users': len(ranking),
+        'updated_at': now.isoformat(),
+        'computed_at': now.timestamp(),
+        'karma_version': karma_version,
+        # Whether LeaderboardEntry holds this snapshot's full ranking
+        'ranking_stored': stored,
+    }
+
+
+def get_leaderboard_page(window_key, offset, limit, stored=True):
+    """
+    Users ranked ``offset + 1`` to ``offset + limit``, via the (window,
+    rank) index, or from the live ranking when it isn't ``stored``
+    """
+    if not stored:
+        window, _ = KARMA_WINDOWS[window_key]
+        page = get_karma_ranking(window)[offset:offset + limit]
+        users = User.objects.in_bulk([user_id for user_id, _ in page])
+        return [
+            _ranked(users[user_id], rank, karma)
+            for rank, (user_id, karma) in enumerate(page, start=offset + 1)
+            if user_id in users
+        ]
+    entries = LeaderboardEntry.objects.filter(
+        window=window_key, rank__gt=offset, rank__lte=offset + limit
+    ).select_related('user').order_by('rank')
+    return [_ranked(entry.user, entry.rank, entry.karma) for entry in entries]
+
+
+def get_user_rank(window_key, user_id, stored=True):
+    """
+    ``(rank, karma)`` for one user via the (window, user) index, or from
+    the live ranking when it isn't ``stored``; ``(None, 0)`` if unranked
+    """
+    if not stored:
+        window, _ = KARMA_WINDOWS[window_key]
+        for rank, (ranked_id, karma) in enumerate(get_karma_ranking(window), start=1):
+            if ranked_id == user_id:
+                return rank, karma
+        return None, 0
+    entry = LeaderboardEntry.objects.filter(
+        window=window_key, user_id=user_id
+    ).values_list('rank', 'karma').first()
+    return entry or (None, 0)
+
+
+def is_stale(snapshot, max_age=None):
+    if max_age is None:
+        max_age = _setting('LEADERBOARD_SNAPSHOT_MAX_AGE', 30)
+    return time.time() - snapshot['computed_at'] > max_age
+
+
+def refresh_leaderboard_snapshot(window_key, wait=True, store=False):
+    """
+    Recompute and cache the snapshot unless another caller already is
+    ``store`` also writes the full ranking (background refreshes only).
+    Returns the fresh snapshot; if someone else holds the refresh lock,
+    waits for their result when ``wait`` is set, else returns None
+    """
+    cache = get_snapshot_cache()
+    lock_key = f'{snapshot_key(window_key)}:lock'
+    lock_timeout = _setting('LEADERBOARD_REFRESH_LOCK_TIMEOUT', 30)
+
+    # cache.add is atomic, so exactly one caller wins the lock
+    if cache.add(lock_key, uuid.uuid4().hex, timeout=lock_timeout):
+        try:
+            snapshot = compute_leaderboard_snapshot(window_key, store=store)
+            cache.set(snapshot_key(window_key), snapshot, timeout=None)
+            return snapshot
+        finally:
+            cache.delete(lock_key)
+
+    if not wait:
+        return None
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        snapshot = cache.get(snapshot_key(window_key))
+        if snapshot is not None:
+            return snapshot
+    # The leader died without publishing; compute for this caller only
+    return compute_leaderboard_snapshot(window_key)
+
+
+def get_leaderboard_snapshot(window_key):
+    """
+    Current snapshot for a window, in O(1) when fresh
+    A stale snapshot triggers a single-flight refresh; callers that lose
+    the race keep serving the stale copy rather than piling on
+    """
+    snapshot = get_snapshot_cache().get(snapshot_key(window_key))
+    if snapshot is not None and not is_stale(snapshot):
+        return snapshot
+
+    refreshed = refresh_leaderboard_snapshot(window_key, wait=snapshot is None)
+    return refreshed or snapshot
+
+
+def refresh_due_snapshots(force=False):
+    """
+    Refresh every window whose snapshot is missing, outdated by new karma
+    writes, or older than the max age, storing the full ranking too.
+    Returns the refreshed window keys. For background refreshers only.
+    """
+    cache = get_snapshot_cache()
+    karma_version = _karma_version()
+    refreshed = []
+    for window_key in KARMA_WINDOWS:
+        snapshot = cache.get(snapshot_key(window_key))
+        due = (
+            force
+            or snapshot is None
+            or snapshot['karma_version'] != karma_version
+            or is_stale(snapshot)
+        )
+        if due and refresh_leaderboard_snapshot(window_key, wait=False, store=True) is not None:
+            refreshed.append(window_key)
+    return refreshed
+
+
+class LeaderboardRefresher(threading.Thread):
+    """
+    In-process scheduler that keeps snapshots warm
+    Checking every ``interval`` seconds also debounces bursts of likes into
+    at most one recomputation per interval
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='leaderboard-refresher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                refresh_due_snapshots()
+            except Exception:
+                logger.exception('Leaderboard snapshot refresh failed')
+            finally:
+                # Don't hold a DB connection between ticks
+                from django.db import connection
+                connection.close()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_leaderboard_refresher(interval=None):
+    """Start the in-process refresher once per process"""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = LeaderboardRefresher(
+                interval or _setting('LEADERBOARD_REFRESH_INTERVAL', 15)
+            )
+            _refresher.start()
+        return _refresher
@@ -0,0 +1,251 @@
+"""
+Write-behind buffer for likes (opt-in via LIKE_WRITE_BEHIND)
+
+Like/unlike intents are answered immediately from one indexed read and
+queued in process memory; a flusher thread writes them every
+LIKE_BUFFER_FLUSH_INTERVAL_MS as one bulk insert, one bulk delete and one
+aggregated counter UPDATE per model. A burst of likes on a hot post thus
+costs a single counter write per flush instead of one per click.
+
+Duplicate semantics hold against both the database and this process's
+buffer: a second like by the same user is rejected before it is queued,
+and a like/unlike pair inside one interval cancels out. Each worker
+process has its own buffer, so the same like can still be accepted by two
+processes (or race the batch endpoint); the flush then writes only the
+rows that don't exist yet and moves counters and karma by those alone.
+
+Reads overlay pending (and in-flight) intents so counts never appear to
+go backwards while a flush is outstanding, nor to double once it commits. Intents still in memory are
+lost if the process is killed hard; an orderly shutdown flushes them.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .utils import fetch_existing_likes, like_model, resolve_like_targets, write_like_changes
+
+logger = logging.getLogger(__name__)
+
+
+def buffering_enabled():
+    return getattr(settings, 'LIKE_WRITE_BEHIND', False)
+
+
+def write_like_intents(intents):
+    """
+    Persist ``{(user_id, kind, id): liked}`` desired states in one batch
+    Keys already in the desired state, or whose object is gone, are skipped
+    """
+    targets = resolve_like_targets(key[1:] for key in intents)
+    with transaction.atomic():
+        existing = fetch_existing_likes(key for key in intents if key[1:] in targets)
+        added = {
+            key for key, liked in intents.items()
+            if liked and key[1:] in targets and key not in existing
+        }
+        removed = {
+            key: existing[key] for key, liked in intents.items()
+            if not liked and key in existing
+        }
+        return write_like_changes(added, removed, targets)
+
+
+class LikeBuffer:
+    """
+    Thread-safe map of pending ``(user_id, kind, id) -> (liked, was_liked)``
+    ``was_liked`` is the state the intent was made against, so each entry
+    knows the counter delta it will produce when flushed
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._deltas = defaultdict(int)
+        self._flushing_deltas = defaultdict(int)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending) + len(self._flushing)
+
+    def state(self, key):
+        """Buffered liked state for a key, or None if nothing is buffered"""
+        with self._lock:
+            entry = self._pending.get(key) or self._flushing.get(key)
+            return entry[0] if entry else None
+
+    def count_delta(self, kind, object_id):
+        """Net like_count change still waiting to reach the database"""
+        with self._lock:
+            return (
+                self._deltas.get((kind, object_id), 0)
+                + self._flushing_deltas.get((kind, object_id), 0)
+            )
+
+    def record(self, key, liked, db_liked):
+        """
+        Queue ``liked`` for ``key`` given its database state ``db_liked``
+        Returns False, queueing nothing, if it duplicates the current state
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            in_flight = self._flushing.get(key)
+            if pending is not None:
+                current, was = pending
+            elif in_flight is not None:
+                current = was = in_flight[0]
+            else:
+                current = was = db_liked
+            if liked == current:
+                return False
+
+            object_key = key[1:]
+            if pending is not None:
+                self._deltas[object_key] -= int(pending[0]) - int(pending[1])
+            if liked == was:
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = (liked, was)
+                self._deltas[object_key] += int(liked) - int(was)
+            return True
+
+    def flush(self):
+        """
+        Write everything pending; returns the number of likes changed
+        In-flight deltas stop being counted as soon as the write commits,
+        so readers never add them to counters that already include them.
+        Inside a caller's transaction they are dropped when flush returns.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                self._flushing_deltas, self._deltas = self._deltas, defaultdict(int)
+                flushing = self._flushing
+            try:
+                with transaction.atomic():
+                    # Registered first so it runs before any other commit hook
+                    transaction.on_commit(lambda: self._settle(flushing))
+                    changed = write_like_intents(
+                        {key: liked for key, (liked, _) in flushing.items()}
+                    )
+                return changed
+            except Exception:
+                self._requeue()
+                raise
+            finally:
+                self._settle(flushing)
+
+    def _settle(self, flushing):
+        """Forget the in-flight intents of the flush that took ``flushing``"""
+        with self._lock:
+            if self._flushing is flushing:
+                self._flushing = {}
+                self._flushing_deltas = defaultdict(int)
+
+    def _requeue(self):
+        """Put a failed flush back underneath anything queued since"""
+        with self._lock:
+            for key, (liked, was) in self._flushing.items():
+                newer = self._pending.get(key)
+                if newer is None:
+                    self._pending[key] = (liked, was)
+                    self._deltas[key[1:]] += int(liked) - int(was)
+                    continue
+                # The newer intent was made against the failed one's outcome
+                self._deltas[key[1:]] -= int(newer[0]) - int(newer[1])
+                if newer[0] == was:
+                    del self._pending[key]
+                else:
+                    self._pending[key] = (newer[0], was)
+                    self._deltas[key[1:]] += int(newer[0]) - int(was)
+
+
+like_buffer = LikeBuffer()
+
+
+def buffer_like(user_id, model, object_id, liked):
+    """
+    Queue a like (``liked=True``) or unlike for ``user_id``
+    Returns ``(accepted, like_count)`` where like_count includes everything
+    buffered; raises ``model.DoesNotExist``. Costs one indexed read.
+    """
+    kind = model._meta.model_name
+    row = model.objects.filter(pk=object_id).annotate(
+        liked=Exists(like_model(model).objects.filter(
+            user_id=user_id, **{kind: OuterRef('pk')}
+        ))
+    ).values_list('like_count', 'liked').first()
+    if row is None:
+        raise model.DoesNotExist
+    like_count, db_liked = row
+
+    accepted = like_buffer.record((user_id, kind, object_id), liked, db_liked)
+    return accepted, like_count + like_buffer.count_delta(kind, object_id)
+
+
+def overlay_pending_likes(nodes, kind, viewer_id=None):
+    """
+    Fold buffered likes into serialized posts or comments in place
+    Walks nested ``comments``, ``comment_preview`` and ``replies``
+    """
+    if not len(like_buffer):
+        return nodes
+    stack = [(kind, node) for node in nodes]
+    while stack:
+        node_kind, node = stack.pop()
+        if 'id' in node:
+            if 'like_count' in node:
+                node['like_count'] += like_buffer.count_delta(node_kind, node['id'])
+            if 'is_liked' in node and viewer_id is not None:
+                state = like_buffer.state((viewer_id, node_kind, node['id']))
+                if state is not None:
+                    node['is_liked'] = state
+        for field in ('comments', 'comment_preview', 'replies'):
+            stack.extend(('comment', child) for child in node.get(field) or ())
+    return nodes
+
+
+class LikeBufferFlusher(threading.Thread):
+    """Flushes the buffer every ``interval`` seconds"""
+
+    def __init__(self, interval):
+        super().__init__(name='like-buffer-flusher', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                like_buffer.flush()
+            except Exception:
+                logger.exception('Like buffer flush failed; intents requeued')
+            finally:
+                from django.db import connection
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_like_buffer_flusher(interval_ms=None):
+    """Start the flusher once per process, and flush on orderly exit"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            interval_ms = interval_ms or getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL_MS', 50)
+            _flusher = LikeBufferFlusher(interval_ms / 1000)
+            _flusher.start()
+            atexit.register(like_buffer.flush)
+        return _flusher
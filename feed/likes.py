@@ -0,0 +1,281 @@
+"""
+Single-round-trip like/unlike writes
+
+On PostgreSQL and SQLite 3.35+ a like is one ``INSERT ... ON CONFLICT DO
+NOTHING RETURNING``, the counter moves in an ``UPDATE ... RETURNING`` that
+also yields the author, and the karma bucket is a single upsert. Nothing is
+read before the write, and a duplicate click is a no-op instead of an
+IntegrityError. Other backends take the equivalent ORM path.
+"""
+from datetime import timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, KarmaBucket, Post, User
+from .utils import (
+    LIKE_TABLES,
+    fast_path_available,
+    like_karma_points,
+    like_model,
+    record_like_change,
+    truncate_to_hour,
+    withdraw_like_counts,
+    withdraw_like_karma
+)
+
+DEMO_USER_CACHE_KEY = 'demo-user-id'
+
+
+def get_demo_user_id():
+    """Id of the shared anonymous user, resolved once and then cached"""
+    user_id = cache.get(DEMO_USER_CACHE_KEY)
+    if user_id is None:
+        user, _ = User.objects.get_or_create(
+            username='demo_user',
+            defaults={'email': 'demo@example.com'}
+        )
+        user_id = user.id
+        cache.set(DEMO_USER_CACHE_KEY, user_id, timeout=None)
+    return user_id
+
+
+@receiver(post_delete, sender=User)
+def forget_demo_user(sender, instance, **kwargs):
+    if instance.username == 'demo_user':
+        cache.delete(DEMO_USER_CACHE_KEY)
+
+
+def _deleted_users(origin):
+    """Ids (or a subquery of them) of the users a delete() started from, else None"""
+    if isinstance(origin, User):
+        return [origin.pk]
+    if isinstance(origin, QuerySet) and issubclass(origin.model, User):
+        return origin.values('pk')
+    return None
+
+
+def _deletes_posts(origin):
+    """Whether a delete() started from a post or a queryset of posts"""
+    return isinstance(origin, Post) or (
+        isinstance(origin, QuerySet) and issubclass(origin.model, Post)
+    )
+
+
+@receiver(pre_delete, sender=Post)
+@receiver(pre_delete, sender=Comment)
+def withdraw_karma_for_deleted_content(sender, instance, origin=None, **kwargs):
+    """
+    Deleting a post or comment cascades to its likes; take their karma
+    back out of the author's hourly buckets so windowed totals match the
+    likes that remain. A deleted post takes back every comment like under
+    it in one grouped pass, so its cascaded comments skip their own.
+    """
+    if sender is Comment and _deletes_posts(origin):
+        return
+    likes = instance.likes.all()
+    deleted_users = _deleted_users(origin)
+    if deleted_users is not None:
+        # The deleted users' own handler withdraws their likes
+        likes = likes.exclude(user_id__in=deleted_users)
+    withdraw_like_karma(sender._meta.model_name, likes)
+    if sender is Post and _deletes_posts(origin):
+        withdraw_like_karma('comment', LIKE_TABLES['comment'].objects.filter(comment__post=instance))
+
+
+@receiver(pre_delete, sender=User)
+def withdraw_likes_of_deleted_liker(sender, instance, **kwargs):
+    """
+    Deleting a user cascades to every like they gave; take them back out
+    of the liked objects' counters and their authors' karma, and move the
+    touched posts to new cache versions
+    """
+    touched_posts = set()
+    for kind, like_table in LIKE_TABLES.items():
+        likes = like_table.objects.filter(user=instance)
+        withdraw_like_karma(kind, likes)
+        touched_posts |= withdraw_like_counts(kind, likes)
+    if touched_posts:
+        Post.bump_versions(touched_posts)
+
+
+def get_actor_id(request):
+    """Id of the user a like is recorded for; anonymous requests act as the demo user"""
+    if request.user.is_authenticated:
+        return request.user.id
+    return get_demo_user_id()
+
+
+def _db_datetime(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def _from_db_datetime(value):
+    """SQLite hands RETURNING timestamps back as naive UTC strings"""
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def _shift_counter(cursor, model, object_id, delta, now):
+    """
+    Move the object's like_count by ``delta`` and its post to a new cache
+    version. Returns ``(like_count, author_id)``, or None if it doesn't exist.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    if model is Post:
+        cursor.execute(
+            f"""
+            UPDATE {table}
+            SET like_count = like_count + %s, version = version + 1, last_activity_at = %s
+            WHERE id = %s
+            RETURNING like_count, author_id
+            """,
+            [delta, _db_datetime(now), object_id]
+        )
+        return cursor.fetchone()
+
+    cursor.execute(
+        f"""
+        UPDATE {table} SET like_count = like_count + %s
+        WHERE id = %s
+        RETURNING like_count, author_id, post_id
+        """,
+        [delta, object_id]
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    like_count, author_id, post_id = row
+    Post.bump_version(post_id)
+    return like_count, author_id
+
+
+def _upsert_karma_bucket(cursor, user_id, created_at, points, now):
+    table = connection.ops.quote_name(KarmaBucket._meta.db_table)
+    cursor.execute(
+        f"""
+        INSERT INTO {table} (user_id, bucket_start, karma, updated_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (user_id, bucket_start)
+        DO UPDATE SET karma = {table}.karma + excluded.karma, updated_at = excluded.updated_at
+        """,
+        [user_id, _db_datetime(truncate_to_hour(created_at)), points, _db_datetime(now)]
+    )
+
+
+def _current_like_count(model, object_id):
+    like_count = model.objects.filter(pk=object_id).values_list(
+        'like_count', flat=True
+    ).first()
+    if like_count is None:
+        raise model.DoesNotExist
+    return like_count
+
+
+def add_like(user_id, model, object_id):
+    """
+    Like a Post or Comment as ``user_id``
+    Returns ``(created, like_count)``; raises ``model.DoesNotExist``
+    """
+    if not fast_path_available():
+        return add_like_orm(user_id, model, object_id)
+
+    like_table = connection.ops.quote_name(like_model(model)._meta.db_table)
+    target = f'{model._meta.model_name}_id'
+    now = timezone.now()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {like_table} (user_id, {target}, created_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (user_id, {target}) DO NOTHING
+                RETURNING id
+                """,
+                [user_id, object_id, _db_datetime(now)]
+            )
+            if cursor.fetchone() is None:
+                return False, _current_like_count(model, object_id)
+
+            row = _shift_counter(cursor, model, object_id, 1, now)
+            if row is None:
+                # Raising rolls back the like we just inserted (its foreign
+                # key is only checked at commit)
+                raise model.DoesNotExist
+            like_count, author_id = row
+            _upsert_karma_bucket(cursor, author_id, now, like_karma_points(model), now)
+    return True, like_count
+
+
+def remove_like(user_id, model, object_id):
+    """
+    Remove ``user_id``'s like from a Post or Comment
+    Returns ``(removed, like_count)``; raises ``model.DoesNotExist``
+    """
+    if not fast_path_available():
+        return remove_like_orm(user_id, model, object_id)
+
+    like_table = connection.ops.quote_name(like_model(model)._meta.db_table)
+    target = f'{model._meta.model_name}_id'
+    now = timezone.now()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE FROM {like_table}
+                WHERE user_id = %s AND {target} = %s
+                RETURNING created_at
+                """,
+                [user_id, object_id]
+            )
+            deleted = cursor.fetchone()
+            if deleted is None:
+                return False, _current_like_count(model, object_id)
+
+            row = _shift_counter(cursor, model, object_id, -1, now)
+            if row is None:
+                raise model.DoesNotExist
+            like_count, author_id = row
+            _upsert_karma_bucket(
+                cursor, author_id, _from_db_datetime(deleted[0]),
+                -like_karma_points(model), now
+            )
+    return True, like_count
+
+
+def add_like_orm(user_id, model, object_id):
+    obj = model.objects.get(pk=object_id)
+    try:
+        with transaction.atomic():
+            like, created = like_model(model).objects.get_or_create(
+                user_id=user_id, **{model._meta.model_name: obj}
+            )
+            if created:
+                record_like_change(obj, like, 1)
+    except IntegrityError:
+        # A concurrent click inserted the same like first
+        created = False
+    obj.refresh_from_db(fields=['like_count'])
+    return created, obj.like_count
+
+
+def remove_like_orm(user_id, model, object_id):
+    obj = model.objects.get(pk=object_id)
+    with transaction.atomic():
+        like = like_model(model).objects.filter(
+            user_id=user_id, **{model._meta.model_name: obj}
+        ).first()
+        if like is not None:
+            like.delete()
+            record_like_change(obj, like, -1)
+    obj.refresh_from_db(fields=['like_count'])
+    return like is not None, obj.like_count
@@ -0,0 +1,65 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from feed.models import Post, Comment, KarmaBucket
+from feed.utils import like_karma_points, like_model, truncate_to_hour
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the hourly KarmaBucket rollup from raw PostLike/CommentLike rows
+    Likes are grouped per (author, hour) in the database, so the work is
+    proportional to the number of buckets rather than the number of likes
+    """
+    help = 'Rebuild hourly karma buckets from the like tables'
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only rebuild buckets for the last N days (default: all history)',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days'] is not None:
+            since = truncate_to_hour(timezone.now() - timedelta(days=options['days']))
+
+        totals = defaultdict(int)
+        for model in (Post, Comment):
+            likes = like_model(model).objects.all()
+            if since is not None:
+                likes = likes.filter(created_at__gte=since)
+
+            rows = likes.annotate(
+                author=F(f'{model._meta.model_name}__author_id'),
+                bucket_start=TruncHour('created_at')
+            ).values('author', 'bucket_start').annotate(
+                total=Count('id')
+            ).order_by()
+
+            points = like_karma_points(model)
+            for row in rows.iterator():
+                totals[(row['author'], row['bucket_start'])] += row['total'] * points
+
+        buckets = [
+            KarmaBucket(user_id=user_id, bucket_start=bucket_start, karma=karma)
+            for (user_id, bucket_start), karma in totals.items()
+        ]
+
+        with transaction.atomic():
+            stale = KarmaBucket.objects.all()
+            if since is not None:
+                stale = stale.filter(bucket_start__gte=since)
+            stale.delete()
+            KarmaBucket.objects.bulk_create(buckets, batch_size=self.batch_size)
+
+        self.stdout.write(f"Rebuilt {len(buckets)} karma bucket(s)")
@@ -0,0 +1,234 @@
+import json
+import subprocess
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from feed.benchmark import (
+    DEFAULT_THRESHOLD,
+    HttpDriver,
+    InProcessDriver,
+    compare_reports,
+    peak_rss_mb,
+    process_peak_rss_mb,
+    run_endpoint,
+    scraped_query_total,
+    summarize
+)
+from feed.likes import get_demo_user_id
+from feed.models import Comment, CommentLike, KarmaBucket, Post, PostLike
+
+HOT_POST_MAX_COMMENTS = 500
+
+
+def get(path):
+    return lambda driver, i: [driver.request('GET', path)]
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the REST API endpoints against the current database
+    Drives requests in-process through Django's test client (default) or
+    against a running server with ``--base-url``, at ``--concurrency``
+    threads, and records throughput, latency percentiles, queries per
+    request and peak RSS per endpoint. ``--output`` saves the report as
+    JSON; ``--compare`` checks it against an earlier report and fails on
+    regressions. Seed data first with ``generate_feed_data``.
+    """
+    help = 'Benchmark the feed API and compare against earlier runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url',
+                            help='Benchmark a running server (e.g. http://127.0.0.1:8000) '
+                                 'instead of in-process')
+        parser.add_argument('--server-pid', type=int,
+                            help='With --base-url, report this process\'s peak RSS (Linux)')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Samples per endpoint')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Unmeasured samples per endpoint')
+        parser.add_argument('--endpoints',
+                            help='Comma-separated subset of endpoint names')
+        parser.add_argument('--output', help='Write the JSON report here')
+        parser.add_argument('--compare', nargs='+', metavar='REPORT',
+                            help='Baseline report to compare this run against, or two '
+                                 'reports (baseline, current) to compare without running')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Relative change that counts as a regression')
+
+    def handle(self, *args, **options):
+        compare = options['compare'] or []
+        if len(compare) > 2:
+            raise CommandError('--compare takes a baseline report and optionally a current one')
+        if len(compare) == 2:
+            baseline, report = (self.load(path) for path in compare)
+        else:
+            baseline = self.load(compare[0]) if compare else None
+            report = self.benchmark(options)
+            if options['output']:
+                with open(options['output'], 'w') as output:
+                    json.dump(report, output, indent=2)
+                self.stdout.write(f"Report written to {options['output']}")
+
+        if baseline is not None:
+            self.compare(baseline, report, options['threshold'])
+
+    def load(self, path):
+        try:
+            with open(path) as report:
+                return json.load(report)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read report {path}: {exc}')
+
+    def endpoints(self):
+        """name -> sample; ids are picked from the data so every run hits the same rows"""
+        # The busiest post with a thread a reader would open; skewed data
+        # sets put tens of thousands of comments on the very top post
+        hot_post = Post.objects.annotate(comments_total=Count('comments')).filter(
+            comments_total__lte=HOT_POST_MAX_COMMENTS
+        ).order_by('-comments_total', 'id').first()
+        if hot_post is None:
+            raise CommandError('No posts to benchmark; run generate_feed_data first')
+        branch = Comment.objects.filter(parent__isnull=False).values('parent').annotate(
+            replies_total=Count('id')
+        ).order_by('-replies_total', 'parent').first()
+        author = KarmaBucket.objects.order_by('user_id').values_list('user_id', flat=True).first()
+        like_targets = list(Post.objects.order_by('-id').values_list('id', flat=True)[:1000])
+
+        def like_unlike(driver, i):
+            # Consecutive samples use different posts so concurrent workers don't collide
+            post_id = like_targets[i % len(like_targets)]
+            return [
+                driver.request('POST', f'/api/posts/{post_id}/like/'),
+                driver.request('DELETE', f'/api/posts/{post_id}/unlike/'),
+            ]
+
+        endpoints = {
+            'feed': get('/api/posts/'),
+            'feed_cursor': get('/api/posts/?pagination=cursor'),
+            'feed_expanded': get('/api/posts/?expand=comments'),
+            'post_detail': get(f'/api/posts/{hot_post.id}/'),
+            'post_comments': get(f'/api/posts/{hot_post.id}/comments/'),
+            'leaderboard': get('/api/leaderboard/'),
+            'leaderboard_page': get('/api/leaderboard/?offset=100&limit=50'),
+            'like_unlike': like_unlike,
+        }
+        if branch is not None:
+            endpoints['comment_replies'] = get(f"/api/comments/{branch['parent']}/replies/")
+        if author is not None:
+            endpoints['leaderboard_rank'] = get(f'/api/leaderboard/rank/{author}/')
+        return endpoints
+
+    def benchmark(self, options):
+        base_url = options['base_url']
+        if base_url is None and 'testserver' not in settings.ALLOWED_HOSTS:
+            # The test client always sends Host: testserver
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        # Anonymous requests act as the demo user; create it up front so the
+        # first like doesn't change what the read endpoints query mid-run
+        get_demo_user_id()
+        endpoints = self.endpoints()
+        if options['endpoints']:
+            wanted = options['endpoints'].split(',')
+            unknown = set(wanted) - set(endpoints)
+            if unknown:
+                raise CommandError(
+                    f"Unknown endpoint(s): {', '.join(sorted(unknown))}; "
+                    f"choose from {', '.join(endpoints)}"
+                )
+            endpoints = {name: endpoints[name] for name in wanted}
+
+        results = {}
+        for name, sample in endpoints.items():
+            if options['warmup']:
+                warmup = HttpDriver(base_url) if base_url else InProcessDriver()
+                run_endpoint(warmup, sample, options['warmup'], options['concurrency'])
+            driver = HttpDriver(base_url) if base_url else InProcessDriver()
+            before = self.scrape_queries(driver) if base_url else None
+
+            latencies, failures, elapsed = run_endpoint(
+                driver, sample, options['requests'], options['concurrency']
+            )
+            result = summarize(latencies, failures, elapsed)
+            if base_url:
+                after = self.scrape_queries(driver)
+                result['queries_per_request'] = (
+                    round((after - before) / len(latencies), 2)
+                    if before is not None and after is not None else None
+                )
+                result['peak_rss_mb'] = (
+                    process_peak_rss_mb(options['server_pid']) if options['server_pid'] else None
+                )
+            else:
+                result['queries_per_request'] = round(driver.queries.count / len(latencies), 2)
+                result['peak_rss_mb'] = peak_rss_mb()
+            results[name] = result
+            self.report(name, result)
+
+        return {
+            'meta': {
+                'created_at': datetime.now(dt_timezone.utc).isoformat(),
+                'commit': self.git_commit(),
+                'mode': 'http' if base_url else 'in-process',
+                'base_url': base_url,
+                'database': connection.vendor,
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'rows': {
+                    'posts': Post.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'likes': PostLike.objects.count() + CommentLike.objects.count(),
+                },
+            },
+            'endpoints': results,
+        }
+
+    def scrape_queries(self, driver):
+        """
+        Total queries the server has recorded, from /api/_metrics, or None
+        Exact only when one server process handles every request
+        """
+        try:
+            status, body = driver.fetch('GET', '/api/_metrics')
+        except OSError:
+            return None
+        finally:
+            driver.close()
+        return scraped_query_total(body.decode()) if status == 200 else None
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, name, result):
+        queries = result['queries_per_request']
+        rss = result['peak_rss_mb']
+        self.stdout.write(
+            f"{name:>17}: {result['throughput_rps']:8.1f} req/s "
+            f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+            f"p99={result['p99_ms']:.1f}ms "
+            f"queries={'-' if queries is None else queries} "
+            f"rss={'-' if rss is None else f'{rss}MB'} errors={result['errors']}"
+        )
+
+    def compare(self, baseline, report, threshold):
+        rows = compare_reports(baseline, report, threshold)
+        regressions = [row for row in rows if row[5]]
+        for endpoint, metric, before, after, change, regressed in rows:
+            flag = 'REGRESSION' if regressed else ''
+            self.stdout.write(
+                f'{endpoint:>17} {metric:>19}: {before:>10} -> {after:<10} '
+                f'{change:+7.1%} {flag}'
+            )
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) beyond {threshold:.0%}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
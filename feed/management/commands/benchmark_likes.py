@@ -0,0 +1,88 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from feed import likes
+from feed.benchmark import percentile
+from feed.models import Post, User
+
+
+class Command(BaseCommand):
+    """
+    Hammer one hot post with concurrent like/unlike calls
+    Compares the single-round-trip path against the ORM path on the
+    configured database; the benchmark post and users are removed afterwards
+    """
+    help = 'Benchmark like/unlike latency under contention on one post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='like+unlike pairs per thread')
+        parser.add_argument('--path', choices=['fast', 'orm', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        paths = ['fast', 'orm'] if options['path'] == 'both' else [options['path']]
+        if 'fast' in paths and not likes.fast_path_available():
+            self.stderr.write(f'{connection.vendor} has no RETURNING support; skipping fast path')
+            paths.remove('fast')
+
+        author = User.objects.create(username='bench_author')
+        likers = User.objects.bulk_create([
+            User(username=f'bench_liker_{i}') for i in range(options['threads'])
+        ])
+        post = Post.objects.create(author=author, content='benchmark')
+        try:
+            for path in paths:
+                self.report(path, *self.run(path, post, likers, options['iterations']))
+        finally:
+            post.delete()
+            User.objects.filter(pk__in=[author.pk, *(u.pk for u in likers)]).delete()
+
+    def run(self, path, post, likers, iterations):
+        add, remove = (
+            (likes.add_like, likes.remove_like) if path == 'fast'
+            else (likes.add_like_orm, likes.remove_like_orm)
+        )
+        latencies, errors = [], []
+        lock = threading.Lock()
+        start = threading.Barrier(len(likers))
+
+        def worker(user_id):
+            samples, failures = [], []
+            start.wait()
+            try:
+                for _ in range(iterations):
+                    for operation in (add, remove):
+                        began = time.perf_counter()
+                        try:
+                            operation(user_id, Post, post.id)
+                        except Exception as exc:
+                            failures.append(type(exc).__name__)
+                        samples.append(time.perf_counter() - began)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(samples)
+                errors.extend(failures)
+
+        threads = [threading.Thread(target=worker, args=(u.id,)) for u in likers]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, time.perf_counter() - began
+
+    def report(self, path, latencies, errors, elapsed):
+        ms = [sample * 1000 for sample in latencies]
+        self.stdout.write(
+            f'{path:>4}: {len(ms)} ops in {elapsed:.2f}s ({len(ms) / elapsed:.0f} ops/s) '
+            f'p50={statistics.median(ms):.2f}ms p95={percentile(ms, 0.95):.2f}ms '
+            f'p99={percentile(ms, 0.99):.2f}ms errors={len(errors)}'
+        )
+        for name in sorted(set(errors)):
+            self.stdout.write(f'      {name}: {errors.count(name)}')
@@ -0,0 +1,82 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from feed.benchmark import percentile
+from feed.models import Post
+
+
+class Command(BaseCommand):
+    """
+    Compare the WSGI (DRF) and ASGI (async) read endpoints in-process
+    Both sides get the same concurrency: N threads through the WSGI handler
+    versus N in-flight requests on one event loop through the ASGI handler.
+    Network and server overhead are excluded; for end-to-end numbers run
+    gunicorn and uvicorn with equal worker counts under a load generator.
+    """
+    help = 'Benchmark WSGI vs ASGI read endpoints at equal concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per endpoint and mode')
+
+    def handle(self, *args, **options):
+        # The test clients always send Host: testserver, as under manage.py test
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        post = Post.objects.order_by('-created_at').first()
+        if post is None:
+            raise CommandError('No posts to read; run create_sample_data.py first')
+
+        endpoints = {
+            'feed': ('/api/posts/', '/api/async/posts/'),
+            'detail': (f'/api/posts/{post.id}/', f'/api/async/posts/{post.id}/'),
+            'leaderboard': ('/api/leaderboard/', '/api/async/leaderboard/'),
+        }
+        for name, (wsgi_path, asgi_path) in endpoints.items():
+            self.report(name, 'wsgi', *self.run_wsgi(wsgi_path, options))
+            self.report(name, 'asgi', *self.run_asgi(asgi_path, options))
+
+    def run_wsgi(self, path, options):
+        def fetch(_):
+            client = Client()
+            began = time.perf_counter()
+            status = client.get(path).status_code
+            return time.perf_counter() - began, status
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        return results, time.perf_counter() - began
+
+    def run_asgi(self, path, options):
+        async def run():
+            client = AsyncClient()
+            slots = asyncio.Semaphore(options['concurrency'])
+
+            async def fetch():
+                async with slots:
+                    began = time.perf_counter()
+                    response = await client.get(path)
+                    return time.perf_counter() - began, response.status_code
+
+            began = time.perf_counter()
+            results = await asyncio.gather(*(fetch() for _ in range(options['requests'])))
+            return results, time.perf_counter() - began
+
+        return async_to_sync(run)()
+
+    def report(self, endpoint, mode, results, elapsed):
+        ms = [latency * 1000 for latency, _ in results]
+        failures = sum(1 for _, status in results if status >= 400)
+        self.stdout.write(
+            f'{endpoint:>11} {mode}: {len(ms) / elapsed:7.1f} req/s '
+            f'p50={statistics.median(ms):.1f}ms p99={percentile(ms, 0.99):.1f}ms '
+            f'errors={failures}'
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from feed.query_plans import HOT_QUERIES, check_query_plans
+
+
+class Command(BaseCommand):
+    """
+    EXPLAIN every hot query path and fail if any plan reads a whole table
+    Probes run against existing rows (writes are rolled back), so seed the
+    database first; a probe without rows to use is reported as skipped.
+    Supported on SQLite and PostgreSQL.
+    """
+    help = 'Fail if a hot query falls back to a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries',
+                            help=f"Comma-separated subset of: {', '.join(HOT_QUERIES)}")
+        parser.add_argument('--show-plans', action='store_true',
+                            help='Print every statement with its plan')
+
+    def handle(self, *args, **options):
+        names = options['queries'].split(',') if options['queries'] else None
+        unknown = set(names or ()) - set(HOT_QUERIES)
+        if unknown:
+            raise CommandError(f"Unknown hot query(s): {', '.join(sorted(unknown))}")
+
+        try:
+            results, skipped = check_query_plans(names)
+        except NotImplementedError as exc:
+            raise CommandError(str(exc))
+
+        failures = 0
+        for name, sql, steps, unexpected in results:
+            if unexpected or options['show_plans']:
+                status = f"full scan of {', '.join(unexpected)}" if unexpected else 'ok'
+                self.stdout.write(f'{name}: {status}\n  {sql}')
+                for step in steps:
+                    self.stdout.write(f'    {step}')
+            failures += bool(unexpected)
+        for name, reason in skipped:
+            self.stdout.write(self.style.WARNING(f'{name}: skipped ({reason})'))
+
+        if failures:
+            raise CommandError(f'{failures} statement(s) fall back to a full table scan')
+        checked = len({name for name, *_ in results})
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(results)} statement(s) from {checked} hot query path(s) use indexes'
+        ))
@@ -0,0 +1,328 @@
+import random
+import time
+from bisect import bisect
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from feed.leaderboard import refresh_due_snapshots
+from feed.models import Comment, CommentLike, KarmaBucket, Post, PostLike, User
+from feed.utils import like_karma_points, truncate_to_hour
+
+WORDS = (
+    'community feed thread reply karma post comment idea build ship '
+    'launch design review question answer today shipping tested great '
+    'agree point detail perspective learned working project team'
+).split()
+
+
+def power_law(n, exponent, rng):
+    """Cumulative Zipf weights over ``n`` items, shuffled so rank isn't id order"""
+    weights = [1 / rank ** exponent for rank in range(1, n + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def pick(cumulative, rng):
+    return bisect(cumulative, rng.random() * cumulative[-1])
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep generated created_at/updated_at values"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    """
+    Generate a large, realistic feed for load testing and benchmarks
+    The whole dataset is planned in memory from ``--seed``: comments per
+    post, like targets and author activity follow power laws, and reply
+    threads go up to ``--max-depth`` deep. Posts and comments are written
+    with chunked bulk_create, comment threads one depth level at a time so
+    each level's paths derive from the ids of the level above; likes and
+    karma buckets, whose ids nothing needs, go through executemany. Like
+    counters, last_activity_at and the hourly karma buckets are computed up
+    front, so the data is consistent without a reconcile or backfill pass.
+    Timestamps are relative to the current time; everything else is fixed
+    by the seed.
+    """
+    help = 'Bulk-generate users, posts, threaded comments and likes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=20000,
+                            help='Total comments, spread over posts by a power law')
+        parser.add_argument('--comment-skew', type=float, default=1.1,
+                            help='Power-law exponent for comments per post')
+        parser.add_argument('--max-depth', type=int, default=8,
+                            help='Deepest reply level (0 = no replies)')
+        parser.add_argument('--reply-ratio', type=float, default=0.6,
+                            help='Share of comments that reply to another comment')
+        parser.add_argument('--likes', type=int, default=50000)
+        parser.add_argument('--comment-like-share', type=float, default=0.5,
+                            help='Share of likes that go to comments')
+        parser.add_argument('--like-skew', type=float, default=1.0,
+                            help='Power-law exponent for likes per post/comment')
+        parser.add_argument('--days', type=float, default=7,
+                            help='Spread activity over the last N days')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='gen',
+                            help='Username prefix for generated users')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError(f'{connection.vendor} cannot return ids from bulk inserts')
+        if options['users'] < 1 or options['posts'] < 1:
+            raise CommandError('--users and --posts must be at least 1')
+        if not 0 <= options['max_depth'] <= Comment.MAX_DEPTH:
+            raise CommandError(f'--max-depth must be between 0 and {Comment.MAX_DEPTH}')
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(
+                f"Users prefixed '{options['prefix']}_' already exist; "
+                'pass another --prefix or run manage.py flush'
+            )
+
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+        self.span = (self.now - self.start).total_seconds()
+        began = time.perf_counter()
+
+        self.user_ids = self.create_users()
+        self.plan_posts()
+        self.plan_comments()
+        self.plan_likes()
+        with explicit_timestamps(Post, Comment), transaction.atomic():
+            post_ids = self.create_posts()
+            comment_ids = self.create_comments(post_ids)
+            self.create_likes(post_ids, comment_ids)
+        refresh_due_snapshots(force=True)
+        self.stdout.write(f'Done in {time.perf_counter() - began:.1f}s')
+
+    def at(self, offset):
+        return self.start + timedelta(seconds=offset)
+
+    def later(self, offset):
+        """A moment after ``offset``, usually soon after"""
+        return offset + (self.span - offset) * self.rng.random() ** 3
+
+    def text(self):
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randint(4, 24)))
+
+    def insert(self, model, rows):
+        """bulk_create ``rows`` in chunks; returns the new primary keys in order"""
+        began = time.perf_counter()
+        ids = []
+        for chunk in chunked(rows, self.batch_size):
+            ids.extend(obj.pk for obj in model.objects.bulk_create(chunk, batch_size=self.batch_size))
+        self.stdout.write(
+            f'{model.__name__}: {len(ids)} rows in {time.perf_counter() - began:.1f}s'
+        )
+        return ids
+
+    def insert_rows(self, model, columns, rows):
+        """
+        ``executemany`` db-ready tuples into ``model``'s table in chunks
+        For rows whose ids aren't needed; skips the per-instance ORM work,
+        which dominates bulk_create at these volumes
+        """
+        began = time.perf_counter()
+        qn = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(map(qn, columns))}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        count = 0
+        with connection.cursor() as cursor:
+            for chunk in chunked(rows, self.batch_size):
+                cursor.executemany(sql, chunk)
+                count += len(chunk)
+        self.stdout.write(
+            f'{model.__name__}: {count} rows in {time.perf_counter() - began:.1f}s'
+        )
+
+    def create_users(self):
+        password = make_password(None)
+        prefix = self.options['prefix']
+        with transaction.atomic():
+            return self.insert(User, (
+                User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password)
+                for i in range(self.options['users'])
+            ))
+
+    def plan_posts(self):
+        """Posts in time order by authors with power-law activity"""
+        rng = self.rng
+        self.author_weights = power_law(len(self.user_ids), 1.0, rng)
+        count = self.options['posts']
+        self.post_time = sorted(rng.random() * self.span for _ in range(count))
+        self.post_author = [pick(self.author_weights, rng) for _ in range(count)]
+        self.post_likes = [0] * count
+        self.post_activity = list(self.post_time)
+
+    def plan_comments(self):
+        """
+        Thread shapes per post: each comment is top-level or replies to an
+        earlier comment on the same post that is above ``--max-depth``
+        """
+        rng = self.rng
+        options = self.options
+        weights = power_law(len(self.post_time), options['comment_skew'], rng)
+        per_post = defaultdict(int)
+        for _ in range(options['comments']):
+            per_post[pick(weights, rng)] += 1
+
+        self.comment_post, self.comment_parent = [], []
+        self.comment_depth, self.comment_author, self.comment_time = [], [], []
+        for post, count in sorted(per_post.items()):
+            open_parents = []
+            for _ in range(count):
+                parent = -1
+                if open_parents and rng.random() < options['reply_ratio']:
+                    parent = rng.choice(open_parents)
+                index = len(self.comment_post)
+                depth = self.comment_depth[parent] + 1 if parent >= 0 else 0
+                base = self.comment_time[parent] if parent >= 0 else self.post_time[post]
+                moment = self.later(base)
+                self.comment_post.append(post)
+                self.comment_parent.append(parent)
+                self.comment_depth.append(depth)
+                self.comment_author.append(pick(self.author_weights, rng))
+                self.comment_time.append(moment)
+                self.post_activity[post] = max(self.post_activity[post], moment)
+                if depth < options['max_depth']:
+                    open_parents.append(index)
+        self.comment_likes = [0] * len(self.comment_post)
+
+    def plan_likes(self):
+        """Unique (user, target) likes, targets drawn by popularity"""
+        rng = self.rng
+        options = self.options
+        users = len(self.user_ids)
+        comment_likes = round(options['likes'] * options['comment_like_share']) if self.comment_post else 0
+        self.likes = {'post': [], 'comment': []}
+        for kind, wanted in (('post', options['likes'] - comment_likes), ('comment', comment_likes)):
+            times = self.post_time if kind == 'post' else self.comment_time
+            counts = self.post_likes if kind == 'post' else self.comment_likes
+            weights = power_law(len(times), options['like_skew'], rng)
+            seen = set()
+            attempts = 0
+            while len(self.likes[kind]) < wanted and attempts < wanted * 4:
+                attempts += 1
+                target = pick(weights, rng)
+                user = rng.randrange(users)
+                if (target, user) in seen:
+                    continue
+                seen.add((target, user))
+                moment = self.later(times[target])
+                self.likes[kind].append((user, target, moment))
+                counts[target] += 1
+                post = target if kind == 'post' else self.comment_post[target]
+                self.post_activity[post] = max(self.post_activity[post], moment)
+
+    def create_posts(self):
+        user_ids = self.user_ids
+        return self.insert(Post, (
+            Post(
+                author_id=user_ids[self.post_author[i]],
+                content=self.text(),
+                created_at=self.at(offset),
+                updated_at=self.at(offset),
+                like_count=self.post_likes[i],
+                last_activity_at=self.at(self.post_activity[i])
+            )
+            for i, offset in enumerate(self.post_time)
+        ))
+
+    def create_comments(self, post_ids):
+        """One depth level at a time, so parents exist before their replies"""
+        user_ids = self.user_ids
+        levels = defaultdict(list)
+        for index, depth in enumerate(self.comment_depth):
+            levels[depth].append(index)
+
+        comment_ids = [None] * len(self.comment_post)
+        parents = {}
+        for depth in sorted(levels):
+            created = {}
+
+            def rows():
+                for index in levels[depth]:
+                    parent = parents.get(self.comment_parent[index])
+                    path, level = Comment.thread_position(parent)
+                    comment = Comment(
+                        post_id=post_ids[self.comment_post[index]],
+                        author_id=user_ids[self.comment_author[index]],
+                        parent_id=parent.id if parent else None,
+                        content=self.text(),
+                        created_at=self.at(self.comment_time[index]),
+                        updated_at=self.at(self.comment_time[index]),
+                        like_count=self.comment_likes[index],
+                        path=path,
+                        depth=level
+                    )
+                    created[index] = comment
+                    yield comment
+
+            for index, pk in zip(levels[depth], self.insert(Comment, rows())):
+                comment_ids[index] = pk
+            # Only the level just written can be a parent of the next one
+            parents = created
+        return comment_ids
+
+    def create_likes(self, post_ids, comment_ids):
+        """PostLike/CommentLike rows plus the hourly karma buckets they add up to"""
+        karma = defaultdict(int)
+        adapt = connection.ops.adapt_datetimefield_value
+
+        def rows(kind, model, ids, authors):
+            points = like_karma_points(model)
+            for user, target, offset in self.likes[kind]:
+                created_at = self.at(offset)
+                karma[(authors[target], truncate_to_hour(created_at))] += points
+                yield self.user_ids[user], ids[target], adapt(created_at)
+
+        self.insert_rows(
+            PostLike, ('user_id', 'post_id', 'created_at'),
+            rows('post', Post, post_ids, self.post_author)
+        )
+        self.insert_rows(
+            CommentLike, ('user_id', 'comment_id', 'created_at'),
+            rows('comment', Comment, comment_ids, self.comment_author)
+        )
+        now = adapt(self.now)
+        self.insert_rows(
+            KarmaBucket, ('user_id', 'bucket_start', 'karma', 'updated_at'),
+            (
+                (self.user_ids[author], adapt(bucket_start), points, now)
+                for (author, bucket_start), points in karma.items()
+            )
+        )
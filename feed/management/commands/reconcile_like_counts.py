@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from feed.models import Post, Comment
+from feed.utils import like_count_subquery
+
+
+class Command(BaseCommand):
+    """
+    Recompute Post.like_count and Comment.like_count from the like tables
+    Only rows whose stored counter has drifted are rewritten
+    """
+    help = 'Reconcile denormalized like counters with the like tables'
+    batch_size = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted rows without updating them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        for model in (Post, Comment):
+            actual = like_count_subquery(model)
+            drifted_ids = list(
+                model.objects.annotate(actual_likes=actual).exclude(
+                    like_count=F('actual_likes')
+                ).values_list('id', flat=True)
+            )
+
+            if not dry_run:
+                for start in range(0, len(drifted_ids), self.batch_size):
+                    batch = drifted_ids[start:start + self.batch_size]
+                    with transaction.atomic():
+                        model.objects.filter(id__in=batch).update(
+                            like_count=like_count_subquery(model)
+                        )
+
+            verb = 'would fix' if dry_run else 'fixed'
+            self.stdout.write(
+                f"{model.__name__}: {len(drifted_ids)} drifted counter(s) {verb}"
+            )
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from feed.leaderboard import refresh_due_snapshots, snapshot_cache_is_shared
+
+
+class Command(BaseCommand):
+    """
+    Keep the precomputed leaderboard snapshots warm
+    Runs as a long-lived worker by default; only windows with new karma or
+    an aged snapshot are recomputed on each tick. Needs a cache shared with
+    the web processes; with a process-local one, use
+    LEADERBOARD_REFRESH_THREAD instead.
+    """
+    help = 'Refresh precomputed leaderboard snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=getattr(settings, 'LEADERBOARD_REFRESH_INTERVAL', 15),
+            help='Seconds between refresh checks',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Refresh due snapshots once and exit',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute every window even if its snapshot is current',
+        )
+
+    def handle(self, *args, **options):
+        if not snapshot_cache_is_shared():
+            raise CommandError(
+                'The leaderboard cache is local to each process, so the web processes '
+                'would never read these snapshots. Point CACHE_BACKEND at a shared '
+                'cache, or set LEADERBOARD_REFRESH_THREAD=True to refresh in-process.'
+            )
+        while True:
+            refreshed = refresh_due_snapshots(force=options['force'])
+            if refreshed:
+                self.stdout.write(f"Refreshed leaderboard windows: {', '.join(refreshed)}")
+            if options['once']:
+                return
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,114 @@
+"""
+Per-route request metrics (per process), exported in Prometheus text format
+
+RequestMetricsMiddleware records, for every ``/api/`` request, wall time,
+query count, SQL time, render time and response size against the route's
+URL name. Totals live in fixed-bucket histograms and counters guarded by
+one lock, so recording is a few additions; ``GET /api/_metrics`` renders
+them for a Prometheus scrape.
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; not locked, callers hold the registry lock"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """``(le, count)`` pairs including ``+Inf``"""
+        running = 0
+        for bound, count in zip((*self.bounds, '+Inf'), self.counts):
+            running += count
+            yield bound, running
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.response_bytes = 0
+        self.over_budget = 0
+
+
+class RequestMetrics:
+    """Thread-safe registry of RouteStats keyed by ``(route, method)``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteStats)
+
+    def record(self, route, method, duration, queries, sql_seconds,
+               render_seconds, response_bytes, over_budget):
+        with self._lock:
+            stats = self._routes[(route, method)]
+            stats.latency.observe(duration)
+            stats.queries.observe(queries)
+            stats.sql_seconds += sql_seconds
+            stats.render_seconds += render_seconds
+            stats.response_bytes += response_bytes
+            stats.over_budget += over_budget
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """Everything recorded so far in Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            routes = sorted(self._routes.items())
+
+            def family(name, kind, help_text, samples):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for (route, method), stats in routes:
+                    labels = f'route="{route}",method="{method}"'
+                    lines.extend(samples(name, labels, stats))
+
+            def histogram(attr):
+                def samples(name, labels, stats):
+                    histogram = getattr(stats, attr)
+                    for bound, count in histogram.cumulative():
+                        yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                    yield f'{name}_sum{{{labels}}} {histogram.sum}'
+                    yield f'{name}_count{{{labels}}} {histogram.count}'
+                return samples
+
+            def counter(attr):
+                def samples(name, labels, stats):
+                    yield f'{name}{{{labels}}} {getattr(stats, attr)}'
+                return samples
+
+            family('feed_request_duration_seconds', 'histogram',
+                   'Wall time per request', histogram('latency'))
+            family('feed_request_queries', 'histogram',
+                   'Database queries per request', histogram('queries'))
+            family('feed_request_sql_seconds_total', 'counter',
+                   'Time spent executing SQL', counter('sql_seconds'))
+            family('feed_request_render_seconds_total', 'counter',
+                   'Time spent rendering DRF responses', counter('render_seconds'))
+            family('feed_response_bytes_total', 'counter',
+                   'Response body bytes', counter('response_bytes'))
+            family('feed_query_budget_exceeded_total', 'counter',
+                   'Requests that ran more queries than their budget', counter('over_budget'))
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,109 @@
+"""
+Request instrumentation for the feed API; see ``feed.metrics``
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from .metrics import request_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimer:
+    """``connection.execute_wrapper`` that counts and times every query"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - began
+            self.count += 1
+
+
+def query_budget(route):
+    """Query budget for a URL name: QUERY_BUDGETS entry, else QUERY_BUDGET"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(route, getattr(settings, 'QUERY_BUDGET', 50))
+
+
+class RequestMetricsMiddleware:
+    """
+    Record query count, SQL time, render time and response size per route
+    and warn when a request runs more queries than its budget. Covers
+    ``/api/`` only; queries that ``gather_queries`` sends to worker threads
+    are not counted. Disable with REQUEST_METRICS=False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def instrumented(self, request):
+        return getattr(settings, 'REQUEST_METRICS', True) and request.path.startswith('/api/')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.instrumented(request):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        began = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.record(request, response, timer, time.perf_counter() - began)
+        return response
+
+    async def __acall__(self, request):
+        if not self.instrumented(request):
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        began = time.perf_counter()
+        # Async views run their ORM calls on this same (context-local) connection
+        with connection.execute_wrapper(timer):
+            response = await self.get_response(request)
+        self.record(request, response, timer, time.perf_counter() - began)
+        return response
+
+    def process_template_response(self, request, response):
+        """Time DRF's rendering, which happens after the view returns"""
+        began = time.perf_counter()
+
+        def rendered(response):
+            request.render_seconds = time.perf_counter() - began
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, response, timer, duration):
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        budget = query_budget(route)
+        over_budget = timer.count > budget
+        if over_budget:
+            logger.warning(
+                '%s %s ran %d queries (budget %d for %s)',
+                request.method, request.path, timer.count, budget, route
+            )
+        request_metrics.record(
+            route, request.method, duration,
+            queries=timer.count,
+            sql_seconds=timer.seconds,
+            render_seconds=getattr(request, 'render_seconds', 0.0),
+            response_bytes=0 if response.streaming else len(response.content),
+            over_budget=over_budget
+        )
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:45
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_counts(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('feed', 'Like')
+
+    for model_name in ('post', 'comment'):
+        content_type = ContentType.objects.filter(
+            app_label='feed', model=model_name
+        ).first()
+        if content_type is None:
+            continue
+
+        counts = Like.objects.filter(
+            content_type=content_type,
+            object_id=OuterRef('pk')
+        ).order_by().values('object_id').annotate(
+            total=Count('id')
+        ).values('total')[:1]
+
+        apps.get_model('feed', model_name).objects.update(
+            like_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('feed', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import TruncHour
+
+
+def backfill_karma_buckets(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Like = apps.get_model('feed', 'Like')
+    KarmaBucket = apps.get_model('feed', 'KarmaBucket')
+
+    totals = {}
+    for model_name, points in (('post', 5), ('comment', 1)):
+        content_type = ContentType.objects.filter(
+            app_label='feed', model=model_name
+        ).first()
+        if content_type is None:
+            continue
+
+        model = apps.get_model('feed', model_name)
+        rows = Like.objects.filter(content_type=content_type).annotate(
+            author=Subquery(
+                model.objects.filter(pk=OuterRef('object_id')).values('author_id')[:1]
+            ),
+            bucket_start=TruncHour('created_at')
+        ).values('author', 'bucket_start').annotate(total=Count('id')).order_by()
+
+        for row in rows.iterator():
+            if row['author'] is None:
+                continue
+            key = (row['author'], row['bucket_start'])
+            totals[key] = totals.get(key, 0) + row['total'] * points
+
+    KarmaBucket.objects.bulk_create(
+        [
+            KarmaBucket(user_id=user_id, bucket_start=bucket_start, karma=karma)
+            for (user_id, bucket_start), karma in totals.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('feed', '0002_like_count_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KarmaBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('karma', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='karma_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_start', 'user'], name='feed_karmab_bucket__4bd477_idx')],
+                'unique_together': {('user', 'bucket_start')},
+            },
+        ),
+        migrations.RunPython(backfill_karma_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:52
+
+from django.db import migrations, models
+
+SEGMENT_WIDTH = 10
+
+
+def backfill_comment_paths(apps, schema_editor):
+    """Fill path/depth level by level, starting from top-level comments"""
+    Comment = apps.get_model('feed', 'Comment')
+
+    frontier = {}  # comment id -> (path, depth) for the current level
+    for comment_id in Comment.objects.filter(parent=None).values_list('id', flat=True):
+        frontier[comment_id] = ('', 0)
+
+    while frontier:
+        next_frontier = {}
+        parent_ids = list(frontier)
+        for start in range(0, len(parent_ids), 500):
+            children = Comment.objects.filter(
+                parent_id__in=parent_ids[start:start + 500]
+            ).values_list('id', 'parent_id')
+            for comment_id, parent_id in children:
+                parent_path, parent_depth = frontier[parent_id]
+                next_frontier[comment_id] = (
+                    f"{parent_path}{parent_id:0{SEGMENT_WIDTH}d}", parent_depth + 1
+                )
+
+        Comment.objects.bulk_update(
+            [
+                Comment(id=comment_id, path=path, depth=depth)
+                for comment_id, (path, depth) in next_frontier.items()
+            ],
+            ['path', 'depth'],
+            batch_size=500
+        )
+        frontier = next_frontier
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0003_karma_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=2000),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='feed_commen_path_96ec85_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'depth'], name='feed_commen_post_id_0d2d9b_idx'),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
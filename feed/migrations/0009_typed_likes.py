@@ -0,0 +1,112 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# target model name -> its typed like model and foreign key column
+TYPED_LIKES = {
+    'post': ('PostLike', 'post_id'),
+    'comment': ('CommentLike', 'comment_id'),
+}
+
+
+def _content_type(apps, model_name):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    return ContentType.objects.get_or_create(app_label='feed', model=model_name)[0]
+
+
+def copy_generic_likes(apps, schema_editor):
+    """
+    Copy every Like into PostLike/CommentLike in one INSERT ... SELECT per
+    target type. The join to the target drops likes whose post or comment
+    was deleted, which the generic foreign key never cascaded to.
+    """
+    qn = schema_editor.connection.ops.quote_name
+    like_table = qn(apps.get_model('feed', 'Like')._meta.db_table)
+    for model_name, (typed_model, column) in TYPED_LIKES.items():
+        target_table = qn(apps.get_model('feed', model_name)._meta.db_table)
+        typed_table = qn(apps.get_model('feed', typed_model)._meta.db_table)
+        schema_editor.execute(
+            f"""
+            INSERT INTO {typed_table} (user_id, {qn(column)}, created_at)
+            SELECT l.user_id, l.object_id, l.created_at
+            FROM {like_table} l
+            INNER JOIN {target_table} t ON t.id = l.object_id
+            WHERE l.content_type_id = %s
+            """,
+            [_content_type(apps, model_name).id]
+        )
+
+
+def copy_typed_likes(apps, schema_editor):
+    """Reverse: fold PostLike/CommentLike rows back into the generic table"""
+    qn = schema_editor.connection.ops.quote_name
+    like_table = qn(apps.get_model('feed', 'Like')._meta.db_table)
+    for model_name, (typed_model, column) in TYPED_LIKES.items():
+        typed_table = qn(apps.get_model('feed', typed_model)._meta.db_table)
+        schema_editor.execute(
+            f"""
+            INSERT INTO {like_table} (user_id, content_type_id, object_id, created_at)
+            SELECT l.user_id, %s, l.{qn(column)}, l.created_at
+            FROM {typed_table} l
+            """,
+            [_content_type(apps, model_name).id]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('feed', '0008_leaderboard_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='feed.comment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_likes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='feed.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_likes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['comment', 'created_at'], name='feed_commen_comment_910853_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['created_at'], name='feed_commen_created_c6b82e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='commentlike',
+            unique_together={('user', 'comment')},
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['post', 'created_at'], name='feed_postli_post_id_2897d2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['created_at'], name='feed_postli_created_87e1be_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='postlike',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(copy_generic_likes, copy_typed_likes),
+        migrations.DeleteModel(
+            name='Like',
+        ),
+    ]
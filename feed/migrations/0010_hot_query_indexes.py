@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0009_typed_likes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='commentlike',
+            name='feed_commen_created_c6b82e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='karmabucket',
+            name='feed_karmab_bucket__4bd477_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='postlike',
+            name='feed_postli_created_87e1be_idx',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='feed.comment'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='feed.post'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at'], name='feed_commen_post_id_3fe3f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'created_at', 'id'], name='feed_commen_post_id_440e69_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'created_at', 'id'], name='feed_commen_parent__328977_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['created_at', 'comment'], name='feed_commen_created_00a278_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='karmabucket',
+            index=models.Index(fields=['bucket_start', 'user', 'karma'], name='feed_karmab_bucket__bc4f95_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['created_at', 'post'], name='feed_postli_created_1cd058_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+
+
+def rebuild_karma_buckets(apps, schema_editor):
+    """
+    Recompute every hourly bucket from the likes that exist
+    Deleting content used to leave its likes' karma in the buckets, and
+    0009_typed_likes dropped likes on deleted content without taking their
+    karma back out
+    """
+    KarmaBucket = apps.get_model('feed', 'KarmaBucket')
+
+    totals = {}
+    for kind, like_model, points in (('post', 'PostLike', 5), ('comment', 'CommentLike', 1)):
+        rows = apps.get_model('feed', like_model).objects.annotate(
+            author=F(f'{kind}__author_id'),
+            bucket_start=TruncHour('created_at')
+        ).values('author', 'bucket_start').annotate(total=Count('id')).order_by()
+
+        for row in rows.iterator():
+            key = (row['author'], row['bucket_start'])
+            totals[key] = totals.get(key, 0) + row['total'] * points
+
+    KarmaBucket.objects.all().delete()
+    KarmaBucket.objects.bulk_create(
+        [
+            KarmaBucket(user_id=user_id, bucket_start=bucket_start, karma=karma)
+            for (user_id, bucket_start), karma in totals.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_karma_buckets, migrations.RunPython.noop),
+    ]
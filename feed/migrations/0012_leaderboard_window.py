@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0011_rebuild_karma_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardWindow',
+            fields=[
+                ('window', models.CharField(max_length=8, primary_key=True, serialize=False)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
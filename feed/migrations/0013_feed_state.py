@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:28
+
+from django.db import migrations, models
+
+
+def create_feed_state(apps, schema_editor):
+    apps.get_model('feed', 'FeedState').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0012_leaderboard_window'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deletions', models.PositiveBigIntegerField(default=0)),
+                ('last_deletion_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_feed_state, migrations.RunPython.noop),
+    ]
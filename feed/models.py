@@ -1,8 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
-from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
 
@@ -22,27 +22,74 @@ class Post(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counter kept in step with PostLike rows (see utils.adjust_like_count)
+    like_count = models.PositiveIntegerField(default=0)
+    # Bumped on any change to the post, its comments or their likes;
+    # keys the cached post detail payload (see feed.cache) and, with
+    # last_activity_at, the conditional GET validators (see feed.conditional)
+    version = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),  # Keyset feed pagination
+        ]
         
     def __str__(self):
         return f"{self.author.username}: {self.content[:50]}"
     
-    @property
-    def like_count(self):
-        """Get the total number of likes for this post"""
-        from django.contrib.contenttypes.models import ContentType
-        post_ct = ContentType.objects.get_for_model(self)
-        return Like.objects.filter(content_type=post_ct, object_id=self.id).count()
+    def save(self, *args, **kwargs):
+        """Edits invalidate cached payloads for this post"""
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            Post.bump_version(self.pk)
+    
+    @staticmethod
+    def bump_version(post_id):
+        """Atomically move the post to a new cache version"""
+        Post.bump_versions([post_id])
+    
+    @staticmethod
+    def bump_versions(post_ids):
+        """Move several posts to new cache versions in one UPDATE"""
+        Post.objects.filter(pk__in=post_ids).update(
+            version=F('version') + 1, last_activity_at=timezone.now()
+        )
+
+
+class FeedState(models.Model):
+    """
+    Single row of feed-wide change markers for the feed validators
+    A deleted post leaves no newer row behind to move ``Max(last_activity_at)``,
+    so every post deletion advances this counter instead
+    """
+    SINGLETON_ID = 1
+    deletions = models.PositiveBigIntegerField(default=0)
+    last_deletion_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.deletions} post deletion(s), last at {self.last_deletion_at}"
+    
+    @classmethod
+    def record_deletion(cls):
+        """Atomically count one more post deletion"""
+        changes = {'deletions': F('deletions') + 1, 'last_deletion_at': timezone.now()}
+        if not cls.objects.filter(pk=cls.SINGLETON_ID).update(**changes):
+            # The row is created by migration 0013; recreate it after a flush
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+            cls.objects.filter(pk=cls.SINGLETON_ID).update(**changes)
 
 
 class Comment(models.Model):
     """Threaded comments on posts - supports nested replies like Reddit"""
+    # post and parent are indexed by the composites in Meta
     post = models.ForeignKey(
         Post, 
         on_delete=models.CASCADE, 
-        related_name='comments'
+        related_name='comments',
+        db_index=False
     )
     author = models.ForeignKey(
         get_user_model(), 
@@ -55,65 +102,217 @@ class Comment(models.Model):
         null=True, 
         blank=True, 
         on_delete=models.CASCADE, 
-        related_name='replies'
+        related_name='replies',
+        db_index=False
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counter kept in step with CommentLike rows (see utils.adjust_like_count)
+    like_count = models.PositiveIntegerField(default=0)
+    
+    # Materialized path: zero-padded ids of every ancestor, root first.
+    # Subtrees, ancestor chains and depth cut-offs become indexed range
+    # queries instead of one query per level.
+    PATH_SEGMENT_WIDTH = 10
+    PATH_MAX_LENGTH = 2000
+    # Deepest reply whose path still fits the column
+    MAX_DEPTH = PATH_MAX_LENGTH // PATH_SEGMENT_WIDTH
+    path = models.CharField(max_length=PATH_MAX_LENGTH, blank=True, default='')
+    depth = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['path']),  # Subtree range scans
+            models.Index(fields=['post', 'depth']),  # Collapse below depth N
+            models.Index(fields=['post', 'created_at']),  # Whole thread in order, comment counts
+            models.Index(fields=['post', 'parent', 'created_at', 'id']),  # Root pages and feed previews
+            models.Index(fields=['parent', 'created_at', 'id']),  # Reply pages and reply counts
+        ]
     
     def __str__(self):
         return f"{self.author.username} on {self.post}: {self.content[:30]}"
     
+    def save(self, *args, **kwargs):
+        """
+        Derive path/depth from the parent when the comment is first created
+        Any create or edit invalidates the post's cached payload
+        """
+        if self._state.adding:
+            self.path, self.depth = Comment.thread_position(self.parent)
+        super().save(*args, **kwargs)
+        Post.bump_version(self.post_id)
+    
+    def delete(self, *args, **kwargs):
+        post_id = self.post_id
+        result = super().delete(*args, **kwargs)
+        Post.bump_version(post_id)
+        return result
+    
+    @classmethod
+    def thread_position(cls, parent):
+        """
+        (path, depth) for a new comment replying to ``parent`` (or None)
+        Raises ValidationError when the reply would go past MAX_DEPTH
+        """
+        if parent is None:
+            return '', 0
+        if parent.depth >= cls.MAX_DEPTH:
+            raise ValidationError(
+                f'Replies cannot be nested more than {cls.MAX_DEPTH} levels deep'
+            )
+        return parent.subtree_prefix, parent.depth + 1
+    
+    @property
+    def subtree_prefix(self):
+        """Path shared by this comment's children; every descendant starts with it"""
+        return f"{self.path}{self.id:0{self.PATH_SEGMENT_WIDTH}d}"
+    
     @property
-    def like_count(self):
-        """Get the total number of likes for this comment"""
-        from django.contrib.contenttypes.models import ContentType
-        comment_ct = ContentType.objects.get_for_model(self)
-        return Like.objects.filter(content_type=comment_ct, object_id=self.id).count()
+    def ancestor_ids(self):
+        """Ids of every ancestor, root first - parsed from the path, no query"""
+        width = self.PATH_SEGMENT_WIDTH
+        return [int(self.path[i:i + width]) for i in range(0, len(self.path), width)]
     
     def get_thread_depth(self):
-        """Calculate the depth of this comment in the thread"""
-        depth = 0
-        parent = self.parent
-        while parent:
-            depth += 1
-            parent = parent.parent
-        return depth
+        """Depth of this comment in the thread (0 for top-level comments)"""
+        return self.depth
+    
+    def get_ancestors(self):
+        """Ancestor chain, root first, in one indexed query"""
+        return Comment.objects.filter(id__in=self.ancestor_ids).order_by('depth')
+    
+    @property
+    def subtree_path_range(self):
+        """
+        Half-open ``[low, high)`` bounds covering every descendant's path
+        Paths are fixed-width digit strings, so descendants sort in
+        [prefix, prefix + 1)
+        """
+        prefix = self.subtree_prefix
+        return prefix, str(int(prefix) + 1).zfill(len(prefix))
+    
+    def get_descendants(self):
+        """Whole subtree below this comment in one indexed range query"""
+        low, high = self.subtree_path_range
+        return Comment.objects.filter(path__gte=low, path__lt=high)
 
 
-class Like(models.Model):
-    """Like model supporting both posts and comments with concurrency protection"""
+class PostLike(models.Model):
+    """A user's like on a post, worth 5 karma to the post's author"""
     user = models.ForeignKey(
         get_user_model(), 
         on_delete=models.CASCADE, 
-        related_name='likes'
+        related_name='post_likes'
     )
+    # Indexed by the (post, created_at) composite below
+    post = models.ForeignKey(
+        Post, 
+        on_delete=models.CASCADE, 
+        related_name='likes',
+        db_index=False
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
     
-    # Generic foreign key to support both Post and Comment
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.PositiveIntegerField()
-    content_object = GenericForeignKey('content_type', 'object_id')
+    class Meta:
+        # Prevent duplicate likes from the same user on the same post
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['post', 'created_at']),  # Counts and per-post karma windows
+            models.Index(fields=['created_at', 'post']),  # Leaderboard edge hour, without row lookups
+        ]
     
+    def __str__(self):
+        return f"{self.user.username} likes {self.post}"
+
+
+class CommentLike(models.Model):
+    """A user's like on a comment, worth 1 karma to the comment's author"""
+    user = models.ForeignKey(
+        get_user_model(), 
+        on_delete=models.CASCADE, 
+        related_name='comment_likes'
+    )
+    # Indexed by the (comment, created_at) composite below
+    comment = models.ForeignKey(
+        Comment, 
+        on_delete=models.CASCADE, 
+        related_name='likes',
+        db_index=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        # Prevent duplicate likes from the same user on the same object
-        unique_together = ['user', 'content_type', 'object_id']
+        # Prevent duplicate likes from the same user on the same comment
+        unique_together = ['user', 'comment']
         indexes = [
-            models.Index(fields=['content_type', 'object_id']),
-            models.Index(fields=['created_at']),  # For leaderboard queries
+            models.Index(fields=['comment', 'created_at']),  # Counts and per-comment karma windows
+            models.Index(fields=['created_at', 'comment']),  # Leaderboard edge hour, without row lookups
         ]
     
     def __str__(self):
-        return f"{self.user.username} likes {self.content_object}"
+        return f"{self.user.username} likes {self.comment}"
+
+
+class KarmaBucket(models.Model):
+    """
+    Hourly karma rollup per user
+    Maintained incrementally on like/unlike so leaderboards over any window
+    sum a handful of buckets instead of rescanning raw likes
+    """
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='karma_buckets'
+    )
+    bucket_start = models.DateTimeField()  # Truncated to the hour (UTC)
+    karma = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Leaderboard ETag
     
-    @property
-    def karma_value(self):
-        """Calculate karma value based on content type"""
-        if self.content_type.model == 'post':
-            return 5  # Post like = 5 karma
-        elif self.content_type.model == 'comment':
-            return 1  # Comment like = 1 karma
-        return 0
+    class Meta:
+        unique_together = ['user', 'bucket_start']
+        indexes = [
+            # Covers leaderboard window sums, which then never read the table
+            models.Index(fields=['bucket_start', 'user', 'karma']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} @ {self.bucket_start:%Y-%m-%d %H:00}: {self.karma}"
+
+
+class LeaderboardWindow(models.Model):
+    """
+    One row per karma window, locked while that window's LeaderboardEntry
+    rows are rewritten so refreshes from different processes serialize
+    """
+    window = models.CharField(max_length=8, primary_key=True)  # A KARMA_WINDOWS key
+    # When the stored ranking was computed; an older one never replaces it
+    computed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"[{self.window}] computed {self.computed_at}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Materialized ranking for one karma window
+    Rewritten wholesale by the background snapshot refresher (never by a
+    read request), so rank lookups and deep pages are single index probes
+    instead of a full aggregate-and-sort. Ties are broken by user id
+    (lowest first).
+    """
+    window = models.CharField(max_length=8)  # A KARMA_WINDOWS key
+    rank = models.PositiveIntegerField()  # 1-based
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='leaderboard_entries'
+    )
+    karma = models.IntegerField()
+    
+    class Meta:
+        unique_together = [['window', 'rank'], ['window', 'user']]
+        ordering = ['window', 'rank']
+    
+    def __str__(self):
+        return f"[{self.window}] #{self.rank} {self.user.username}: {self.karma}"
@@ -0,0 +1,121 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class FeedCursorPagination(BasePagination):
+    """
+    Keyset pagination over ``(created_at, id)``, newest first by default
+    Each page is a single indexed range scan no matter how deep the client
+    has scrolled, and no total COUNT is ever run. Cursors are opaque
+    base64 tokens; ``next``/``previous`` are ready-made links.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    newest_first = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        position, reverse = self.decode_cursor(encoded) if encoded else (None, False)
+
+        # Previous pages walk against the display order, then flip the page
+        ascending = reverse if self.newest_first else not reverse
+        if ascending:
+            queryset = queryset.order_by('created_at', 'id')
+            if position is not None:
+                created_at, pk = position
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                )
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+            if position is not None:
+                created_at, pk = position
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor((last.created_at, last.id), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        first = self.page[0]
+        return self.encode_cursor((first.created_at, first.id), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, position, reverse):
+        created_at, pk = position
+        token = json.dumps({'t': created_at.isoformat(), 'id': pk, 'r': int(reverse)})
+        encoded = base64.urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, encoded):
+        try:
+            token = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position = (datetime.fromisoformat(token['t']), int(token['id']))
+            return position, bool(token['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class CommentThreadCursorPagination(FeedCursorPagination):
+    """Keyset pagination for sibling comments, oldest first like the thread view"""
+    newest_first = False
@@ -0,0 +1,292 @@
+"""
+EXPLAIN-based checks that the hot queries stay on their indexes
+
+Each registered probe runs a real read or write path (the same helpers the
+views call) against a sample of existing rows. Every statement it issues
+is captured, the writes are rolled back, and each statement is EXPLAINed.
+A plan that reads a whole table instead of searching an index is a full
+scan; ``check_query_plans`` fails on any that the probe doesn't expect.
+
+On SQLite a full scan is a ``SCAN <table>`` step, except an index walked
+in ORDER BY order under a LIMIT, which stops after one page. On
+PostgreSQL the plan is taken with ``enable_seqscan`` off, so a ``Seq
+Scan`` only appears when no index can serve the query at all; small
+tables don't mask a missing index.
+"""
+import json
+import re
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+from .conditional import feed_state
+from .leaderboard import _karma_version, get_leaderboard_page, get_user_rank
+from .likes import add_like, remove_like
+from .models import Comment, Post, User
+from .utils import (
+    apply_like_batch,
+    calculate_user_karma,
+    get_comment_subtrees,
+    get_karma_map,
+    get_karma_ranking,
+    get_like_counts,
+    get_liked_objects,
+    get_liked_objects_in_post,
+    get_optimized_post_with_comments,
+    get_optimized_posts_queryset,
+    get_reply_counts
+)
+
+PAGE_SIZE = 20
+
+# name -> (probe, allowed full scans)
+HOT_QUERIES = {}
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)( USING (?:COVERING )?INDEX)?')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+SQLITE_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (?:SUBQUERY \d+ )?(\S+)')
+
+
+def hot_query(name, allow_scans=()):
+    """
+    Register ``probe(sample)`` as a hot query path
+    ``allow_scans`` names tables (as the plan prints them) the path reads
+    in full on purpose, such as the feed's total count
+    """
+    def register(probe):
+        HOT_QUERIES[name] = (probe, frozenset(allow_scans))
+        return probe
+    return register
+
+
+class NoSample(Exception):
+    """The database has no rows for a probe to query with"""
+
+
+class PlanSample:
+    """Ids the probes run with, loaded once from existing rows"""
+
+    def __init__(self):
+        self.posts = list(Post.objects.order_by('-created_at', '-id')[:PAGE_SIZE])
+        self.post = Post.objects.filter(comments__isnull=False).order_by('id').first()
+        self.comment = Comment.objects.filter(replies__isnull=False).order_by('id').first()
+        self.user = (
+            User.objects.filter(karma_buckets__isnull=False).order_by('id').first()
+            or User.objects.order_by('id').first()
+        )
+        self.comments = list(
+            Comment.objects.filter(post__in=self.posts, parent=None).order_by('id')[:PAGE_SIZE]
+        )
+
+    def require(self, *attrs):
+        for attr in attrs:
+            if not getattr(self, attr):
+                raise NoSample(f'no {attr} to query with')
+        return [getattr(self, attr) for attr in attrs]
+
+
+class StatementRecorder:
+    """``connection.execute_wrapper`` keeping every statement and its params"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many:
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def capture_statements(probe, sample):
+    """Run ``probe`` and return the statements it issued; writes are rolled back"""
+    recorder = StatementRecorder()
+    with transaction.atomic():
+        with connection.execute_wrapper(recorder):
+            probe(sample)
+        transaction.set_rollback(True)
+    return recorder.statements
+
+
+def explain(sql, params):
+    """Plan steps for one statement, one string per step"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return list(_postgres_steps(plan[0]['Plan']))
+    raise NotImplementedError(f'No query plan check for {connection.vendor}')
+
+
+def _postgres_steps(node):
+    relation = node.get('Alias') or node.get('Relation Name') or ''
+    yield f"{node['Node Type']} {relation}".strip()
+    for child in node.get('Plans', ()):
+        yield from _postgres_steps(child)
+
+
+def full_scans(steps, limited=False):
+    """
+    Names of the tables a plan reads in full
+    ``limited`` says the statement has a LIMIT, so an index walk that
+    already yields rows in ORDER BY order ends early
+    """
+    scanned = []
+    subqueries = set()
+    ordered_walk = limited and SQLITE_SORT not in steps
+    for step in steps:
+        if connection.vendor == 'postgresql':
+            if step.startswith('Seq Scan '):
+                scanned.append(step.split(' ', 2)[2])
+            continue
+        subquery = SQLITE_SUBQUERY.match(step)
+        if subquery:
+            subqueries.add(subquery.group(1))
+        scan = SQLITE_SCAN.match(step)
+        # Derived tables and constant rows are not table reads
+        if scan is None or scan.group(1) in subqueries or scan.group(1) == 'CONSTANT':
+            continue
+        if not (scan.group(2) and ordered_walk):
+            scanned.append(scan.group(1))
+    return scanned
+
+
+def check_query_plans(names=None):
+    """
+    ``[(name, sql, steps, unexpected_scans)]`` for every statement of the
+    selected probes (all by default), plus ``[(name, reason)]`` for probes
+    that had no sample rows to run with
+    """
+    sample = PlanSample()
+    results, skipped = [], []
+    for name, (probe, allowed) in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        try:
+            statements = capture_statements(probe, sample)
+        except NoSample as exc:
+            skipped.append((name, str(exc)))
+            continue
+        for sql, params in statements:
+            steps = explain(sql, params)
+            scanned = full_scans(steps, limited=bool(LIMIT.search(sql)))
+            unexpected = [table for table in scanned if table not in allowed]
+            results.append((name, sql, steps, unexpected))
+    return results, skipped
+
+
+# Feed
+
+@hot_query('feed_page')
+def _feed_page(sample):
+    list(get_optimized_posts_queryset().order_by('-created_at')[:PAGE_SIZE])
+
+
+@hot_query('feed_count', allow_scans={'feed_post'})
+def _feed_count(sample):
+    # Page-number pagination counts every post by design
+    get_optimized_posts_queryset().count()
+
+
+@hot_query('feed_validators')
+def _feed_validators(sample):
+    feed_state()
+
+
+@hot_query('feed_cursor_page')
+def _feed_cursor_page(sample):
+    (post,) = sample.require('post')
+    list(get_optimized_posts_queryset().filter(
+        created_at__lt=post.created_at
+    ).order_by('-created_at', '-id')[:PAGE_SIZE + 1])
+
+
+@hot_query('feed_expanded')
+def _feed_expanded(sample):
+    list(get_optimized_posts_queryset(expand_comments=True).order_by('-created_at')[:PAGE_SIZE])
+
+
+# Post detail and comment threads
+
+@hot_query('post_detail')
+def _post_detail(sample):
+    (post,) = sample.require('post')
+    get_optimized_post_with_comments(post.id)
+    get_optimized_post_with_comments(post.id, max_depth=1)
+
+
+@hot_query('thread_roots')
+def _thread_roots(sample):
+    (post,) = sample.require('post')
+    roots = list(Comment.objects.filter(post_id=post.id, parent=None).order_by(
+        'created_at', 'id'
+    )[:PAGE_SIZE + 1])
+    get_comment_subtrees(roots, 3)
+    get_reply_counts(root.id for root in roots)
+
+
+@hot_query('thread_replies')
+def _thread_replies(sample):
+    (comment,) = sample.require('comment')
+    list(Comment.objects.filter(parent=comment).order_by('created_at', 'id')[:PAGE_SIZE + 1])
+
+
+# Karma and leaderboard
+
+@hot_query('karma_map')
+def _karma_map(sample):
+    posts, comments = sample.require('posts', 'comments')
+    get_karma_map({post.author_id for post in posts} | {c.author_id for c in comments})
+
+
+@hot_query('karma_ranking')
+def _karma_ranking(sample):
+    get_karma_ranking(timedelta(hours=24))
+    get_karma_ranking(timedelta(days=30))
+
+
+@hot_query('user_karma')
+def _user_karma(sample):
+    (user,) = sample.require('user')
+    calculate_user_karma(user)
+
+
+@hot_query('leaderboard_lookups')
+def _leaderboard_lookups(sample):
+    (user,) = sample.require('user')
+    get_leaderboard_page('24h', 100, 50)
+    get_user_rank('24h', user.id)
+    _karma_version()
+
+
+# Likes
+
+@hot_query('liked_objects')
+def _liked_objects(sample):
+    user, posts, post = sample.require('user', 'posts', 'post')
+    get_liked_objects(
+        user,
+        post_ids=[p.id for p in posts],
+        comment_ids=[comment.id for comment in sample.comments]
+    )
+    get_liked_objects_in_post(user, post.id)
+
+
+@hot_query('like_writes')
+def _like_writes(sample):
+    user, post, comment = sample.require('user', 'post', 'comment')
+    for model, pk in ((Post, post.id), (Comment, comment.id)):
+        add_like(user.id, model, pk)
+        remove_like(user.id, model, pk)
+    apply_like_batch(user.id, [
+        {'action': 'like', 'type': 'post', 'id': post.id},
+        {'action': 'like', 'type': 'comment', 'id': comment.id},
+    ])
+    get_like_counts([('post', post.id), ('comment', comment.id)])
@@ -1,15 +1,34 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.models import ContentType
-from django.db import transaction, IntegrityError
 from django.utils import timezone
 from datetime import timedelta
 
-from .models import Post, Comment, Like
+from .models import Post, Comment, PostLike, CommentLike
+from .utils import LIKE_BATCH_MAX_SIZE
 
 User = get_user_model()
 
 
+class SparseFieldsetMixin:
+    """
+    Honour ``?fields=a,b,c`` on GET requests by dropping every other field
+    before serialization, so unrequested method fields never run
+    """
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return fields
+        
+        requested = request.query_params.get('fields')
+        if requested:
+            allowed = {name.strip() for name in requested.split(',')}
+            for name in set(fields) - allowed:
+                fields.pop(name)
+        return fields
+
+
 class UserSerializer(serializers.ModelSerializer):
     """User serializer for author information"""
     karma_24h = serializers.SerializerMethodField()
@@ -19,14 +38,49 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'karma_24h']
         
     def get_karma_24h(self, obj):
-        """Calculate karma earned in the last 24 hours"""
+        """
+        Karma earned in the last 24 hours
+        Read from the view's batched ``karma_map`` when present
+        """
+        karma_map = self.context.get('karma_map')
+        if karma_map is not None:
+            return karma_map.get(obj.id, 0)
+        
         from .utils import calculate_user_karma_24h
         return calculate_user_karma_24h(obj)
 
 
+class CommentTreeListSerializer(serializers.ListSerializer):
+    """
+    Renders a list of comments and every reply under them with an explicit
+    stack instead of one nested serializer per level, so thread depth is
+    bounded by data, not Python's recursion limit
+    Children come from ``prefetched_replies`` (see build_comment_tree) or,
+    failing that, one query per comment.
+    """
+    
+    def to_representation(self, data):
+        comments = data.all() if hasattr(data, 'all') else data
+        # The child renders each node with empty replies; they are filled in here
+        self.child.assembling_tree = True
+        output = []
+        stack = [(comment, output) for comment in reversed(list(comments))]
+        while stack:
+            comment, siblings = stack.pop()
+            item = self.child.to_representation(comment)
+            siblings.append(item)
+            if 'replies' not in item:
+                continue
+            if not hasattr(comment, 'prefetched_replies'):
+                comment.prefetched_replies = list(comment.replies.select_related('author'))
+            stack.extend((reply, item['replies']) for reply in reversed(comment.prefetched_replies))
+        return output
+
+
 class CommentSerializer(serializers.ModelSerializer):
     """
-    Recursive comment serializer for threaded comments
+    Threaded comment serializer; nested replies are rendered iteratively
+    by CommentTreeListSerializer
     Optimized to prevent N+1 queries when fetching comment trees
     """
     author = UserSerializer(read_only=True)
@@ -37,46 +91,83 @@ class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = [
-            'id', 'content', 'author', 'post', 'parent', 
+            'id', 'content', 'author', 'post', 'parent', 'depth',
             'created_at', 'updated_at', 'like_count', 
             'replies', 'is_liked'
         ]
-        read_only_fields = ['author', 'created_at', 'updated_at']
+        read_only_fields = ['author', 'depth', 'created_at', 'updated_at']
+        list_serializer_class = CommentTreeListSerializer
+    
+    def validate_parent(self, parent):
+        """Refuse replies that would nest deeper than the stored path allows"""
+        if parent is not None and parent.depth >= Comment.MAX_DEPTH:
+            raise serializers.ValidationError(
+                f'Replies cannot be nested more than {Comment.MAX_DEPTH} levels deep'
+            )
+        return parent
     
     def get_replies(self, obj):
         """Get nested replies for this comment"""
-        # Only include direct replies, let frontend handle deeper nesting
+        if getattr(self, 'assembling_tree', False):
+            return []
         if hasattr(obj, 'prefetched_replies'):
-            # Use prefetched data to avoid N+1
-            replies = [reply for reply in obj.prefetched_replies if reply.parent_id == obj.id]
-            return CommentSerializer(replies, many=True, context=self.context).data
+            # Children were attached by build_comment_tree - no queries
+            replies = obj.prefetched_replies
         else:
             # Fallback if not prefetched
             replies = obj.replies.select_related('author').all()
-            return CommentSerializer(replies, many=True, context=self.context).data
+        return self.__class__(replies, many=True, context=self.context).data
     
     def get_is_liked(self, obj):
-        """Check if current user has liked this comment"""
+        """
+        Check if current user has liked this comment
+        Answered from the view's batched ``liked_objects`` set when present
+        """
+        liked_objects = self.context.get('liked_objects')
+        if liked_objects is not None:
+            return ('comment', obj.id) in liked_objects
+        
         request = self.context.get('request')
         if request:
-            if request.user.is_authenticated:
-                user = request.user
-            else:
-                # Check demo_user for anonymous requests
-                from .models import User
-                try:
-                    user = User.objects.get(username='demo_user')
-                except User.DoesNotExist:
-                    return False
-            return Like.objects.filter(
-                user=user,
-                content_type=ContentType.objects.get_for_model(Comment),
-                object_id=obj.id
-            ).exists()
+            from .utils import get_viewer
+            user = get_viewer(request)
+            if user is None:
+                return False
+            return CommentLike.objects.filter(user=user, comment=obj).exists()
         return False
 
 
-class PostSerializer(serializers.ModelSerializer):
+class CommentThreadSerializer(CommentSerializer):
+    """
+    Comment node for the lazy-loaded thread endpoints
+    ``reply_count`` is the node's total direct replies and ``more_replies``
+    how many of them were left out of this response (load on demand)
+    """
+    reply_count = serializers.SerializerMethodField()
+    more_replies = serializers.SerializerMethodField()
+    
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['reply_count', 'more_replies']
+    
+    def get_reply_count(self, obj):
+        return self.context.get('reply_counts', {}).get(obj.id, 0)
+    
+    def get_more_replies(self, obj):
+        included = len(getattr(obj, 'prefetched_replies', []))
+        return self.get_reply_count(obj) - included
+
+
+class CommentPreviewSerializer(CommentSerializer):
+    """Flat comment for feed previews - no nested replies"""
+    
+    class Meta(CommentSerializer.Meta):
+        fields = [
+            'id', 'content', 'author', 'post', 'parent', 'depth',
+            'created_at', 'like_count', 'is_liked'
+        ]
+
+
+class PostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Post serializer with optimized comment loading
     Prevents N+1 queries when loading posts with comments
@@ -96,57 +187,46 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'created_at', 'updated_at']
     
     def get_is_liked(self, obj):
-        """Check if current user has liked this post"""
+        """
+        Check if current user has liked this post
+        Answered from the view's batched ``liked_objects`` set when present
+        """
+        liked_objects = self.context.get('liked_objects')
+        if liked_objects is not None:
+            return ('post', obj.id) in liked_objects
+        
         request = self.context.get('request')
         if request:
-            if request.user.is_authenticated:
-                user = request.user
-            else:
-                # Check demo_user for anonymous requests
-                from .models import User
-                try:
-                    user = User.objects.get(username='demo_user')
-                except User.DoesNotExist:
-                    return False
-            return Like.objects.filter(
-                user=user,
-                content_type=ContentType.objects.get_for_model(Post),
-                object_id=obj.id
-            ).exists()
+            from .utils import get_viewer
+            user = get_viewer(request)
+            if user is None:
+                return False
+            return PostLike.objects.filter(user=user, post=obj).exists()
         return False
     
     def get_comments(self, obj):
         """
-        Get threaded comments optimized for N+1 prevention
-        Only returns top-level comments with their immediate replies
+        Get the full threaded comment tree, any depth
+        Built in one pass from the post's flat comment list when it has been
+        loaded up front (prefetched_comments or a prefetched ``comments``)
         """
-        if hasattr(obj, 'prefetched_comments'):
-            # Use prefetched data
-            top_level_comments = [
-                comment for comment in obj.prefetched_comments 
-                if comment.parent_id is None
-            ]
-            
-            # Attach replies to each top-level comment
-            for comment in top_level_comments:
-                comment.prefetched_replies = [
-                    reply for reply in obj.prefetched_comments 
-                    if reply.parent_id == comment.id
-                ]
-            
-            return CommentSerializer(
-                top_level_comments, 
-                many=True, 
-                context=self.context
-            ).data
+        from .utils import build_comment_tree
+        
+        comments = getattr(obj, 'prefetched_comments', None)
+        if comments is None and 'comments' in getattr(obj, '_prefetched_objects_cache', {}):
+            comments = list(obj.comments.all())
+        
+        if comments is not None:
+            top_level_comments = build_comment_tree(comments)
         else:
-            # Fallback: fetch top-level comments with their immediate replies
+            # Fallback: fetch top-level comments, replies load per level
             top_level_comments = obj.comments.filter(parent=None).select_related('author')
-            return CommentSerializer(
-                top_level_comments, 
-                many=True, 
-                context=self.context
-            ).data
+        
+        return CommentSerializer(
+            top_level_comments, 
+            many=True, 
+            context=self.context
+        ).data
     
     def get_comment_count(self, obj):
         """Total comment count including all nested levels"""
@@ -155,50 +235,60 @@ class PostSerializer(serializers.ModelSerializer):
         return obj.comments.count()
 
 
-class LikeSerializer(serializers.ModelSerializer):
-    """Serializer for handling likes with concurrency protection"""
+class PostListSerializer(PostSerializer):
+    """
+    Slim post serializer for the feed list
+    Metadata, counts and a preview of the first few top-level comments;
+    work is bounded by the page size rather than total comment volume
+    """
+    comments = None
+    comment_preview = serializers.SerializerMethodField()
     
-    class Meta:
-        model = Like
-        fields = ['id', 'user', 'content_type', 'object_id', 'created_at']
-        read_only_fields = ['user', 'created_at']
+    class Meta(PostSerializer.Meta):
+        fields = [
+            'id', 'content', 'author', 'created_at', 'updated_at',
+            'like_count', 'is_liked', 'comment_count', 'comment_preview'
+        ]
     
-    def create(self, validated_data):
-        """
-        Create a like with concurrency protection
-        Prevents duplicate likes from the same user
-        """
-        from .models import User
-        request = self.context['request']
-        if request.user.is_authenticated:
-            validated_data['user'] = request.user
-        else:
-            demo_user, _ = User.objects.get_or_create(
-                username='demo_user',
-                defaults={'email': 'demo@example.com'}
-            )
-            validated_data['user'] = demo_user
-        
-        try:
-            with transaction.atomic():
-                return super().create(validated_data)
-        except IntegrityError:
-            # User already liked this object
-            raise serializers.ValidationError(
-                "You have already liked this content."
-            )
+    def get_comment_preview(self, obj):
+        """First top-level comments, prefetched as ``preview_comments``"""
+        comments = getattr(obj, 'preview_comments', None)
+        if comments is None:
+            return []
+        return CommentPreviewSerializer(comments, many=True, context=self.context).data
+
+
+class LikeOperationSerializer(serializers.Serializer):
+    """One queued like/unlike action"""
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+    type = serializers.ChoiceField(choices=['post', 'comment'])
+    id = serializers.IntegerField(min_value=1)
+
+
+class LikeBatchSerializer(serializers.Serializer):
+    """A burst of like/unlike actions, applied in order"""
+    operations = serializers.ListField(
+        child=LikeOperationSerializer(),
+        allow_empty=False,
+        max_length=LIKE_BATCH_MAX_SIZE
+    )
 
 
 class LeaderboardUserSerializer(serializers.ModelSerializer):
     """Specialized serializer for leaderboard data"""
     karma_24h = serializers.SerializerMethodField()
+    rank = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'username', 'karma_24h']
+        fields = ['id', 'username', 'karma_24h', 'rank']
     
     def get_karma_24h(self, obj):
         """Get karma earned in the last 24 hours"""
         # This should be calculated efficiently in the view
         # to avoid N+1 queries when getting top users
-        return getattr(obj, 'karma_24h', 0)
\ No newline at end of file
+        return getattr(obj, 'karma_24h', 0)
+    
+    def get_rank(self, obj):
+        """1-based leaderboard position, attached by the snapshot"""
+        return getattr(obj, 'rank', None)
@@ -1,3 +1,1711 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import conditional, leaderboard
+from .apps import start_background_threads
+from .benchmark import compare_reports
+from .cache import post_detail_stats
+from .events import EventHub
+from .leaderboard import get_leaderboard_snapshot, refresh_due_snapshots
+from .like_buffer import buffer_like, like_buffer, write_like_intents
+from .likes import add_like
+from .metrics import request_metrics
+from .models import User, Post, Comment, PostLike, CommentLike, KarmaBucket, LeaderboardEntry
+from .query_plans import HOT_QUERIES, explain, full_scans
+from .serializers import CommentSerializer
+from .utils import (
+    KARMA_WINDOWS,
+    adjust_like_count,
+    calculate_user_karma,
+    calculate_user_karma_24h,
+    build_comment_tree,
+    get_karma_map,
+    get_leaderboard_users
+)
+
+
+class LeaderboardQueryTests(TestCase):
+    """Leaderboard aggregation runs in SQL with a fixed number of queries"""
+
+    def setUp(self):
+        self.authors = [
+            User.objects.create(username=f'author{i}') for i in range(3)
+        ]
+        self.posts = [
+            Post.objects.create(author=author, content='post')
+            for author in self.authors
+        ]
+        self.comments = [
+            Comment.objects.create(author=author, post=self.posts[0], content='c')
+            for author in self.authors
+        ]
+
+    def _like_many(self, obj, count):
+        offset = User.objects.count()
+        likers = User.objects.bulk_create([
+            User(username=f'liker{offset + i}') for i in range(count)
+        ])
+        if isinstance(obj, Post):
+            PostLike.objects.bulk_create([PostLike(user=liker, post=obj) for liker in likers])
+        else:
+            CommentLike.objects.bulk_create([
+                CommentLike(user=liker, comment=obj) for liker in likers
+            ])
+        call_command('backfill_karma_buckets', stdout=StringIO())
+
+    def test_karma_weights_and_ordering(self):
+        self._like_many(self.posts[0], 1)          # 5
+        self._like_many(self.comments[1], 7)    # 7
+        self._like_many(self.posts[2], 1)          # 5 + 2
+        self._like_many(self.comments[2], 2)
+
+        top = get_leaderboard_users(limit=5)
+
+        self.assertEqual(
+            [(user.username, user.karma_24h) for user in top],
+            [('author1', 7), ('author2', 7), ('author0', 5)],
+        )
+
+    def test_old_likes_and_likes_on_deleted_content_are_ignored(self):
+        self._like_many(self.posts[0], 2)
+        PostLike.objects.update(created_at=timezone.now() - timedelta(hours=25))
+        call_command('backfill_karma_buckets', stdout=StringIO())
+        self._like_many(self.comments[1], 1)
+        self._like_many(self.posts[2], 3)
+        self.posts[2].delete()
+        self.assertFalse(PostLike.objects.filter(post_id=self.posts[2].id).exists())
+
+        top = get_leaderboard_users(limit=5)
+
+        self.assertEqual(
+            [(user.username, user.karma_24h) for user in top],
+            [('author1', 1)],
+        )
+
+    def test_deleting_content_or_likers_takes_their_karma_back(self):
+        self._like_many(self.posts[0], 2)          # author0: 10
+        self._like_many(self.comments[1], 3)       # author1: 3, cascaded with posts[0]
+        self._like_many(self.posts[1], 2)          # author1: 10
+        self._like_many(self.comments[2], 1)       # author2: 1, cascaded with posts[0]
+        # Whole hours come from the buckets, not the raw likes
+        for like_table in (PostLike, CommentLike):
+            like_table.objects.update(created_at=timezone.now() - timedelta(hours=3))
+        call_command('backfill_karma_buckets', stdout=StringIO())
+
+        self.posts[0].delete()
+        self.assertEqual(
+            {user.username: calculate_user_karma_24h(user) for user in self.authors},
+            {'author0': 0, 'author1': 10, 'author2': 0}
+        )
+
+        call_command('reconcile_like_counts', stdout=StringIO())  # _like_many skips counters
+        version = Post.objects.get(pk=self.posts[1].pk).version
+        PostLike.objects.filter(post=self.posts[1]).first().user.delete()
+        self.assertEqual(calculate_user_karma_24h(self.authors[1]), 5)
+        post = Post.objects.get(pk=self.posts[1].pk)
+        self.assertEqual((post.like_count, post.likes.count()), (1, 1))
+        self.assertGreater(post.version, version)
+        self.assertEqual(
+            [(user.username, user.karma_24h) for user in get_leaderboard_users(limit=5)],
+            [('author1', 5)],
+        )
+
+    def test_deleting_a_post_takes_back_comment_karma_in_constant_queries(self):
+        def thread(post, size):
+            comments = [
+                Comment.objects.create(author=self.authors[i % 3], post=post, content='c')
+                for i in range(size)
+            ]
+            for comment in comments:
+                self._like_many(comment, 1)
+            return comments
+
+        thread(self.posts[1], 3)  # One bucket per author, like the larger thread
+        thread(self.posts[2], 20)
+        self.assertEqual(
+            {user.username: calculate_user_karma_24h(user) for user in self.authors},
+            {'author0': 8, 'author1': 8, 'author2': 7}
+        )
+
+        with CaptureQueriesContext(connection) as small:
+            self.posts[1].delete()
+        with self.assertNumQueries(len(small)):
+            self.posts[2].delete()
+        self.assertEqual(
+            {user.username: calculate_user_karma_24h(user) for user in self.authors},
+            {'author0': 0, 'author1': 0, 'author2': 0}
+        )
+
+    def test_query_count_is_constant(self):
+        self._like_many(self.posts[0], 5)
+        with self.assertNumQueries(1):
+            get_leaderboard_users(limit=5)
+
+        for post in self.posts:
+            self._like_many(post, 50)
+        for comment in self.comments:
+            self._like_many(comment, 50)
+        with self.assertNumQueries(1):
+            top = get_leaderboard_users(limit=2)
+        self.assertEqual(len(top), 2)
+
+
+class KarmaWindowTests(TestCase):
+    """Hourly rollup plus raw edge likes give exact trailing-window karma"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.comment = Comment.objects.create(
+            author=self.author, post=self.post, content='comment'
+        )
+
+    def _like(self, obj, age, username):
+        liker = User.objects.create(username=username)
+        self.client.force_login(liker)
+        kind = 'posts' if isinstance(obj, Post) else 'comments'
+        response = self.client.post(f'/api/{kind}/{obj.id}/like/')
+        self.assertEqual(response.status_code, 201)
+        # Age the like and its bucket together, as if it was made ``age`` ago
+        obj.likes.filter(user=liker).update(created_at=timezone.now() - age)
+        call_command('backfill_karma_buckets', stdout=StringIO())
+
+    def test_like_and_unlike_maintain_buckets(self):
+        liker = User.objects.create(username='liker')
+        self.client.force_login(liker)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.post(f'/api/comments/{self.comment.id}/like/')
+        self.assertEqual(
+            KarmaBucket.objects.get(user=self.author).karma, 6
+        )
+        self.assertEqual(calculate_user_karma_24h(self.author), 6)
+
+        self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(calculate_user_karma_24h(self.author), 1)
+
+    def test_windows_respect_minute_precision_at_the_edge(self):
+        self._like(self.post, timedelta(minutes=10), 'a')               # 5
+        self._like(self.comment, timedelta(hours=23, minutes=50), 'b')  # 1
+        self._like(self.post, timedelta(hours=24, minutes=10), 'c')     # 5
+        self._like(self.post, timedelta(days=8), 'd')                   # 5
+
+        self.assertEqual(calculate_user_karma(self.author, timedelta(hours=1)), 5)
+        self.assertEqual(calculate_user_karma_24h(self.author), 6)
+        self.assertEqual(calculate_user_karma(self.author, timedelta(days=7)), 11)
+        self.assertEqual(calculate_user_karma(self.author, timedelta(days=30)), 16)
+
+        response = self.client.get('/api/leaderboard/?window=7d')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['leaderboard'][0]['karma_24h'], 11)
+        self.assertEqual(response.json()['period'], '7 days')
+
+    def test_unknown_window_is_rejected(self):
+        response = self.client.get('/api/leaderboard/?window=2y')
+        self.assertEqual(response.status_code, 400)
+
+
+class KarmaMapTests(TestCase):
+    """Per-author karma on serialized pages comes from one grouped query"""
+
+    def setUp(self):
+        self.authors = [User.objects.create(username=f'author{i}') for i in range(3)]
+        self.post = Post.objects.create(author=self.authors[0], content='post')
+        for author in self.authors:
+            comment = Comment.objects.create(
+                author=author, post=self.post, content='comment'
+            )
+            self.client.force_login(author)
+            self.client.post(f'/api/comments/{comment.id}/like/')
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+
+    def test_map_matches_per_user_calculation(self):
+        karma_map = get_karma_map(user.id for user in self.authors)
+        self.assertEqual(
+            karma_map,
+            {user.id: calculate_user_karma_24h(user) for user in self.authors},
+        )
+        self.assertEqual(karma_map[self.authors[0].id], 6)
+
+    def test_post_detail_uses_the_map(self):
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        karma_by_name = {
+            comment['author']['username']: comment['author']['karma_24h']
+            for comment in response.json()['comments']
+        }
+        self.assertEqual(response.json()['author']['karma_24h'], 6)
+        self.assertEqual(karma_by_name, {'author0': 6, 'author1': 1, 'author2': 1})
+
+
+class LikedObjectsTests(TestCase):
+    """is_liked is answered from one per-request lookup of the viewer's likes"""
+
+    def setUp(self):
+        self.viewer = User.objects.create(username='viewer')
+        self.post = Post.objects.create(author=self.viewer, content='post')
+        self.comments = [
+            Comment.objects.create(author=self.viewer, post=self.post, content='c')
+            for _ in range(3)
+        ]
+        self.client.force_login(self.viewer)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.post(f'/api/comments/{self.comments[1].id}/like/')
+
+    def test_flags_on_post_detail(self):
+        data = self.client.get(f'/api/posts/{self.post.id}/').json()
+        self.assertTrue(data['is_liked'])
+        self.assertEqual(
+            [comment['is_liked'] for comment in data['comments']],
+            [False, True, False],
+        )
+
+    def test_flags_on_post_list(self):
+        data = self.client.get('/api/posts/').json()
+        self.assertTrue(data['results'][0]['is_liked'])
+        self.assertEqual(
+            [comment['is_liked'] for comment in data['results'][0]['comment_preview']],
+            [False, True, False],
+        )
+
+
+class CommentTreeTests(TestCase):
+    """Comment trees of any depth render from one flat query"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+
+    def _thread(self, total, depth):
+        """Bulk-create ``total`` comments spread over ``depth`` levels"""
+        per_level = total // depth
+        parents = [None]
+        for level in range(depth):
+            comments = []
+            for i in range(per_level):
+                parent = parents[i % len(parents)]
+                path, comment_depth = Comment.thread_position(parent)
+                comments.append(Comment(
+                    author=self.author,
+                    post=self.post,
+                    parent=parent,
+                    path=path,
+                    depth=comment_depth,
+                    content=f'level {level}'
+                ))
+            parents = Comment.objects.bulk_create(comments)
+        Post.bump_version(self.post.id)  # bulk_create skips Comment.save
+
+    def _max_depth(self, comments, depth=1):
+        return max(
+            (self._max_depth(c['replies'], depth + 1) for c in comments),
+            default=depth - 1,
+        )
+
+    def test_build_comment_tree_links_every_level(self):
+        root = Comment.objects.create(author=self.author, post=self.post, content='r')
+        child = Comment.objects.create(
+            author=self.author, post=self.post, parent=root, content='c'
+        )
+        grandchild = Comment.objects.create(
+            author=self.author, post=self.post, parent=child, content='g'
+        )
+
+        with self.assertNumQueries(0):
+            roots = build_comment_tree([root, child, grandchild])
+
+        self.assertEqual(roots, [root])
+        self.assertEqual(root.prefetched_replies, [child])
+        self.assertEqual(child.prefetched_replies, [grandchild])
+        self.assertEqual(grandchild.prefetched_replies, [])
+
+    def test_post_detail_query_count_is_flat_for_deep_threads(self):
+        self._thread(total=60, depth=30)
+        self.client.get(f'/api/posts/{self.post.id}/')  # Warm per-process lookups
+        cache.clear()  # Measure the uncached build path
+        with CaptureQueriesContext(connection) as small:
+            data = self.client.get(f'/api/posts/{self.post.id}/').json()
+        self.assertEqual(self._max_depth(data['comments']), 30)
+
+        self._thread(total=5000, depth=30)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            data = self.client.get(f'/api/posts/{self.post.id}/').json()
+        self.assertEqual(data['comment_count'], Comment.objects.count())
+
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_threads_deeper_than_the_recursion_budget_render(self):
+        self._thread(total=190, depth=190)
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._max_depth(response.json()['comments']), 190)
+
+        # Rendering a subtree without build_comment_tree takes the fallback
+        root = Comment.objects.get(parent=None)
+        data = CommentSerializer(root).data
+        self.assertEqual(self._max_depth([data]), 190)
+
+
+class MaterializedPathTests(TestCase):
+    """Thread shape queries are single indexed lookups on the stored path"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.chain = []
+        parent = None
+        for level in range(4):
+            parent = Comment.objects.create(
+                author=self.author, post=self.post, parent=parent, content=f'{level}'
+            )
+            self.chain.append(parent)
+        self.sibling = Comment.objects.create(
+            author=self.author, post=self.post, parent=self.chain[1], content='s'
+        )
+        self.other_root = Comment.objects.create(
+            author=self.author, post=self.post, content='other'
+        )
+
+    def test_depth_and_ancestors(self):
+        leaf = Comment.objects.get(pk=self.chain[3].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(leaf.get_thread_depth(), 3)
+        with self.assertNumQueries(1):
+            ancestors = list(leaf.get_ancestors())
+        self.assertEqual(ancestors, self.chain[:3])
+
+    def test_descendants(self):
+        with self.assertNumQueries(1):
+            subtree = set(self.chain[1].get_descendants())
+        self.assertEqual(subtree, {self.chain[2], self.chain[3], self.sibling})
+        self.assertEqual(list(self.chain[3].get_descendants()), [])
+
+    def test_replies_stop_at_the_deepest_path_that_fits(self):
+        # Pretend the leaf sits one level above the limit
+        leaf = self.chain[3]
+        width = Comment.PATH_SEGMENT_WIDTH
+        Comment.objects.filter(pk=leaf.pk).update(
+            depth=Comment.MAX_DEPTH - 1, path='1'.zfill(width) * (Comment.MAX_DEPTH - 1)
+        )
+        response = self.client.post('/api/comments/', {
+            'post': self.post.id, 'parent': leaf.id, 'content': 'deepest'
+        })
+        self.assertEqual(response.status_code, 201)
+        deepest = Comment.objects.get(pk=response.json()['id'])
+        self.assertEqual(deepest.depth, Comment.MAX_DEPTH)
+        self.assertEqual(len(deepest.path), Comment.PATH_MAX_LENGTH)
+
+        response = self.client.post('/api/comments/', {
+            'post': self.post.id, 'parent': deepest.id, 'content': 'too deep'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.json())
+        with self.assertRaises(ValidationError):
+            Comment.objects.create(
+                author=self.author, post=self.post, parent=deepest, content='too deep'
+            )
+        self.assertFalse(Comment.objects.filter(content='too deep').exists())
+
+    def test_post_detail_collapses_below_max_depth(self):
+        data = self.client.get(f'/api/posts/{self.post.id}/?max_depth=1').json()
+        self.assertEqual([c['id'] for c in data['comments']], [self.chain[0].id, self.other_root.id])
+        self.assertEqual(
+            [c['id'] for c in data['comments'][0]['replies']], [self.chain[1].id]
+        )
+        self.assertEqual(data['comments'][0]['replies'][0]['replies'], [])
+
+
+class FeedCursorPaginationTests(TestCase):
+    """Opt-in keyset pagination walks the feed without OFFSET or COUNT"""
+
+    def setUp(self):
+        author = User.objects.create(username='author')
+        now = timezone.now()
+        posts = Post.objects.bulk_create([
+            Post(author=author, content=f'post {i}') for i in range(7)
+        ])
+        # Two posts share a timestamp so the id tie-breaker is exercised
+        for i, post in enumerate(posts):
+            Post.objects.filter(pk=post.pk).update(
+                created_at=now - timedelta(minutes=min(i, 5))
+            )
+        self.expected = list(
+            Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def test_walks_forward_and_back(self):
+        seen = []
+        url = '/api/posts/?pagination=cursor&page_size=3'
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            pages.append(data)
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next']
+        self.assertEqual(seen, self.expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        back = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(
+            [post['id'] for post in back['results']],
+            [post['id'] for post in pages[-2]['results']],
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_mode_is_unchanged(self):
+        data = self.client.get('/api/posts/?page_size=3').json()
+        self.assertEqual(data['count'], 7)
+
+
+class CommentThreadEndpointTests(TestCase):
+    """Lazy thread endpoints page siblings and expand branches on demand"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.roots = [
+            Comment.objects.create(author=self.author, post=self.post, content=f'root {i}')
+            for i in range(3)
+        ]
+        self.child = Comment.objects.create(
+            author=self.author, post=self.post, parent=self.roots[0], content='child'
+        )
+        self.grandchildren = [
+            Comment.objects.create(
+                author=self.author, post=self.post, parent=self.child, content='grandchild'
+            )
+            for _ in range(2)
+        ]
+
+    def test_post_comments_pages_top_level_and_collapses(self):
+        url = f'/api/posts/{self.post.id}/comments/?page_size=2&max_depth=1'
+        data = self.client.get(url).json()
+
+        self.assertEqual([c['id'] for c in data['results']], [r.id for r in self.roots[:2]])
+        first = data['results'][0]
+        self.assertEqual((first['reply_count'], first['more_replies']), (1, 0))
+        child = first['replies'][0]
+        self.assertEqual(child['replies'], [])
+        self.assertEqual((child['reply_count'], child['more_replies']), (2, 2))
+
+        rest = self.client.get(data['next']).json()
+        self.assertEqual([c['id'] for c in rest['results']], [self.roots[2].id])
+        self.assertIsNone(rest['next'])
+
+    def test_comment_replies_expands_a_branch(self):
+        data = self.client.get(f'/api/comments/{self.child.id}/replies/').json()
+        self.assertEqual(
+            [c['id'] for c in data['results']], [c.id for c in self.grandchildren]
+        )
+
+    def test_query_count_does_not_grow_with_thread_size(self):
+        url = f'/api/posts/{self.post.id}/comments/?max_depth=3'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+
+        parent = self.grandchildren[0]
+        for _ in range(10):
+            parent = Comment.objects.create(
+                author=self.author, post=self.post, parent=parent, content='deep'
+            )
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_rejects_bad_max_depth(self):
+        response = self.client.get(f'/api/posts/{self.post.id}/comments/?max_depth=-1')
+        self.assertEqual(response.status_code, 400)
+
+
+class SlimFeedListTests(TestCase):
+    """The feed list carries a bounded comment preview, not full trees"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.posts = [
+            Post.objects.create(author=self.author, content=f'post {i}') for i in range(3)
+        ]
+
+    def _add_comments(self, count):
+        for post in self.posts:
+            root = None
+            for i in range(count):
+                # Alternate top-level comments and replies
+                root = Comment.objects.create(
+                    author=self.author, post=post, content='c',
+                    parent=root if i % 2 else None
+                )
+
+    def test_preview_and_counts(self):
+        self._add_comments(10)
+        data = self.client.get('/api/posts/?preview=2').json()
+        post = data['results'][0]
+        self.assertNotIn('comments', post)
+        self.assertEqual(post['comment_count'], 10)
+        self.assertEqual(len(post['comment_preview']), 2)
+        self.assertTrue(all(c['parent'] is None for c in post['comment_preview']))
+
+    def test_query_count_is_bounded_by_page_size(self):
+        self._add_comments(4)
+        self.client.get('/api/posts/')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/posts/')
+
+        self._add_comments(40)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/posts/')
+
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_expand_and_sparse_fields(self):
+        self._add_comments(2)
+        expanded = self.client.get('/api/posts/?expand=comments').json()
+        self.assertIn('comments', expanded['results'][0])
+
+        sparse = self.client.get('/api/posts/?fields=id,like_count').json()
+        self.assertEqual(set(sparse['results'][0]), {'id', 'like_count'})
+
+
+class PostDetailCacheTests(TestCase):
+    """Post detail is cached per version and stays correct per viewer"""
+
+    def setUp(self):
+        cache.clear()
+        post_detail_stats.reset()
+        self.author = User.objects.create(username='author')
+        self.viewer = User.objects.create(username='viewer')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.comment = Comment.objects.create(
+            author=self.author, post=self.post, content='comment'
+        )
+        self.url = f'/api/posts/{self.post.id}/'
+
+    def test_repeat_reads_hit_the_cache(self):
+        first = self.client.get(self.url).json()
+        with CaptureQueriesContext(connection) as hit:
+            second = self.client.get(self.url).json()
+        self.assertEqual(first, second)
+        self.assertLessEqual(len(hit.captured_queries), 3)
+        self.assertEqual(
+            self.client.get('/api/posts/cache-stats/').json()['post_detail'],
+            {'hits': 1, 'misses': 1, 'hit_ratio': 0.5},
+        )
+
+    def test_writes_invalidate(self):
+        self.client.get(self.url)
+        self.client.force_login(self.viewer)
+
+        self.client.post(f'/api/comments/{self.comment.id}/like/')
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['comments'][0]['like_count'], 1)
+
+        self.client.post('/api/comments/', {
+            'post': self.post.id, 'parent': self.comment.id, 'content': 'reply'
+        })
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data['comments'][0]['replies']), 1)
+
+        self.client.delete(f'/api/comments/{self.comment.id}/')
+        self.assertEqual(self.client.get(self.url).json()['comments'], [])
+
+    def test_is_liked_is_overlaid_per_viewer(self):
+        self.client.force_login(self.viewer)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertTrue(self.client.get(self.url).json()['is_liked'])
+
+        self.client.force_login(self.author)
+        data = self.client.get(self.url).json()
+        self.assertFalse(data['is_liked'])
+        self.assertEqual(post_detail_stats.hits, 1)
+
+
+class ConditionalGetTests(TestCase):
+    """Polling endpoints answer matching validators with 304"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+
+    def _revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_feed_not_modified_until_activity(self):
+        first, again = self._revalidate('/api/posts/')
+        self.assertEqual(again.status_code, 304)
+        self.assertIn('Last-Modified', first)
+
+        Comment.objects.create(author=self.author, post=self.post, content='new')
+        changed = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_feed_304_is_one_query_and_deletions_invalidate_it(self):
+        Post.objects.create(author=self.author, content='newer')
+        first = self.client.get('/api/posts/')
+        with self.assertNumQueries(1):
+            again = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        # The oldest post carries no newer activity; only the deletion marker moves
+        Post.objects.filter(pk=self.post.pk).delete()
+        changed = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['count'], 1)
+
+    def test_post_detail_304_costs_one_query(self):
+        url = f'/api/posts/{self.post.id}/'
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        self.client.force_login(self.author)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200
+        )
+
+    def test_embedded_karma_changes_invalidate_the_post_and_feed(self):
+        other = Post.objects.create(author=self.author, content='other')
+        urls = [f'/api/posts/{self.post.id}/', '/api/posts/']
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+
+        # A like on another post changes the author's karma_24h in this payload
+        liker = User.objects.create(username='liker')
+        add_like(liker.id, Post, other.id)
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200)
+            etags[url] = response['ETag']
+        self.assertEqual(response.json()['results'][-1]['author']['karma_24h'], 5)
+
+        # The window slides even without new likes
+        index, start = conditional.karma_period()
+        later = (index + 1, start + timedelta(minutes=1))
+        with mock.patch.object(conditional, 'karma_period', return_value=later):
+            for url in urls:
+                self.assertEqual(
+                    self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 200
+                )
+
+    def test_leaderboard_not_modified_until_snapshot_refreshes(self):
+        first, again = self._revalidate('/api/leaderboard/')
+        self.assertEqual(again.status_code, 304)
+
+        self.client.force_login(self.author)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(refresh_due_snapshots(), list(KARMA_WINDOWS))
+        changed = self.client.get('/api/leaderboard/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+
+class LeaderboardSnapshotTests(TestCase):
+    """The leaderboard is served from a snapshot refreshed single-flight"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+
+    def test_fresh_snapshot_is_served_without_queries(self):
+        first = self.client.get('/api/leaderboard/')
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/leaderboard/')
+        self.assertEqual(again.json(), first.json())
+
+    def test_refresh_only_recomputes_windows_that_changed(self):
+        self.assertEqual(refresh_due_snapshots(), list(KARMA_WINDOWS))
+        self.assertEqual(refresh_due_snapshots(), [])
+
+        liker = User.objects.create(username='liker')
+        self.client.force_login(liker)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(refresh_due_snapshots(), list(KARMA_WINDOWS))
+
+        response = self.client.get('/api/leaderboard/')
+        self.assertEqual(response.json()['leaderboard'][0]['karma_24h'], 5)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        # Threads can't share the test transaction, so the query is faked
+        def slow_compute(window_key, store=False):
+            calls.append(window_key)
+            time.sleep(0.2)
+            return {'window': window_key, 'computed_at': time.time(), 'karma_version': None}
+
+        results = []
+        with mock.patch.object(leaderboard, 'compute_leaderboard_snapshot', slow_compute):
+            threads = [
+                threading.Thread(target=lambda: results.append(get_leaderboard_snapshot('24h')))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertEqual({r['computed_at'] for r in results}, {results[0]['computed_at']})
+
+    def test_stale_snapshot_is_served_while_refresh_is_in_flight(self):
+        stale = get_leaderboard_snapshot('24h')
+        with self.settings(LEADERBOARD_SNAPSHOT_MAX_AGE=0):
+            time.sleep(0.01)
+            cache.add(f'{leaderboard.snapshot_key("24h")}:lock', 'other-worker')
+            with mock.patch.object(leaderboard, 'compute_leaderboard_snapshot') as compute:
+                served = get_leaderboard_snapshot('24h')
+        compute.assert_not_called()
+        self.assertEqual(served['computed_at'], stale['computed_at'])
+
+    def test_worker_command_needs_a_shared_cache(self):
+        # The test settings use the process-local default
+        with self.assertRaisesMessage(CommandError, 'local to each process'):
+            call_command('refresh_leaderboard', once=True, stdout=StringIO())
+
+        with tempfile.TemporaryDirectory() as location:
+            shared = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}
+            with self.settings(CACHES=shared):
+                out = StringIO()
+                call_command('refresh_leaderboard', once=True, stdout=out)
+                self.assertIn('Refreshed leaderboard windows', out.getvalue())
+                self.assertTrue(get_leaderboard_snapshot('24h')['ranking_stored'])
+
+    @override_settings(LEADERBOARD_REFRESH_THREAD=True, LIKE_WRITE_BEHIND=True)
+    def test_background_threads_start_from_server_entry_points_only(self):
+        with mock.patch('feed.leaderboard.start_leaderboard_refresher') as refresher, \
+                mock.patch('feed.like_buffer.start_like_buffer_flusher') as flusher:
+            apps.get_app_config('feed').ready()
+            self.assertFalse(refresher.called or flusher.called)
+
+            start_background_threads()
+            refresher.assert_called_once_with()
+            flusher.assert_called_once_with()
+
+
+class LeaderboardRankTests(TestCase):
+    """Deep pages and per-user rank read the materialized ranking"""
+
+    def setUp(self):
+        cache.clear()
+        # author0..author6 get 7..1 likes; author7 gets none
+        self.authors = [User.objects.create(username=f'author{i}') for i in range(8)]
+        likers = User.objects.bulk_create([User(username=f'liker{i}') for i in range(7)])
+        for i, author in enumerate(self.authors[:7]):
+            post = Post.objects.create(author=author, content='post')
+            PostLike.objects.bulk_create([
+                PostLike(user=liker, post=post) for liker in likers[:7 - i]
+            ])
+        # A tie with author6 (5 karma); the lower user id ranks first
+        self.tied = User.objects.create(username='tied')
+        post = Post.objects.create(author=self.tied, content='post')
+        PostLike.objects.create(user=likers[0], post=post)
+        call_command('backfill_karma_buckets', stdout=StringIO())
+
+    def test_deep_page_continues_the_ranking(self):
+        refresh_due_snapshots()
+        top = self.client.get('/api/leaderboard/').json()['leaderboard']
+        self.assertEqual([u['rank'] for u in top], [1, 2, 3, 4, 5])
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/leaderboard/?offset=5&limit=10')
+        data = response.json()
+        self.assertEqual(data['count'], 8)
+        self.assertEqual(
+            [(u['username'], u['rank'], u['karma_24h']) for u in data['leaderboard']],
+            [('author5', 6, 10), ('author6', 7, 5), ('tied', 8, 5)]
+        )
+
+    def test_reads_never_write_the_ranking(self):
+        # Without a background refresher the snapshot is computed on read,
+        # and pages and ranks come from the live ranking
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get('/api/leaderboard/?offset=5&limit=10').json()
+            rank = self.client.get(f'/api/leaderboard/rank/{self.tied.id}/').json()
+        self.assertFalse(LeaderboardEntry.objects.exists())
+        self.assertFalse([q for q in queries if 'feed_leaderboard' in q['sql']])
+        self.assertEqual(
+            [(u['username'], u['rank']) for u in page['leaderboard']],
+            [('author5', 6), ('author6', 7), ('tied', 8)]
+        )
+        self.assertEqual((rank['rank'], rank['karma_24h']), (8, 5))
+
+    def test_stored_ranking_is_not_replaced_by_an_older_one(self):
+        now = timezone.now()
+        self.assertTrue(leaderboard.store_leaderboard_ranking('24h', [(self.tied.id, 5)], now))
+        self.assertFalse(leaderboard.store_leaderboard_ranking(
+            '24h', [(self.authors[0].id, 35)], now - timedelta(seconds=1)
+        ))
+        self.assertEqual(
+            list(LeaderboardEntry.objects.values_list('user_id', flat=True)), [self.tied.id]
+        )
+
+    def test_rank_lookup(self):
+        refresh_due_snapshots()
+        response = self.client.get(f'/api/leaderboard/rank/{self.authors[2].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rank'], 3)
+        self.assertEqual(response.json()['karma_24h'], 25)
+
+        unranked = self.client.get(f'/api/leaderboard/rank/{self.authors[7].id}/').json()
+        self.assertEqual((unranked['rank'], unranked['karma_24h']), (None, 0))
+        self.assertEqual(self.client.get('/api/leaderboard/rank/999999/').status_code, 404)
+
+    def test_invalid_page_bounds_are_rejected(self):
+        self.assertEqual(self.client.get('/api/leaderboard/?offset=-1').status_code, 400)
+        self.assertEqual(self.client.get('/api/leaderboard/?limit=x').status_code, 400)
+
+
+class LikeBatchTests(TestCase):
+    """Queued like/unlike actions apply in one request with bulk writes"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.liker = User.objects.create(username='liker')
+        self.posts = [
+            Post.objects.create(author=self.author, content=f'post {i}') for i in range(3)
+        ]
+        self.comment = Comment.objects.create(
+            author=self.author, post=self.posts[0], content='comment'
+        )
+        self.client.force_login(self.liker)
+
+    def _batch(self, operations):
+        return self.client.post(
+            '/api/likes/batch/', {'operations': operations}, content_type='application/json'
+        )
+
+    def test_operations_replay_in_order(self):
+        self.client.post(f'/api/posts/{self.posts[2].id}/like/')
+        response = self._batch([
+            {'action': 'like', 'type': 'post', 'id': self.posts[0].id},
+            {'action': 'like', 'type': 'post', 'id': self.posts[0].id},
+            {'action': 'like', 'type': 'comment', 'id': self.comment.id},
+            {'action': 'like', 'type': 'post', 'id': self.posts[1].id},
+            {'action': 'unlike', 'type': 'post', 'id': self.posts[1].id},
+            {'action': 'unlike', 'type': 'post', 'id': self.posts[2].id},
+            {'action': 'like', 'type': 'post', 'id': 999999},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(r['status'], r['like_count']) for r in response.json()['results']],
+            [('liked', 1), ('already_liked', 1), ('liked', 1), ('liked', 0),
+             ('unliked', 0), ('unliked', 0), ('not_found', None)]
+        )
+
+        self.assertEqual(self.liker.post_likes.count(), 1)
+        self.assertEqual(self.liker.comment_likes.count(), 1)
+        self.assertEqual(
+            [Post.objects.get(pk=p.pk).like_count for p in self.posts], [1, 0, 0]
+        )
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 1)
+        self.assertEqual(KarmaBucket.objects.get(user=self.author).karma, 6)
+        self.assertEqual(calculate_user_karma_24h(self.author), 6)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        operations = [
+            {'action': 'like', 'type': 'post', 'id': post.id} for post in self.posts
+        ]
+        self._batch(operations[:1])
+        PostLike.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as small:
+            self._batch(operations[:1])
+        PostLike.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self._batch(operations)
+        self.assertEqual(len(large), len(small))
+
+    def test_anonymous_batches_use_the_cached_demo_user(self):
+        self.client.logout()
+        operation = {'action': 'like', 'type': 'post', 'id': self.posts[0].id}
+        self._batch([operation])  # Resolves demo_user once per process
+        with CaptureQueriesContext(connection) as queries:
+            response = self._batch([operation])
+        self.assertEqual(response.json()['results'][0]['status'], 'already_liked')
+        self.assertFalse(any('feed_user' in q['sql'] for q in queries))
+        self.assertEqual(
+            PostLike.objects.get(post=self.posts[0]).user.username, 'demo_user'
+        )
+
+    def test_invalid_operations_are_rejected(self):
+        self.assertEqual(self._batch([]).status_code, 400)
+        self.assertEqual(
+            self._batch([{'action': 'love', 'type': 'post', 'id': 1}]).status_code, 400
+        )
+
+
+class LikeWritePathTests(TestCase):
+    """Likes are written without a read-before-write, on either path"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.liker = User.objects.create(username='liker')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.comment = Comment.objects.create(
+            author=self.author, post=self.post, content='comment'
+        )
+
+    def _like_and_unlike(self):
+        self.client.force_login(self.liker)
+        post_url = f'/api/posts/{self.post.id}'
+        comment_url = f'/api/comments/{self.comment.id}'
+
+        self.assertEqual(self.client.post(f'{post_url}/like/').json()['like_count'], 1)
+        again = self.client.post(f'{post_url}/like/')
+        self.assertEqual((again.status_code, again.json()['like_count']), (400, 1))
+        self.assertEqual(self.client.post(f'{comment_url}/like/').status_code, 201)
+        self.assertEqual(calculate_user_karma_24h(self.author), 6)
+        self.assertEqual(KarmaBucket.objects.get(user=self.author).karma, 6)
+
+        response = self.client.delete(f'{post_url}/unlike/')
+        self.assertEqual((response.status_code, response.json()['like_count']), (200, 0))
+        self.assertEqual(self.client.delete(f'{post_url}/unlike/').status_code, 400)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 0)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 1)
+        self.assertEqual(KarmaBucket.objects.get(user=self.author).karma, 1)
+        self.assertEqual(self.client.post('/api/posts/999999/like/').status_code, 404)
+
+    def test_returning_path(self):
+        self._like_and_unlike()
+
+    def test_orm_fallback_path(self):
+        with mock.patch('feed.likes.fast_path_available', return_value=False):
+            self._like_and_unlike()
+
+    def test_like_is_a_few_statements_with_a_cached_principal(self):
+        url = f'/api/posts/{self.post.id}/like/'
+        # Resolves demo_user and warms the content type cache
+        self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(url).status_code, 201)
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 3)  # insert, counter, karma upsert
+        self.assertFalse(any('feed_user' in sql for sql in statements))
+
+
+class LikeCounterTests(TestCase):
+    """Stored like counters move atomically and can be reconciled"""
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.comment = Comment.objects.create(
+            author=self.author, post=self.post, content='comment'
+        )
+
+    def test_adjust_like_count_updates_in_sql_without_reading(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(adjust_like_count(Post, self.post.pk, 3), 1)
+        # A second writer holding an outdated instance still adds to the row
+        adjust_like_count(Post, stale.pk, -1)
+        adjust_like_count(Comment, self.comment.pk, 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 2)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 1)
+        self.assertEqual(adjust_like_count(Post, 999999, 1), 0)
+
+    def test_reconcile_rewrites_drifted_counters(self):
+        liker = User.objects.create(username='liker')
+        other_post = Post.objects.create(author=self.author, content='other')
+        PostLike.objects.create(user=liker, post=self.post)
+        CommentLike.objects.create(user=liker, comment=self.comment)
+        Post.objects.filter(pk=self.post.pk).update(like_count=4)
+        Post.objects.filter(pk=other_post.pk).update(like_count=2)
+        Comment.objects.filter(pk=self.comment.pk).update(like_count=0)
+
+        out = StringIO()
+        call_command('reconcile_like_counts', stdout=out)
+        self.assertIn('Post: 2 drifted counter(s) fixed', out.getvalue())
+        self.assertIn('Comment: 1 drifted counter(s) fixed', out.getvalue())
+        self.assertEqual(
+            dict(Post.objects.values_list('id', 'like_count')),
+            {self.post.pk: 1, other_post.pk: 0}
+        )
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).like_count, 1)
+
+        out = StringIO()
+        call_command('reconcile_like_counts', dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue().count(': 0 drifted'), 2)
+
+
+@override_settings(LIKE_WRITE_BEHIND=True)
+class LikeBufferTests(TestCase):
+    """Write-behind likes answer immediately and flush as one batch"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+        self.comment = Comment.objects.create(
+            author=self.author, post=self.post, content='comment'
+        )
+        self.likers = [User.objects.create(username=f'liker{i}') for i in range(5)]
+
+    def tearDown(self):
+        like_buffer.flush()
+
+    def _as(self, user, method, url):
+        self.client.force_login(user)
+        return getattr(self.client, method)(url)
+
+    def test_likes_are_queued_then_flushed_with_one_counter_write(self):
+        url = f'/api/posts/{self.post.id}/like/'
+        for i, liker in enumerate(self.likers, start=1):
+            response = self._as(liker, 'post', url)
+            self.assertEqual((response.status_code, response.json()['like_count']), (202, i))
+        duplicate = self._as(self.likers[0], 'post', url)
+        self.assertEqual((duplicate.status_code, duplicate.json()['like_count']), (400, 5))
+        self.assertFalse(PostLike.objects.exists())
+
+        # Reads merge the buffer: the viewer sees their like and the count
+        detail = self._as(self.likers[0], 'get', f'/api/posts/{self.post.id}/').json()
+        self.assertEqual((detail['like_count'], detail['is_liked']), (5, True))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(like_buffer.flush(), 5)
+        counter_writes = [q for q in queries if q['sql'].startswith('UPDATE "feed_post"')]
+        self.assertEqual(len(counter_writes), 2)  # like_count deltas, then version bump
+
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 5)
+        self.assertEqual(PostLike.objects.count(), 5)
+        self.assertEqual(KarmaBucket.objects.get(user=self.author).karma, 25)
+        detail = self.client.get(f'/api/posts/{self.post.id}/').json()
+        self.assertEqual(detail['like_count'], 5)
+
+    def test_like_then_unlike_in_one_interval_cancels_out(self):
+        liker = self.likers[0]
+        self._as(liker, 'post', f'/api/comments/{self.comment.id}/like/')
+        response = self._as(liker, 'delete', f'/api/comments/{self.comment.id}/unlike/')
+        self.assertEqual((response.status_code, response.json()['like_count']), (202, 0))
+        self.assertEqual(len(like_buffer), 0)
+        self.assertEqual(like_buffer.flush(), 0)
+
+    def test_unlike_of_a_stored_like_is_flushed(self):
+        with override_settings(LIKE_WRITE_BEHIND=False):
+            self._as(self.likers[0], 'post', f'/api/posts/{self.post.id}/like/')
+        response = self._as(self.likers[0], 'delete', f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual((response.status_code, response.json()['like_count']), (202, 0))
+        self.assertEqual(
+            self._as(self.likers[0], 'delete', f'/api/posts/{self.post.id}/unlike/').status_code,
+            400
+        )
+        like_buffer.flush()
+        self.assertFalse(PostLike.objects.exists())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 0)
+        self.assertEqual(calculate_user_karma_24h(self.author), 0)
+
+    def test_flush_skips_likes_written_elsewhere_meanwhile(self):
+        liker = self.likers[0]
+        for fast_path in (True, False):
+            with self.subTest(fast_path=fast_path):
+                PostLike.objects.all().delete()
+                KarmaBucket.objects.all().delete()
+                Post.objects.filter(pk=self.post.pk).update(like_count=0)
+                self.assertEqual(
+                    self._as(liker, 'post', f'/api/posts/{self.post.id}/like/').status_code, 202
+                )
+                # Another worker process (or the batch endpoint) stores the same like first
+                add_like(liker.id, Post, self.post.id)
+                with mock.patch('feed.utils.fast_path_available', return_value=fast_path):
+                    self.assertEqual(like_buffer.flush(), 0)
+                self.assertEqual(PostLike.objects.count(), 1)
+                self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 1)
+                self.assertEqual(KarmaBucket.objects.get(user=self.author).karma, 5)
+
+
+@override_settings(LIKE_WRITE_BEHIND=True)
+class LikeBufferCommitTests(TransactionTestCase):
+    """Counts read around a real commit never double or go backwards"""
+
+    def test_in_flight_deltas_are_dropped_when_the_flush_commits(self):
+        author = User.objects.create(username='author')
+        liker = User.objects.create(username='liker')
+        post = Post.objects.create(author=author, content='post')
+        buffer_like(liker.id, Post, post.id, True)
+
+        def visible_count():
+            stored = Post.objects.values_list('like_count', flat=True).get(pk=post.pk)
+            return stored + like_buffer.count_delta('post', post.id)
+
+        seen = []
+        def write_and_watch(intents):
+            seen.append(visible_count())
+            changed = write_like_intents(intents)
+            transaction.on_commit(lambda: seen.append(visible_count()))
+            return changed
+
+        with mock.patch('feed.like_buffer.write_like_intents', side_effect=write_and_watch):
+            self.assertEqual(like_buffer.flush(), 1)
+        seen.append(visible_count())
+        self.assertEqual(seen, [1, 1, 1])
+
+
+class AsyncViewTests(TestCase):
+    """The async read endpoints mirror the DRF ones"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.liker = User.objects.create(username='liker')
+        self.posts = [
+            Post.objects.create(author=self.author, content=f'post {i}') for i in range(3)
+        ]
+        reply_to = None
+        for i in range(4):
+            reply_to = Comment.objects.create(
+                author=self.author, post=self.posts[0], parent=reply_to, content=f'c{i}'
+            )
+        self.client.force_login(self.liker)
+        self.client.post(f'/api/posts/{self.posts[0].id}/like/')
+        self.client.post(f'/api/comments/{reply_to.id}/like/')
+        self.async_client.force_login(self.liker)
+
+    def _without_links(self, data):
+        return {key: value for key, value in data.items() if key not in ('next', 'previous')}
+
+    async def _assert_mirrors(self, sync_url, async_url):
+        expected = await sync_to_async(self.client.get)(sync_url)
+        response = await self.async_client.get(async_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        again = await self.async_client.get(async_url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+        return response
+
+    @override_settings(ASYNC_PARALLEL_QUERIES=False)
+    async def test_post_list(self):
+        response = await self.async_client.get('/api/async/posts/?page_size=2')
+        expected = await sync_to_async(self.client.get)('/api/posts/?page_size=2')
+        self.assertEqual(self._without_links(response.json()), self._without_links(expected.json()))
+        self.assertIn('/api/async/posts/?page=2', response.json()['next'])
+        last = await self.async_client.get('/api/async/posts/?page_size=2&page=2')
+        self.assertTrue(last.json()['results'][0]['is_liked'])
+        self.assertEqual(last.json()['results'][0]['like_count'], 1)
+        missing = await self.async_client.get('/api/async/posts/?page=9')
+        self.assertEqual(missing.status_code, 404)
+
+    @override_settings(ASYNC_PARALLEL_QUERIES=False)
+    async def test_post_list_cursor_pages(self):
+        query = '?pagination=cursor&page_size=2'
+        response = await self.async_client.get(f'/api/async/posts/{query}')
+        expected = await sync_to_async(self.client.get)(f'/api/posts/{query}')
+        self.assertEqual(response.json()['results'], expected.json()['results'])
+        self.assertNotIn('count', response.json())
+        self.assertIsNone(response.json()['previous'])
+
+        following = await self.async_client.get(response.json()['next'])
+        expected = await sync_to_async(self.client.get)(expected.json()['next'])
+        self.assertEqual(self._without_links(following.json()), self._without_links(expected.json()))
+        self.assertEqual(
+            [post['id'] for post in following.json()['results']], [self.posts[0].id]
+        )
+        self.assertIsNone(following.json()['next'])
+        bad = await self.async_client.get('/api/async/posts/?cursor=bogus')
+        self.assertEqual(bad.status_code, 404)
+
+    @override_settings(ASYNC_PARALLEL_QUERIES=False)
+    async def test_post_detail(self):
+        post_id = self.posts[0].id
+        response = await self._assert_mirrors(
+            f'/api/posts/{post_id}/?max_depth=2', f'/api/async/posts/{post_id}/?max_depth=2'
+        )
+        self.assertTrue(response.json()['is_liked'])
+        missing = await self.async_client.get('/api/async/posts/999999/')
+        self.assertEqual(missing.status_code, 404)
+
+    @override_settings(ASYNC_PARALLEL_QUERIES=False)
+    async def test_leaderboard(self):
+        await self._assert_mirrors('/api/leaderboard/?window=7d', '/api/async/leaderboard/?window=7d')
+        bad = await self.async_client.get('/api/async/leaderboard/?window=2y')
+        self.assertEqual(bad.status_code, 400)
+
+
+class AsyncParallelQueryTests(TransactionTestCase):
+    """Independent queries run on their own connections and still agree"""
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=author, content='post')
+        Comment.objects.create(author=author, post=self.post, content='comment')
+
+    def test_detail_with_parallel_queries(self):
+        sync = self.client.get(f'/api/posts/{self.post.id}/').json()
+        cache.clear()
+        response = async_to_sync(self.async_client.get)(f'/api/async/posts/{self.post.id}/')
+        self.assertEqual(response.json(), sync)
+        listing = async_to_sync(self.async_client.get)('/api/async/posts/')
+        self.assertEqual(listing.json()['count'], 1)
+
+
+@override_settings(STREAM_TICK_SECONDS=0.01)
+class LiveStreamTests(TestCase):
+    """The SSE stream coalesces like counts and new comments per tick"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=self.author, content='post')
+
+    def _delta(self, frame):
+        event, data = frame.strip().split('\n')
+        self.assertEqual(event, 'event: delta')
+        return json.loads(data[len('data: '):])
+
+    def test_publishing_without_subscribers_is_dropped(self):
+        hub = EventHub()
+        hub.publish_like('post', self.post.id, 1)
+        hub.publish_comment(self.post.id, 1)
+        self.assertIsNone(hub.tick())
+
+    async def test_deltas_are_coalesced_per_object(self):
+        hub = EventHub()
+        subscriber = hub.subscribe()
+        try:
+            for like_count in (1, 2, 3):
+                hub.publish_like('post', 7, like_count)
+            hub.publish_like('comment', 9, 1)
+            hub.publish_comment(7, 11)
+            hub.publish_comment(7, 12)
+            frame = await sync_to_async(hub.tick)()
+            self.assertEqual(self._delta(frame), {
+                'likes': {'post': {'7': 3}, 'comment': {'9': 1}},
+                'comments': {'7': [11, 12]}
+            })
+            self.assertIsNone(await sync_to_async(hub.tick)())
+        finally:
+            hub.unsubscribe(subscriber)
+
+    def test_leaderboard_change_is_detected(self):
+        hub = EventHub()
+        refresh_due_snapshots(force=True)
+        self.assertEqual(hub.leaderboard_changes(), {})
+
+        liker = User.objects.create(username='liker')
+        self.client.force_login(liker)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        refresh_due_snapshots(force=True)
+        changes = hub.leaderboard_changes()
+        self.assertIn('24h', changes)
+        self.assertEqual(changes['24h']['leaderboard'][0]['id'], self.author.id)
+        self.assertEqual(hub.leaderboard_changes(), {})
+
+    async def test_stream_pushes_likes_and_comments(self):
+        response = await self.async_client.get('/api/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = aiter(response.streaming_content)
+        try:
+            self.assertTrue((await anext(frames)).startswith(b'retry:'))
+            await sync_to_async(self.client.post)(f'/api/posts/{self.post.id}/like/')
+            await sync_to_async(self.client.post)(
+                '/api/comments/', {'post': self.post.id, 'content': 'hi'}
+            )
+            comment_id = await Comment.objects.values_list('id', flat=True).aget()
+
+            received = {}
+            while 'comments' not in received:
+                frame = await asyncio.wait_for(anext(frames), 5)
+                if frame.startswith(b'event: delta'):
+                    received.update(self._delta(frame.decode()))
+            self.assertEqual(received['likes'], {'post': {str(self.post.id): 1}})
+            self.assertEqual(received['comments'], {str(self.post.id): [comment_id]})
+        finally:
+            await frames.aclose()
+
+    def test_stream_needs_asgi(self):
+        response = self.client.get('/api/stream/')
+        self.assertEqual(response.status_code, 501)
+
+
+class RequestMetricsTests(TestCase):
+    """Per-route query counts and latencies, exported for Prometheus"""
+
+    def setUp(self):
+        cache.clear()
+        request_metrics.reset()
+        author = User.objects.create(username='author')
+        self.post = Post.objects.create(author=author, content='post')
+        Comment.objects.create(author=author, post=self.post, content='comment')
+
+    def _samples(self):
+        text = self.client.get('/api/_metrics').content.decode()
+        return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+    def test_records_queries_per_route(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        samples = self._samples()
+        labels = '{route="posts-detail",method="GET"}'
+        self.assertEqual(samples[f'feed_request_duration_seconds_count{labels}'], '1')
+        self.assertGreater(int(samples[f'feed_request_queries_sum{labels}']), 0)
+        self.assertGreater(float(samples[f'feed_request_sql_seconds_total{labels}']), 0)
+        self.assertGreater(int(samples[f'feed_response_bytes_total{labels}']), 0)
+        self.assertGreater(float(samples[f'feed_request_render_seconds_total{labels}']), 0)
+        self.assertEqual(
+            samples['feed_request_duration_seconds_bucket{route="posts-detail",method="GET",le="+Inf"}'],
+            '1'
+        )
+
+    @override_settings(ASYNC_PARALLEL_QUERIES=False)
+    def test_records_async_views(self):
+        async_to_sync(self.async_client.get)('/api/async/posts/')
+        samples = self._samples()
+        self.assertGreater(
+            int(samples['feed_request_queries_sum{route="async-posts-list",method="GET"}']), 0
+        )
+
+    @override_settings(QUERY_BUDGETS={'posts-list': 1})
+    def test_warns_over_query_budget(self):
+        with self.assertLogs('feed.middleware', 'WARNING') as logs:
+            self.client.get('/api/posts/')
+        self.assertIn('budget 1 for posts-list', logs.output[0])
+        samples = self._samples()
+        self.assertEqual(
+            samples['feed_query_budget_exceeded_total{route="posts-list",method="GET"}'], '1'
+        )
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_can_be_disabled(self):
+        self.client.get('/api/posts/')
+        self.assertNotIn('route="posts-list"', self.client.get('/api/_metrics').content.decode())
+
+
+class QueryBudgetRegressionTests(TestCase):
+    """
+    Exact query budgets for every feed endpoint, asserted against seeded
+    data and again after every table has grown 10x. A per-row query
+    anywhere (an N+1 in a serializer, a missing prefetch) changes the
+    count at the larger volume and fails here.
+    """
+    GROWTH = 10
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create(username='viewer')
+        self.client.force_login(self.viewer)
+        self.thread_author = User.objects.create(username='thread_author')
+        self.post = Post.objects.create(author=self.thread_author, content='deep thread')
+        self.thread_tip = None
+        self.batches = 0
+        self.grow(1)
+
+    def grow(self, batches):
+        """
+        Add ``batches`` units of data: 3 authors with 2 posts each, a short
+        thread under every new post, 3 more levels on the deep thread, and
+        likes from every author on every new post and comment
+        """
+        for _ in range(batches):
+            batch = self.batches
+            self.batches += 1
+            authors = User.objects.bulk_create([
+                User(username=f'author_{batch}_{i}') for i in range(3)
+            ])
+            posts = [
+                Post.objects.create(author=author, content=f'post {batch}')
+                for author in authors for _ in range(2)
+            ]
+            comments = []
+            for post in posts:
+                parent = None
+                for depth in range(2):
+                    parent = Comment.objects.create(
+                        author=authors[depth], post=post, parent=parent, content='reply'
+                    )
+                    comments.append(parent)
+            for depth in range(3):
+                self.thread_tip = Comment.objects.create(
+                    author=authors[depth], post=self.post, parent=self.thread_tip, content='deeper'
+                )
+                comments.append(self.thread_tip)
+            for liker in authors:
+                for post in posts:
+                    add_like(liker.id, Post, post.id)
+                for comment in comments:
+                    add_like(liker.id, Comment, comment.id)
+            add_like(self.viewer.id, Post, posts[0].id)
+            add_like(self.viewer.id, Comment, comments[0].id)
+
+    def assertFlatQueries(self, budget, request, warm=False):
+        """
+        ``request()`` runs exactly ``budget`` queries before and after 10x
+        growth; with ``warm`` it is called once unmeasured first
+        """
+        for batches in (0, self.GROWTH - 1):
+            self.grow(batches)
+            cache.clear()
+            if warm:
+                request()
+            with self.assertNumQueries(budget):
+                response = request()
+            self.assertLess(response.status_code, 400)
+
+    def test_post_list(self):
+        self.assertFlatQueries(8, lambda: self.client.get('/api/posts/'))
+
+    def test_post_list_with_cursor(self):
+        self.assertFlatQueries(7, lambda: self.client.get('/api/posts/?pagination=cursor'))
+
+    def test_post_list_with_expanded_comments(self):
+        self.assertFlatQueries(9, lambda: self.client.get('/api/posts/?expand=comments'))
+
+    def test_post_detail_with_deep_thread(self):
+        self.assertFlatQueries(8, lambda: self.client.get(f'/api/posts/{self.post.id}/'))
+
+    def test_post_detail_cache_hit(self):
+        self.assertFlatQueries(
+            4, lambda: self.client.get(f'/api/posts/{self.post.id}/'), warm=True
+        )
+
+    def test_post_comments(self):
+        self.assertFlatQueries(
+            8, lambda: self.client.get(f'/api/posts/{self.post.id}/comments/?max_depth=5')
+        )
+
+    def test_leaderboard(self):
+        # Snapshots computed on read never write the ranking
+        self.assertFlatQueries(5, lambda: self.client.get('/api/leaderboard/'))
+        # A fresh snapshot costs only the session lookups
+        self.assertFlatQueries(2, lambda: self.client.get('/api/leaderboard/'), warm=True)
+        self.assertFlatQueries(7, lambda: self.client.get('/api/leaderboard/?offset=5&limit=20'))
+        self.assertFlatQueries(
+            7, lambda: self.client.get(f'/api/leaderboard/rank/{self.thread_author.id}/')
+        )
+
+    def test_like_and_unlike(self):
+        # One request per assertion: each request resets the connection's query log
+        for batches in (0, self.GROWTH - 1):
+            self.grow(batches)
+            targets = (
+                (f'/api/posts/{self.post.id}/', 7),
+                # A comment like also moves its post to a new cache version
+                (f'/api/comments/{self.thread_tip.id}/', 8)
+            )
+            for url, budget in targets:
+                with self.assertNumQueries(budget):
+                    self.assertEqual(self.client.post(f'{url}like/').status_code, 201)
+                with self.assertNumQueries(budget):
+                    self.assertEqual(self.client.delete(f'{url}unlike/').status_code, 200)
+
+    def test_like_batch(self):
+        def batch():
+            operations = [
+                {'action': action, 'type': 'post', 'id': post_id}
+                for post_id in Post.objects.order_by('-id').values_list('id', flat=True)[:10]
+                for action in ('like', 'unlike')
+            ]
+            return self.client.post(
+                '/api/likes/batch/', {'operations': operations}, content_type='application/json'
+            )
+
+        self.assertFlatQueries(12, batch)
+
+
+class GenerateFeedDataTests(TestCase):
+    """Generated feeds are internally consistent and fixed by the seed"""
+
+    def setUp(self):
+        cache.clear()
+
+    def generate(self, **options):
+        call_command(
+            'generate_feed_data', users=20, posts=30, comments=300, likes=400, seed=7,
+            stdout=StringIO(), **options
+        )
+
+    def test_threads_counters_and_karma_are_consistent(self):
+        self.generate(max_depth=3)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(PostLike.objects.count() + CommentLike.objects.count(), 400)
+
+        replies = Comment.objects.filter(depth__gt=0).select_related('parent')
+        self.assertTrue(replies)
+        for reply in replies:
+            self.assertEqual(reply.path, reply.parent.subtree_prefix)
+            self.assertEqual(reply.depth, reply.parent.depth + 1)
+            self.assertEqual(reply.post_id, reply.parent.post_id)
+            self.assertGreaterEqual(reply.created_at, reply.parent.created_at)
+        self.assertLessEqual(max(reply.depth for reply in replies), 3)
+
+        out = StringIO()
+        call_command('reconcile_like_counts', dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue().count(': 0 drifted'), 2)
+
+        def buckets():
+            return set(KarmaBucket.objects.values_list('user_id', 'bucket_start', 'karma'))
+
+        generated = buckets()
+        call_command('backfill_karma_buckets', stdout=StringIO())
+        self.assertEqual(buckets(), generated)
+
+    def test_same_seed_generates_the_same_feed(self):
+        def shape():
+            return (
+                list(Post.objects.order_by('id').values_list('like_count', flat=True)),
+                list(Comment.objects.order_by('id').values_list('depth', 'like_count')),
+            )
+
+        self.generate()
+        first = shape()
+        User.objects.all().delete()
+        PostLike.objects.all().delete()
+        CommentLike.objects.all().delete()
+        self.generate()
+        self.assertEqual(shape(), first)
+
+    def test_existing_prefix_is_rejected(self):
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class BenchmarkTests(TransactionTestCase):
+    """The API benchmark reports per endpoint and flags regressions between runs"""
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        post = Post.objects.create(author=author, content='post')
+        comment = Comment.objects.create(author=author, post=post, content='comment')
+        Comment.objects.create(author=author, post=post, parent=comment, content='reply')
+        add_like(author.id, Comment, comment.id)
+
+    def report(self, **metrics):
+        endpoint = {
+            'throughput_rps': 100.0, 'p50_ms': 5.0, 'p95_ms': 10.0, 'p99_ms': 20.0,
+            'queries_per_request': 4.0, 'peak_rss_mb': 80.0,
+        }
+        endpoint.update(metrics)
+        return {'endpoints': {'feed': endpoint}}
+
+    def test_compare_flags_extra_queries_and_slowdowns(self):
+        baseline = self.report()
+
+        def regressed(current):
+            rows = compare_reports(baseline, current, threshold=0.10)
+            return {metric for _, metric, _, _, _, flagged in rows if flagged}
+
+        self.assertEqual(regressed(self.report(p95_ms=10.5, throughput_rps=95.0)), set())
+        self.assertEqual(regressed(self.report(queries_per_request=5.0)), {'queries_per_request'})
+        self.assertEqual(
+            regressed(self.report(p95_ms=12.0, throughput_rps=80.0)),
+            {'p95_ms', 'throughput_rps'}
+        )
+        self.assertEqual(regressed(self.report(p99_ms=10.0, peak_rss_mb=60.0)), set())
+
+    def test_in_process_run_writes_a_comparable_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'benchmark_api', requests=4, warmup=0, concurrency=2,
+                endpoints='feed,post_detail,comment_replies,leaderboard',
+                output=output, stdout=StringIO()
+            )
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+            self.assertEqual(report['meta']['mode'], 'in-process')
+            self.assertEqual(report['meta']['rows'], {'posts': 1, 'comments': 2, 'likes': 1})
+            self.assertEqual(
+                set(report['endpoints']),
+                {'feed', 'post_detail', 'comment_replies', 'leaderboard'}
+            )
+            for result in report['endpoints'].values():
+                self.assertEqual(result['requests'], 4)
+                self.assertEqual(result['errors'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(report['endpoints']['feed']['queries_per_request'], 0)
+
+            out = StringIO()
+            call_command('benchmark_api', compare=[output, output], stdout=out)
+            self.assertIn('No regressions', out.getvalue())
+
+            worse = dict(report)
+            worse['endpoints'] = {
+                name: dict(result, queries_per_request=result['queries_per_request'] + 1)
+                for name, result in report['endpoints'].items()
+            }
+            current = os.path.join(tmp, 'current.json')
+            with open(current, 'w') as report_file:
+                json.dump(worse, report_file)
+            with self.assertRaises(CommandError):
+                call_command('benchmark_api', compare=[output, current], stdout=StringIO())
+
+    def test_unknown_endpoint_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_api', endpoints='feed,nope', stdout=StringIO())
+
+
+class QueryPlanTests(TestCase):
+    """Hot queries are planned on indexes, and the checker catches ones that aren't"""
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        reader = User.objects.create(username='reader')
+        post = Post.objects.create(author=author, content='post')
+        comment = Comment.objects.create(author=author, post=post, content='comment')
+        Comment.objects.create(author=reader, post=post, parent=comment, content='reply')
+        add_like(reader.id, Post, post.id)
+        add_like(reader.id, Comment, comment.id)
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        return explain(sql, params)
+
+    def test_every_hot_query_uses_an_index(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('skipped', out.getvalue())
+        self.assertIn(f'from {len(HOT_QUERIES)} hot query path(s) use indexes', out.getvalue())
+
+    def test_full_scans_are_detected(self):
+        self.assertEqual(full_scans(self.plan(Post.objects.filter(content='post'))), ['feed_post'])
+        # A page read in index order stops at the LIMIT; a sorted one reads every row
+        newest = Post.objects.order_by('-created_at', '-id')[:20]
+        self.assertEqual(full_scans(self.plan(newest), limited=True), [])
+        self.assertEqual(full_scans(self.plan(newest)), ['feed_post'])
+        by_content = Post.objects.order_by('content')[:20]
+        self.assertEqual(full_scans(self.plan(by_content), limited=True), ['feed_post'])
+
+    def test_unindexed_hot_query_fails_the_check(self):
+        def probe(sample):
+            list(Comment.objects.filter(content='reply'))
+
+        with mock.patch.dict(HOT_QUERIES, {'by_content': (probe, frozenset())}):
+            with self.assertRaisesMessage(CommandError, '1 statement(s)'):
+                call_command('check_query_plans', queries='by_content', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('check_query_plans', queries='feed_page,nope', stdout=StringIO())
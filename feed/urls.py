@@ -1,12 +1,21 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r'posts', views.PostViewSet, basename='posts')
 router.register(r'comments', views.CommentViewSet, basename='comments')
+router.register(r'likes', views.LikeViewSet, basename='likes')
 router.register(r'leaderboard', views.LeaderboardViewSet, basename='leaderboard')
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    # Async mirrors of the read endpoints, for ASGI deployments
+    path('api/async/posts/', async_views.post_list, name='async-posts-list'),
+    path('api/async/posts/<int:pk>/', async_views.post_detail, name='async-posts-detail'),
+    path('api/async/leaderboard/', async_views.leaderboard, name='async-leaderboard'),
+    # Server-Sent Events: live like counts, new comments, leaderboard changes
+    path('api/stream/', async_views.stream, name='stream'),
+    # Prometheus scrape target for the per-route request metrics
+    path('api/_metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
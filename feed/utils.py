@@ -1,155 +1,721 @@
 from django.utils import timezone
-from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Sum, Case, When, IntegerField, Count
-from django.db import models
+from django.db.models import Q, Sum, Case, When, CharField, IntegerField, Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, TruncHour
+from django.db import connection, models, transaction, IntegrityError
+from collections import defaultdict
 from datetime import timedelta
 
-from .models import Like, Post, Comment
+from .models import Post, Comment, PostLike, CommentLike, KarmaBucket
 
 User = get_user_model()
 
+POST_LIKE_KARMA = 5
+COMMENT_LIKE_KARMA = 1
 
-def calculate_user_karma_24h(user):
+# Top-level comments shown per post in the slim feed list
+COMMENT_PREVIEW_SIZE = 3
+MAX_COMMENT_PREVIEW_SIZE = 10
+
+# Most operations accepted by one /api/likes/batch/ request
+LIKE_BATCH_MAX_SIZE = 100
+
+# Backends whose like writes use ON CONFLICT / RETURNING instead of the ORM
+FAST_PATH_VENDORS = ('postgresql', 'sqlite')
+
+# Rows per multi-row like INSERT/DELETE, well under SQLite's bound-parameter limit
+LIKE_WRITE_CHUNK_SIZE = 500
+
+# Like targets and their like tables, keyed by kind ('post' or 'comment').
+# Each like table's foreign key to its target is named after the kind.
+LIKE_MODELS = {'post': Post, 'comment': Comment}
+LIKE_TABLES = {'post': PostLike, 'comment': CommentLike}
+
+# Supported leaderboard/karma windows: query param -> (span, label)
+KARMA_WINDOWS = {
+    '1h': (timedelta(hours=1), '1 hour'),
+    '24h': (timedelta(hours=24), '24 hours'),
+    '7d': (timedelta(days=7), '7 days'),
+    '30d': (timedelta(days=30), '30 days'),
+}
+
+
+def adjust_like_count(model, object_id, delta):
     """
-    Calculate karma earned by a user in the last 24 hours
-    Uses efficient aggregation instead of storing daily karma
-    """
-    cutoff_time = timezone.now() - timedelta(hours=24)
-    
-    post_content_type = ContentType.objects.get_for_model(Post)
-    comment_content_type = ContentType.objects.get_for_model(Comment)
-    
-    # Get likes on user's content in the last 24 hours
-    karma_query = Like.objects.filter(
-        created_at__gte=cutoff_time
-    ).filter(
-        Q(
-            content_type=post_content_type,
-            object_id__in=user.posts.values_list('id', flat=True)
-        ) |
-        Q(
-            content_type=comment_content_type,
-            object_id__in=user.comments.values_list('id', flat=True)
-        )
+    Atomically shift the stored like counter on a Post or Comment
+    Must run inside the same transaction as the like insert/delete
+    """
+    return model.objects.filter(pk=object_id).update(
+        like_count=F('like_count') + delta
     )
+
+
+def like_count_subquery(model):
+    """
+    Correlated subquery counting the like rows that point at each object
+    Used to reconcile the denormalized like_count columns
+    """
+    kind = model._meta.model_name
+    return Coalesce(
+        Subquery(
+            like_model(model).objects.filter(
+                **{kind: OuterRef('pk')}
+            ).order_by().values(kind).annotate(
+                total=Count('id')
+            ).values('total')[:1],
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def like_model(model):
+    """The like table for a Post or Comment"""
+    return LIKE_TABLES[model._meta.model_name]
+
+
+def liked_pairs(queryset, kind):
+    """``(kind, id)`` rows for a like queryset, ready to UNION across kinds"""
+    return queryset.values_list(
+        Value(kind, output_field=CharField()), f'{kind}_id'
+    ).order_by()
+
+
+def union_all(querysets):
+    """Rows of every queryset (at least one) in a single UNION ALL query"""
+    first, *rest = querysets
+    return first.union(*rest, all=True) if rest else first
+
+
+def like_karma_points(model):
+    """Karma a single like is worth to the author of a Post or Comment"""
+    return POST_LIKE_KARMA if model is Post else COMMENT_LIKE_KARMA
+
+
+def truncate_to_hour(moment):
+    """Start of the hourly karma bucket that contains ``moment``"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def adjust_karma_bucket(user_id, created_at, points):
+    """
+    Atomically add ``points`` to the user's karma bucket for the hour of
+    ``created_at``, creating the bucket on first use
+    """
+    bucket_start = truncate_to_hour(created_at)
+    buckets = KarmaBucket.objects.filter(user_id=user_id, bucket_start=bucket_start)
     
-    # Calculate karma using database aggregation
-    karma = karma_query.aggregate(
-        total_karma=Sum(
-            Case(
-                When(content_type=post_content_type, then=5),  # Post like = 5 karma
-                When(content_type=comment_content_type, then=1),  # Comment like = 1 karma
-                default=0,
-                output_field=IntegerField()
+    # Queryset updates skip auto_now, so stamp updated_at explicitly
+    if buckets.update(karma=F('karma') + points, updated_at=timezone.now()):
+        return
+    
+    try:
+        with transaction.atomic():
+            KarmaBucket.objects.create(
+                user_id=user_id, bucket_start=bucket_start, karma=points
             )
+    except IntegrityError:
+        # Another request created the bucket between our update and insert
+        buckets.update(karma=F('karma') + points, updated_at=timezone.now())
+
+
+def withdraw_like_karma(kind, likes):
+    """
+    Take back the karma a queryset of one kind's likes gave its authors,
+    one bucket write per (author, hour)
+    For likes that vanish without an unlike, i.e. when the liked content
+    or the liking user is deleted; the rows must still exist
+    """
+    points = like_karma_points(LIKE_MODELS[kind])
+    rows = likes.annotate(
+        author=F(f'{kind}__author_id'), bucket_start=TruncHour('created_at')
+    ).values('author', 'bucket_start').annotate(total=Count('id')).values_list(
+        'author', 'bucket_start', 'total'
+    ).order_by()
+    now = timezone.now()
+    for author_id, bucket_start, total in rows:
+        # Never create a bucket here: a missing one has nothing to take back
+        KarmaBucket.objects.filter(user_id=author_id, bucket_start=bucket_start).update(
+            karma=F('karma') - points * total, updated_at=now
         )
-    )['total_karma'] or 0
-    
-    return karma
 
 
-def get_leaderboard_users(limit=5):
+def withdraw_like_counts(kind, likes):
     """
-    Get top users by karma earned in the last 24 hours
-    Uses efficient aggregation to avoid N+1 queries
+    Take a queryset of one kind's likes, all from one user, back out of the
+    liked objects' stored counters in one UPDATE
+    For likes deleted by a cascade rather than an unlike; the rows must
+    still exist. Returns the ids of the posts whose payload changed.
     """
-    cutoff_time = timezone.now() - timedelta(hours=24)
-    
-    post_content_type = ContentType.objects.get_for_model(Post)
-    comment_content_type = ContentType.objects.get_for_model(Comment)
+    post_field = 'post_id' if kind == 'post' else 'comment__post_id'
+    targets = dict(likes.values_list(f'{kind}_id', post_field))
+    if targets:
+        # One like per user and object; a counter already at 0 has drifted
+        LIKE_MODELS[kind].objects.filter(pk__in=targets, like_count__gt=0).update(
+            like_count=F('like_count') - 1
+        )
+    return set(targets.values())
+
+
+def record_like_change(obj, like, delta):
+    """
+    Apply a like insert (delta=1) or delete (delta=-1) on a Post or Comment
+    to its stored counter, the post's cache version and the author's
+    hourly karma bucket
+    Must run inside the same transaction as the like write
+    """
+    model = type(obj)
+    adjust_like_count(model, obj.pk, delta)
+    Post.bump_version(obj.pk if model is Post else obj.post_id)
+    adjust_karma_bucket(
+        obj.author_id, like.created_at, like_karma_points(model) * delta
+    )
+
+
+def resolve_like_targets(keys):
+    """
+    ``{(kind, id): (author_id, post_id)}`` for the given ``(kind, id)`` pairs
+    that exist, where kind is 'post' or 'comment'. One query per kind.
+    """
+    requested = defaultdict(set)
+    for kind, pk in keys:
+        requested[kind].add(pk)
     
-    # Get all users with their karma in a single query
-    users_with_karma = []
+    targets = {}
+    if requested['post']:
+        targets.update({
+            ('post', pk): (author_id, pk)
+            for pk, author_id in Post.objects.filter(
+                pk__in=requested['post']
+            ).values_list('id', 'author_id')
+        })
+    if requested['comment']:
+        targets.update({
+            ('comment', pk): (author_id, post_id)
+            for pk, author_id, post_id in Comment.objects.filter(
+                pk__in=requested['comment']
+            ).values_list('id', 'author_id', 'post_id')
+        })
+    return targets
+
+
+def _ids_by_kind(keys):
+    """``{kind: [id, ...]}`` for ``(kind, id)`` pairs"""
+    ids = defaultdict(list)
+    for kind, pk in keys:
+        ids[kind].append(pk)
+    return ids
+
+
+def fetch_existing_likes(keys):
+    """
+    ``{(user_id, kind, id): (like_id, created_at)}`` for the given keys that
+    are liked, locking those rows. One query per kind of like involved; run
+    it inside a transaction.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
     
-    # First, get all likes in the last 24 hours with related content
-    recent_likes = Like.objects.filter(
-        created_at__gte=cutoff_time
-    ).select_related('content_object').values(
-        'content_type__model', 'object_id'
+    existing = {}
+    for kind, ids in _ids_by_kind((kind, pk) for _, kind, pk in keys).items():
+        rows = LIKE_TABLES[kind].objects.select_for_update().filter(
+            user_id__in={user_id for user_id, key_kind, _ in keys if key_kind == kind},
+            **{f'{kind}_id__in': ids}
+        ).values_list('id', 'user_id', f'{kind}_id', 'created_at')
+        for like_id, user_id, object_id, created_at in rows:
+            key = (user_id, kind, object_id)
+            if key in keys:
+                existing[key] = (like_id, created_at)
+    return existing
+
+
+def fast_path_available():
+    """Whether writes can use ``ON CONFLICT`` / ``RETURNING`` in a single statement"""
+    return (
+        connection.vendor in FAST_PATH_VENDORS
+        and connection.features.can_return_columns_from_insert
     )
+
+
+def insert_likes(kind, user_object_ids, created_at):
+    """
+    Insert ``(user_id, id)`` likes of one kind, skipping any that already
+    exist (including ones a concurrent writer just added), and return the
+    pairs that were really inserted
+    """
+    like_table = LIKE_TABLES[kind]
+    target = f'{kind}_id'
+    if not fast_path_available():
+        inserted = []
+        for user_id, pk in user_object_ids:
+            try:
+                with transaction.atomic():
+                    like_table.objects.create(
+                        user_id=user_id, created_at=created_at, **{target: pk}
+                    )
+            except IntegrityError:
+                continue
+            inserted.append((user_id, pk))
+        return inserted
     
-    # Get post authors with karma
-    post_karma = Like.objects.filter(
-        created_at__gte=cutoff_time,
-        content_type=post_content_type
-    ).values('object_id').annotate(
-        karma=Sum(
-            Case(
-                When(content_type=post_content_type, then=5),
-                default=0,
-                output_field=IntegerField()
+    table = connection.ops.quote_name(like_table._meta.db_table)
+    stamp = connection.ops.adapt_datetimefield_value(created_at)
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_object_ids), LIKE_WRITE_CHUNK_SIZE):
+            chunk = user_object_ids[start:start + LIKE_WRITE_CHUNK_SIZE]
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (user_id, {target}, created_at)
+                VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))}
+                ON CONFLICT (user_id, {target}) DO NOTHING
+                RETURNING user_id, {target}
+                """,
+                [value for user_id, pk in chunk for value in (user_id, pk, stamp)]
             )
+            inserted.extend(tuple(row) for row in cursor.fetchall())
+    return inserted
+
+
+def delete_likes(kind, like_ids):
+    """Delete likes of one kind by id and return the ids that were really deleted"""
+    like_table = LIKE_TABLES[kind]
+    if not fast_path_available():
+        # fetch_existing_likes locked these rows, so all of them are still there
+        like_table.objects.filter(pk__in=like_ids).delete()
+        return set(like_ids)
+    
+    table = connection.ops.quote_name(like_table._meta.db_table)
+    deleted = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(like_ids), LIKE_WRITE_CHUNK_SIZE):
+            chunk = like_ids[start:start + LIKE_WRITE_CHUNK_SIZE]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))}) RETURNING id",
+                chunk
+            )
+            deleted.update(row[0] for row in cursor.fetchall())
+    return deleted
+
+
+def write_like_changes(added, removed, targets):
+    """
+    Insert likes for the ``(user_id, kind, id)`` keys in ``added`` and delete
+    the ``{key: (like_id, created_at)}`` rows in ``removed``, with one bulk
+    write each per kind. Counters move by per-object aggregated deltas in one UPDATE
+    per model, karma by one bucket write per (author, hour), and every
+    touched post gets a new cache version. Must run inside a transaction.
+    Deltas follow the rows really written: a like another writer inserted
+    (or an unlike it deleted) first is skipped. Returns how many rows changed.
+    """
+    now = timezone.now()
+    written_added, written_removed = [], {}
+    for kind in LIKE_TABLES:
+        pairs = [(user_id, pk) for user_id, key_kind, pk in added if key_kind == kind]
+        if pairs:
+            written_added.extend(
+                (user_id, kind, pk) for user_id, pk in insert_likes(kind, pairs, now)
+            )
+        rows = {key: row for key, row in removed.items() if key[1] == kind}
+        if rows:
+            deleted = delete_likes(kind, [like_id for like_id, _ in rows.values()])
+            written_removed.update(
+                (key, row) for key, row in rows.items() if row[0] in deleted
+            )
+    
+    counter_deltas = defaultdict(int)
+    karma = defaultdict(int)
+    for _, kind, pk in written_added:
+        counter_deltas[(kind, pk)] += 1
+        karma[(targets[(kind, pk)][0], truncate_to_hour(now))] += (
+            like_karma_points(LIKE_MODELS[kind])
         )
-    )
+    for (_, kind, pk), (_, created_at) in written_removed.items():
+        counter_deltas[(kind, pk)] -= 1
+        karma[(targets[(kind, pk)][0], truncate_to_hour(created_at))] -= (
+            like_karma_points(LIKE_MODELS[kind])
+        )
+    
+    # One bucket write per (author, hour) rather than per like
+    for (author_id, bucket_start), points in karma.items():
+        if points:
+            adjust_karma_bucket(author_id, bucket_start, points)
     
-    # Get comment authors with karma  
-    comment_karma = Like.objects.filter(
-        created_at__gte=cutoff_time,
-        content_type=comment_content_type
-    ).values('object_id').annotate(
-        karma=Sum(
-            Case(
-                When(content_type=comment_content_type, then=1),
-                default=0,
-                output_field=IntegerField()
+    for kind, model in LIKE_MODELS.items():
+        deltas = {
+            pk: delta for (delta_kind, pk), delta in counter_deltas.items()
+            if delta_kind == kind and delta
+        }
+        if deltas:
+            model.objects.filter(pk__in=deltas).update(
+                like_count=F('like_count') + Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField()
+                )
             )
+    touched = [targets[key][1] for key in counter_deltas]
+    if touched:
+        Post.bump_versions(set(touched))
+    return len(written_added) + len(written_removed)
+
+
+def get_like_counts(keys):
+    """``{(kind, id): likes}`` counted from the like tables in one grouped query"""
+    counts = [
+        LIKE_TABLES[kind].objects.filter(**{f'{kind}_id__in': ids}).values(
+            f'{kind}_id'
+        ).annotate(total=Count('id')).values_list(
+            Value(kind, output_field=CharField()), f'{kind}_id', 'total'
+        ).order_by()
+        for kind, ids in _ids_by_kind(keys).items()
+    ]
+    if not counts:
+        return {}
+    return {(kind, pk): total for kind, pk, total in union_all(counts)}
+
+
+def apply_like_batch(user_id, operations):
+    """
+    Apply a list of ``{'action', 'type', 'id'}`` like/unlike operations for
+    one user (by id) in a fixed number of queries
+    Operations are replayed in order against the user's current likes, so
+    only the net change per object is written. Returns one result per
+    operation with a ``status`` and the object's fresh ``like_count``
+    (None when the object doesn't exist).
+    """
+    targets = resolve_like_targets((op['type'], op['id']) for op in operations)
+    
+    with transaction.atomic():
+        existing = fetch_existing_likes((user_id, kind, pk) for kind, pk in targets)
+        
+        liked = set(existing)
+        results = []
+        for op in operations:
+            key = (user_id, op['type'], op['id'])
+            if key[1:] not in targets:
+                outcome = 'not_found'
+            elif op['action'] == 'like':
+                outcome = 'already_liked' if key in liked else 'liked'
+                liked.add(key)
+            else:
+                outcome = 'unliked' if key in liked else 'not_liked'
+                liked.discard(key)
+            results.append({**op, 'status': outcome})
+        
+        write_like_changes(
+            added=liked - existing.keys(),
+            removed={key: existing[key] for key in existing.keys() - liked},
+            targets=targets
         )
-    )
     
-    # Aggregate karma by user
-    user_karma = {}
-    
-    # Add karma from posts
-    for post_karma_data in post_karma:
-        try:
-            post = Post.objects.get(id=post_karma_data['object_id'])
-            user_id = post.author_id
-            user_karma[user_id] = user_karma.get(user_id, 0) + post_karma_data['karma']
-        except Post.DoesNotExist:
-            continue
-    
-    # Add karma from comments
-    for comment_karma_data in comment_karma:
-        try:
-            comment = Comment.objects.get(id=comment_karma_data['object_id'])
-            user_id = comment.author_id
-            user_karma[user_id] = user_karma.get(user_id, 0) + comment_karma_data['karma']
-        except Comment.DoesNotExist:
-            continue
-    
-    # Get top users
-    sorted_users = sorted(user_karma.items(), key=lambda x: x[1], reverse=True)[:limit]
-    
-    # Fetch user objects and attach karma
-    top_users = []
-    for user_id, karma in sorted_users:
-        try:
-            user = User.objects.get(id=user_id)
-            user.karma_24h = karma  # Attach calculated karma
-            top_users.append(user)
-        except User.DoesNotExist:
-            continue
-    
-    return top_users
-
-
-def get_optimized_posts_queryset():
+    counts = get_like_counts(targets)
+    for result in results:
+        key = (result['type'], result['id'])
+        result['like_count'] = counts.get(key, 0) if key in targets else None
+    return results
+
+
+def get_window_bounds(window):
+    """
+    Split a trailing window into (cutoff, edge_end)
+    Buckets starting at or after ``edge_end`` lie fully inside the window;
+    likes in [cutoff, edge_end) fall in the partial leading bucket and are
+    counted from raw like rows to keep minute-level precision
+    """
+    cutoff_time = timezone.now() - window
+    edge_end = truncate_to_hour(cutoff_time)
+    if edge_end < cutoff_time:
+        edge_end += timedelta(hours=1)
+    return cutoff_time, edge_end
+
+
+def calculate_user_karma(user, window=timedelta(hours=24)):
+    """
+    Calculate karma earned by a user within a trailing window
+    Sums the hourly rollup plus raw likes for the partial edge bucket
+    """
+    cutoff_time, edge_end = get_window_bounds(window)
+    
+    karma = user.karma_buckets.filter(
+        bucket_start__gte=edge_end
+    ).aggregate(total_karma=Sum('karma'))['total_karma'] or 0
+    
+    if edge_end == cutoff_time:
+        return karma
+    
+    # Likes on the user's content inside the partial leading bucket
+    edge = {'created_at__gte': cutoff_time, 'created_at__lt': edge_end}
+    karma += POST_LIKE_KARMA * PostLike.objects.filter(post__author=user, **edge).count()
+    karma += COMMENT_LIKE_KARMA * CommentLike.objects.filter(comment__author=user, **edge).count()
+    return karma
+
+
+def calculate_user_karma_24h(user):
+    """
+    Calculate karma earned by a user in the last 24 hours
+    """
+    return calculate_user_karma(user, timedelta(hours=24))
+
+
+def _karma_totals_sql(window, author_ids=None):
+    """
+    Build the grouped ``(author_id, karma)`` query for a trailing window
+    Whole hours come from the KarmaBucket rollup and the partial leading
+    hour from raw likes joined to their post/comment author. Optionally
+    restricted to ``author_ids``. Returns ``(sql, params)``.
+    """
+    cutoff_time, edge_end = get_window_bounds(window)
+    
+    qn = connection.ops.quote_name
+    bucket_table = qn(KarmaBucket._meta.db_table)
+    post_like_table = qn(PostLike._meta.db_table)
+    comment_like_table = qn(CommentLike._meta.db_table)
+    post_table = qn(Post._meta.db_table)
+    comment_table = qn(Comment._meta.db_table)
+    
+    bucket_filter = post_filter = comment_filter = ''
+    author_params = []
+    if author_ids is not None:
+        author_ids = list(author_ids)
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        bucket_filter = f'AND b.user_id IN ({placeholders})'
+        post_filter = f'AND p.author_id IN ({placeholders})'
+        comment_filter = f'AND c.author_id IN ({placeholders})'
+        author_params = author_ids
+    
+    sql = f"""
+        SELECT scored.author_id, SUM(scored.points) AS karma
+        FROM (
+            SELECT b.user_id AS author_id, b.karma AS points
+            FROM {bucket_table} b
+            WHERE b.bucket_start >= %s {bucket_filter}
+            UNION ALL
+            SELECT p.author_id AS author_id, {POST_LIKE_KARMA} AS points
+            FROM {post_like_table} l
+            INNER JOIN {post_table} p ON p.id = l.post_id
+            WHERE l.created_at >= %s AND l.created_at < %s {post_filter}
+            UNION ALL
+            SELECT c.author_id AS author_id, {COMMENT_LIKE_KARMA} AS points
+            FROM {comment_like_table} l
+            INNER JOIN {comment_table} c ON c.id = l.comment_id
+            WHERE l.created_at >= %s AND l.created_at < %s {comment_filter}
+        ) scored
+        GROUP BY scored.author_id
+    """
+    params = [
+        edge_end, *author_params,
+        cutoff_time, edge_end, *author_params,
+        cutoff_time, edge_end, *author_params,
+    ]
+    return sql, params
+
+
+def get_leaderboard_users(limit=5, window=timedelta(hours=24)):
+    """
+    Get top users by karma earned within a trailing window (default 24h)
+    Runs as a single query: karma is weighted, grouped per author and
+    ranked in SQL. The total is attached as ``karma_24h`` to keep the API
+    field stable.
+    """
+    totals_sql, params = _karma_totals_sql(window)
+    user_table = connection.ops.quote_name(User._meta.db_table)
+    
+    sql = f"""
+        SELECT u.*, k.karma AS karma_24h
+        FROM {user_table} u
+        INNER JOIN ({totals_sql}) k ON k.author_id = u.id
+        WHERE k.karma > 0
+        ORDER BY k.karma DESC, u.id ASC
+        LIMIT %s
+    """
+    
+    return list(User.objects.raw(sql, [*params, limit]))
+
+
+def get_karma_map(user_ids, window=timedelta(hours=24)):
+    """
+    Karma for many users in one grouped query: ``{user_id: karma}``
+    Users without karma in the window are omitted (treat as 0)
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    
+    sql, params = _karma_totals_sql(window, author_ids=user_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {author_id: karma for author_id, karma in cursor.fetchall()}
+
+
+def get_karma_ranking(window=timedelta(hours=24)):
+    """
+    Every author with positive karma in the window, as ``(user_id, karma)``
+    ordered by karma DESC with ties broken by user id ASC. One grouped
+    query, used to build the leaderboard snapshot's rank index.
+    """
+    totals_sql, params = _karma_totals_sql(window)
+    sql = f"""
+        SELECT k.author_id, k.karma
+        FROM ({totals_sql}) k
+        WHERE k.karma > 0
+        ORDER BY k.karma DESC, k.author_id ASC
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(author_id, karma) for author_id, karma in cursor.fetchall()]
+
+
+def iter_page_comments(posts):
+    """
+    Every comment carried by a page of posts
+    Uses ``prefetched_comments``, ``preview_comments`` or the prefetched
+    ``comments`` relation, so it adds no queries of its own
+    """
+    for post in posts:
+        comments = getattr(post, 'prefetched_comments', None)
+        if comments is None:
+            comments = getattr(post, 'preview_comments', None)
+        if comments is None and 'comments' in getattr(post, '_prefetched_objects_cache', {}):
+            comments = post.comments.all()
+        yield from comments or ()
+
+
+def get_page_author_ids(posts):
+    """Distinct author ids for a page of posts and every comment they carry"""
+    author_ids = {post.author_id for post in posts}
+    author_ids.update(comment.author_id for comment in iter_page_comments(posts))
+    return author_ids
+
+
+def get_viewer(request):
+    """
+    The user whose likes decide ``is_liked``
+    Anonymous requests act as the demo user; returns None if it doesn't exist
+    """
+    if request.user.is_authenticated:
+        return request.user
+    return User.objects.filter(username='demo_user').first()
+
+
+def get_liked_objects(user, post_ids=(), comment_ids=()):
+    """
+    ``(kind, id)`` pairs the user has liked among the given posts and
+    comments, fetched in a single query
+    """
+    post_ids = list(post_ids)
+    comment_ids = list(comment_ids)
+    if user is None or not (post_ids or comment_ids):
+        return set()
+    
+    liked = []
+    if post_ids:
+        liked.append(liked_pairs(PostLike.objects.filter(user=user, post_id__in=post_ids), 'post'))
+    if comment_ids:
+        liked.append(liked_pairs(
+            CommentLike.objects.filter(user=user, comment_id__in=comment_ids), 'comment'
+        ))
+    return set(union_all(liked))
+
+
+def get_liked_objects_in_post(user, post_id):
+    """
+    Like ``get_liked_objects`` for a post and all of its comments, without
+    first fetching the comment ids, so it can run alongside the comment fetch
+    """
+    if user is None:
+        return set()
+    return set(union_all([
+        liked_pairs(PostLike.objects.filter(user=user, post_id=post_id), 'post'),
+        liked_pairs(CommentLike.objects.filter(user=user, comment__post_id=post_id), 'comment'),
+    ]))
+
+
+def build_comment_tree(comments):
+    """
+    Assemble a flat, created_at-ordered comment list into a tree in one pass
+    Each comment gets ``prefetched_replies`` (its direct children, in order);
+    returns the top-level comments. Replies whose parent isn't in the list
+    are treated as roots. O(n), no queries.
+    """
+    by_id = {}
+    for comment in comments:
+        comment.prefetched_replies = []
+        by_id[comment.id] = comment
+    
+    roots = []
+    for comment in comments:
+        parent = by_id.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.prefetched_replies.append(comment)
+    return roots
+
+
+def get_comment_subtrees(roots, max_depth):
+    """
+    Descendants of ``roots`` down to ``max_depth`` levels below each root,
+    in one query: an OR of materialized-path range scans
+    """
+    if max_depth <= 0 or not roots:
+        return []
+    
+    ranges = Q()
+    for root in roots:
+        low, high = root.subtree_path_range
+        ranges |= Q(path__gte=low, path__lt=high, depth__lte=root.depth + max_depth)
+    
+    return list(
+        Comment.objects.filter(ranges).select_related('author').order_by('created_at', 'id')
+    )
+
+
+def get_reply_counts(comment_ids):
+    """Direct reply count per comment id, in one grouped query"""
+    comment_ids = list(comment_ids)
+    if not comment_ids:
+        return {}
+    return dict(
+        Comment.objects.filter(parent_id__in=comment_ids).order_by().values(
+            'parent_id'
+        ).annotate(total=Count('id')).values_list('parent_id', 'total')
+    )
+
+
+def get_optimized_posts_queryset(expand_comments=False, preview_size=COMMENT_PREVIEW_SIZE):
     """
     Get posts queryset optimized for preventing N+1 queries
-    Prefetches related data for efficient serialization
+    By default only the first ``preview_size`` top-level comments per post
+    are prefetched (as ``preview_comments``), keeping list work bounded by
+    the page size; ``expand_comments`` prefetches every comment instead
     """
-    return Post.objects.select_related('author').prefetch_related(
-        'comments__author',
-        'comments__replies__author'
-    ).annotate(
-        comment_count=models.Count('comments', distinct=True)
+    # A correlated count per row keeps the page on the keyset index; a
+    # Count('comments') join would group (and sort) every post first
+    comment_count = Comment.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post'
+    ).annotate(total=Count('id')).values('total')
+    queryset = Post.objects.select_related('author').annotate(
+        comment_count=Coalesce(Subquery(comment_count), 0)
+    )
+    if expand_comments:
+        return queryset.prefetch_related('comments__author')
+    if preview_size <= 0:
+        return queryset
+    
+    preview = Comment.objects.filter(parent=None).select_related('author').order_by(
+        'created_at', 'id'
+    )[:preview_size]
+    return queryset.prefetch_related(
+        models.Prefetch('comments', queryset=preview, to_attr='preview_comments')
     )
 
 
-def get_optimized_post_with_comments(post_id):
+def get_optimized_post_with_comments(post_id, max_depth=None):
     """
     Get a single post with all its comments optimized for N+1 prevention
+    ``max_depth`` collapses the thread below that depth (0 = top level only)
     """
     try:
         post = Post.objects.select_related('author').get(id=post_id)
@@ -158,10 +724,12 @@ def get_optimized_post_with_comments(post_id):
         all_comments = Comment.objects.filter(
             post=post
         ).select_related('author').order_by('created_at')
+        if max_depth is not None:
+            all_comments = all_comments.filter(depth__lte=max_depth)
         
         # Attach as attribute to avoid additional queries
         post.prefetched_comments = list(all_comments)
         
         return post
     except Post.DoesNotExist:
-        return None
\ No newline at end of file
+        return None
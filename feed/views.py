@@ -1,20 +1,62 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from django.contrib.contenttypes.models import ContentType
-from django.db import transaction, IntegrityError
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.views.decorators.http import require_GET
 
-from .models import Post, Comment, Like
+from .cache import (
+    get_cached_post_detail,
+    iter_payload_comments,
+    overlay_is_liked,
+    post_detail_stats
+)
+from .conditional import (
+    feed_validators,
+    leaderboard_validators,
+    not_modified,
+    post_detail_state,
+    post_detail_validators,
+    set_validators
+)
+from .events import event_hub
+from .leaderboard import (
+    LEADERBOARD_SIZE,
+    get_leaderboard_page,
+    get_leaderboard_snapshot,
+    get_user_rank
+)
+from .like_buffer import buffer_like, buffering_enabled, like_buffer, overlay_pending_likes
+from .likes import add_like, get_actor_id, remove_like
+from .metrics import request_metrics
+from .models import Post, Comment, User
+from .pagination import FeedCursorPagination, CommentThreadCursorPagination
 from .serializers import (
     PostSerializer, 
+    PostListSerializer,
     CommentSerializer, 
-    LikeSerializer, 
+    CommentThreadSerializer,
+    LikeBatchSerializer,
     LeaderboardUserSerializer
 )
-from .utils import get_leaderboard_users, get_optimized_post_with_comments
+from .utils import (
+    COMMENT_PREVIEW_SIZE,
+    KARMA_WINDOWS,
+    MAX_COMMENT_PREVIEW_SIZE,
+    apply_like_batch,
+    build_comment_tree,
+    get_comment_subtrees,
+    get_karma_map,
+    get_liked_objects,
+    get_optimized_post_with_comments,
+    get_optimized_posts_queryset,
+    get_page_author_ids,
+    get_reply_counts,
+    get_viewer,
+    iter_page_comments
+)
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -23,6 +65,176 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+def wants_cursor_pagination(params):
+    """Clients opt into keyset pages with ``?pagination=cursor`` or by sending a ``cursor``"""
+    return params.get('pagination') == 'cursor' or 'cursor' in params
+
+
+THREAD_DEFAULT_DEPTH = 2
+THREAD_MAX_DEPTH = 10
+
+
+def parse_max_depth(request, default=None, limit=None):
+    """Read ``?max_depth=`` as a non-negative int, clamped to ``limit``"""
+    raw = request.query_params.get('max_depth')
+    if raw is None:
+        return default
+    try:
+        max_depth = int(raw)
+    except ValueError:
+        max_depth = -1
+    if max_depth < 0:
+        raise ValidationError({'error': 'max_depth must be a non-negative integer'})
+    return min(max_depth, limit) if limit is not None else max_depth
+
+
+def parse_preview_size(request):
+    """``?preview=`` comments per post in the feed list, clamped"""
+    try:
+        preview_size = int(request.GET.get('preview', COMMENT_PREVIEW_SIZE))
+    except ValueError:
+        preview_size = COMMENT_PREVIEW_SIZE
+    return max(0, min(preview_size, MAX_COMMENT_PREVIEW_SIZE))
+
+
+def post_detail_variant(request, created_at, max_depth):
+    """Cache variant for the query params that change the detail payload"""
+    return (
+        f"{created_at.timestamp()}:d={max_depth}"
+        f"&f={request.GET.get('fields', '')}"
+    )
+
+
+def build_post_detail(request, post_id, max_depth):
+    """Viewer-neutral post detail payload (every is_liked False), or None"""
+    post = get_optimized_post_with_comments(post_id, max_depth=max_depth)
+    if not post:
+        return None
+    context = {
+        'request': request,
+        'karma_map': get_karma_map(get_page_author_ids([post])),
+        'liked_objects': set()
+    }
+    return PostSerializer(post, context=context).data
+
+
+def like_response(request, model, pk):
+    """201 with the fresh like_count, or 400 if the viewer already liked it"""
+    try:
+        if buffering_enabled():
+            return buffered_like_response(request, model, int(pk), liked=True)
+        created, like_count = add_like(get_actor_id(request), model, int(pk))
+    except (ValueError, model.DoesNotExist):
+        raise NotFound(f'No {model.__name__} matches the given query.')
+    
+    if created:
+        event_hub.publish_like(model._meta.model_name, int(pk), like_count)
+        return Response(
+            {
+                'message': f'{model.__name__} liked successfully',
+                'like_count': like_count
+            },
+            status=status.HTTP_201_CREATED
+        )
+    return Response(
+        {
+            'message': f'You have already liked this {model._meta.model_name}',
+            'like_count': like_count
+        },
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def unlike_response(request, model, pk):
+    """200 with the fresh like_count, or 400 if the viewer hadn't liked it"""
+    try:
+        if buffering_enabled():
+            return buffered_like_response(request, model, int(pk), liked=False)
+        removed, like_count = remove_like(get_actor_id(request), model, int(pk))
+    except (ValueError, model.DoesNotExist):
+        raise NotFound(f'No {model.__name__} matches the given query.')
+    
+    if removed:
+        event_hub.publish_like(model._meta.model_name, int(pk), like_count)
+        return Response(
+            {
+                'message': f'{model.__name__} unliked successfully',
+                'like_count': like_count
+            },
+            status=status.HTTP_200_OK
+        )
+    return Response(
+        {
+            'error': f'You have not liked this {model._meta.model_name}',
+            'like_count': like_count
+        },
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def buffered_like_response(request, model, pk, liked):
+    """
+    Write-behind like/unlike: 202 once queued, with an optimistic like_count
+    Duplicates are still answered with 400
+    """
+    noun = model._meta.model_name
+    accepted, like_count = buffer_like(get_actor_id(request), model, pk, liked)
+    if accepted:
+        event_hub.publish_like(noun, pk, like_count)
+        return Response(
+            {
+                'message': f"{model.__name__} {'like' if liked else 'unlike'} queued",
+                'like_count': like_count
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+    return Response(
+        {
+            ('message' if liked else 'error'): (
+                f'You have already liked this {noun}' if liked
+                else f'You have not liked this {noun}'
+            ),
+            'like_count': like_count
+        },
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def overlay_buffered_likes(request, nodes, kind):
+    """Fold likes still in the write-behind buffer into serialized data"""
+    if buffering_enabled() and len(like_buffer):
+        overlay_pending_likes(nodes, kind, get_actor_id(request))
+    return nodes
+
+
+def comment_thread_response(view, request, siblings):
+    """
+    Cursor-paginated page of sibling comments, each with its replies
+    expanded ``max_depth`` levels down and per-node "more replies" counts
+    Costs a fixed handful of queries regardless of thread size
+    """
+    max_depth = parse_max_depth(
+        request, default=THREAD_DEFAULT_DEPTH, limit=THREAD_MAX_DEPTH
+    )
+    paginator = CommentThreadCursorPagination()
+    roots = paginator.paginate_queryset(siblings.select_related('author'), request)
+    
+    nodes = roots + get_comment_subtrees(roots, max_depth)
+    build_comment_tree(nodes)
+    
+    context = view.get_serializer_context()
+    context['karma_map'] = get_karma_map({node.author_id for node in nodes})
+    context['liked_objects'] = get_liked_objects(
+        get_viewer(request), comment_ids=[node.id for node in nodes]
+    )
+    context['reply_counts'] = get_reply_counts(node.id for node in nodes)
+    
+    serializer = CommentThreadSerializer(roots, many=True, context=context)
+    return paginator.get_paginated_response(
+        overlay_buffered_likes(request, serializer.data, 'comment')
+    )
+
+
 class PostViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Posts with optimized queries to prevent N+1 problems
@@ -31,16 +243,83 @@ class PostViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]  # Allow anonymous for demo
     pagination_class = StandardResultsSetPagination
     
+    @property
+    def paginator(self):
+        """
+        Page-number pagination by default; keyset (cursor) pagination when
+        the client opts in with ``?pagination=cursor`` or sends a ``cursor``
+        """
+        if not hasattr(self, '_paginator'):
+            if wants_cursor_pagination(self.request.query_params):
+                self._paginator = FeedCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
+    @property
+    def expand_comments(self):
+        """``?expand=comments`` embeds full comment trees in the list"""
+        return 'comments' in self.request.query_params.get('expand', '').split(',')
+    
+    def get_serializer_class(self):
+        """Slim serializer for the feed list unless full trees are requested"""
+        if self.action == 'list' and not self.expand_comments:
+            return PostListSerializer
+        return PostSerializer
+    
     def get_queryset(self):
         """
         Optimized queryset that prevents N+1 queries
-        Prefetches author and comment data
+        The list prefetches a bounded comment preview (``?preview=N``) or,
+        with ``?expand=comments``, every comment
         """
-        return Post.objects.select_related('author').prefetch_related(
-            'comments__author',
-            'comments__replies__author'
+        if self.action != 'list':
+            return Post.objects.select_related('author').order_by('-created_at')
+        
+        return get_optimized_posts_queryset(
+            expand_comments=self.expand_comments,
+            preview_size=parse_preview_size(self.request)
         ).order_by('-created_at')
     
+    def get_page_context(self, posts):
+        """
+        Serializer context for a page of posts
+        Batches per-author karma and the viewer's likes into one grouped
+        query each, up front
+        """
+        context = self.get_serializer_context()
+        context['karma_map'] = get_karma_map(get_page_author_ids(posts))
+        context['liked_objects'] = get_liked_objects(
+            get_viewer(self.request),
+            post_ids=[post.id for post in posts],
+            comment_ids=[comment.id for comment in iter_page_comments(posts)]
+        )
+        return context
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Paginated post list with page-level batched lookups
+        Answers a matching ``If-None-Match`` with 304 before any of them run
+        """
+        etag, last_modified = feed_validators(request)
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return set_validators(cached, etag, last_modified)
+        
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        posts = page if page is not None else list(queryset)
+        
+        serializer = self.get_serializer(
+            posts, many=True, context=self.get_page_context(posts)
+        )
+        data = overlay_buffered_likes(request, serializer.data, 'post')
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response(data)
+        return set_validators(response, etag, last_modified)
+    
     def perform_create(self, serializer):
         """Set the author - use demo user if not authenticated"""
         from .models import User
@@ -57,110 +336,78 @@ class PostViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         """
         Optimized single post retrieval with full comment tree
+        ``?max_depth=N`` collapses replies nested deeper than N
+        The viewer-neutral payload is cached per post version; the viewer's
+        ``is_liked`` flags are overlaid afterwards
         """
         post_id = kwargs.get('pk')
-        post = get_optimized_post_with_comments(post_id)
+        max_depth = parse_max_depth(request)
+        # created_at guards against a reused id picking up a deleted post's entry
+        row = post_detail_state(post_id)
+        
+        if row is None:
+            return Response(
+                {'error': 'Post not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        version, created_at, _, _ = row
+        etag, last_modified = post_detail_validators(request, *row)
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return set_validators(cached, etag, last_modified)
         
-        if not post:
+        variant = post_detail_variant(request, created_at, max_depth)
+        payload = get_cached_post_detail(
+            post_id, version, variant,
+            lambda: build_post_detail(request, post_id, max_depth)
+        )
+        if payload is None:
             return Response(
                 {'error': 'Post not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        serializer = self.get_serializer(post)
-        return Response(serializer.data)
+        liked_objects = get_liked_objects(
+            get_viewer(request),
+            post_ids=[payload['id']] if 'id' in payload else [],
+            comment_ids=[node['id'] for node in iter_payload_comments(payload) if 'id' in node]
+        )
+        overlay_is_liked(payload, liked_objects)
+        overlay_buffered_likes(request, [payload], 'post')
+        return set_validators(Response(payload), etag, last_modified)
     
-    @action(detail=True, methods=['post'], permission_classes=[permissions.AllowAny])
-    def like(self, request, pk=None):
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """Hit/miss counters for the post detail cache (this process)"""
+        return Response({'post_detail': post_detail_stats.snapshot()})
+    
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
         """
-        Like a post with concurrency protection
-        Prevents duplicate likes using database constraints
+        Lazy-loaded top-level comments for a post
+        Cursor-paginated; ``?max_depth=`` controls how far replies expand
         """
-        from .models import User
-        post = get_object_or_404(Post, pk=pk)
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            user, _ = User.objects.get_or_create(
-                username='demo_user',
-                defaults={'email': 'demo@example.com'}
-            )
-        
-        post_content_type = ContentType.objects.get_for_model(Post)
-        
-        try:
-            with transaction.atomic():
-                like, created = Like.objects.get_or_create(
-                    user=user,
-                    content_type=post_content_type,
-                    object_id=post.id
-                )
-                
-                if created:
-                    return Response(
-                        {
-                            'message': 'Post liked successfully',
-                            'like_count': post.like_count
-                        },
-                        status=status.HTTP_201_CREATED
-                    )
-                else:
-                    return Response(
-                        {
-                            'message': 'You have already liked this post',
-                            'like_count': post.like_count
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                    
-        except IntegrityError:
+        if not Post.objects.filter(pk=pk).exists():
             return Response(
-                {
-                    'error': 'Concurrency error - please try again',
-                    'like_count': post.like_count
-                },
-                status=status.HTTP_409_CONFLICT
+                {'error': 'Post not found'}, 
+                status=status.HTTP_404_NOT_FOUND
             )
+        siblings = Comment.objects.filter(post_id=pk, parent=None)
+        return comment_thread_response(self, request, siblings)
+    
+    @action(detail=True, methods=['post'], permission_classes=[permissions.AllowAny])
+    def like(self, request, pk=None):
+        """
+        Like a post in a single round trip
+        Duplicate likes are absorbed by the unique constraint, never raised
+        """
+        return like_response(request, Post, pk)
     
     @action(detail=True, methods=['delete'], permission_classes=[permissions.AllowAny])
     def unlike(self, request, pk=None):
         """Remove like from a post"""
-        from .models import User
-        post = get_object_or_404(Post, pk=pk)
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            user, _ = User.objects.get_or_create(
-                username='demo_user',
-                defaults={'email': 'demo@example.com'}
-            )
-        
-        post_content_type = ContentType.objects.get_for_model(Post)
-        
-        try:
-            like = Like.objects.get(
-                user=user,
-                content_type=post_content_type,
-                object_id=post.id
-            )
-            like.delete()
-            
-            return Response(
-                {
-                    'message': 'Post unliked successfully',
-                    'like_count': post.like_count
-                },
-                status=status.HTTP_200_OK
-            )
-            
-        except Like.DoesNotExist:
-            return Response(
-                {
-                    'error': 'You have not liked this post',
-                    'like_count': post.like_count
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        return unlike_response(request, Post, pk)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
@@ -180,123 +427,174 @@ class CommentViewSet(viewsets.ModelViewSet):
         """Set the author - use demo user if not authenticated"""
         from .models import User
         if self.request.user.is_authenticated:
-            serializer.save(author=self.request.user)
+            comment = serializer.save(author=self.request.user)
         else:
             demo_user, _ = User.objects.get_or_create(
                 username='demo_user',
                 defaults={'email': 'demo@example.com'}
             )
-            serializer.save(author=demo_user)
+            comment = serializer.save(author=demo_user)
+        event_hub.publish_comment(comment.post_id, comment.id)
+    
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """
+        Lazy-loaded direct replies to a comment, for expanding a branch
+        Cursor-paginated; ``?max_depth=`` controls how far replies expand
+        """
+        parent = get_object_or_404(Comment, pk=pk)
+        siblings = Comment.objects.filter(parent=parent)
+        return comment_thread_response(self, request, siblings)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.AllowAny])
     def like(self, request, pk=None):
         """
-        Like a comment with concurrency protection
+        Like a comment in a single round trip
+        Duplicate likes are absorbed by the unique constraint, never raised
         """
-        from .models import User
-        comment = get_object_or_404(Comment, pk=pk)
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            user, _ = User.objects.get_or_create(
-                username='demo_user',
-                defaults={'email': 'demo@example.com'}
-            )
-        
-        comment_content_type = ContentType.objects.get_for_model(Comment)
-        
-        try:
-            with transaction.atomic():
-                like, created = Like.objects.get_or_create(
-                    user=user,
-                    content_type=comment_content_type,
-                    object_id=comment.id
-                )
-                
-                if created:
-                    return Response(
-                        {
-                            'message': 'Comment liked successfully',
-                            'like_count': comment.like_count
-                        },
-                        status=status.HTTP_201_CREATED
-                    )
-                else:
-                    return Response(
-                        {
-                            'message': 'You have already liked this comment',
-                            'like_count': comment.like_count
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                    
-        except IntegrityError:
-            return Response(
-                {
-                    'error': 'Concurrency error - please try again',
-                    'like_count': comment.like_count
-                },
-                status=status.HTTP_409_CONFLICT
-            )
+        return like_response(request, Comment, pk)
     
     @action(detail=True, methods=['delete'], permission_classes=[permissions.AllowAny])
     def unlike(self, request, pk=None):
         """Remove like from a comment"""
-        from .models import User
-        comment = get_object_or_404(Comment, pk=pk)
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            user, _ = User.objects.get_or_create(
-                username='demo_user',
-                defaults={'email': 'demo@example.com'}
-            )
-        
-        comment_content_type = ContentType.objects.get_for_model(Comment)
+        return unlike_response(request, Comment, pk)
+
+
+class LikeViewSet(viewsets.ViewSet):
+    """
+    Batched likes for clients that queue actions offline and replay them
+    """
+    permission_classes = [permissions.AllowAny]
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Apply up to 100 like/unlike operations on posts and comments
+        Body: ``{"operations": [{"action": "like", "type": "post", "id": 1}, ...]}``
+        Returns a result per operation with the object's fresh like_count
+        """
+        serializer = LikeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        try:
-            like = Like.objects.get(
-                user=user,
-                content_type=comment_content_type,
-                object_id=comment.id
-            )
-            like.delete()
-            
-            return Response(
-                {
-                    'message': 'Comment unliked successfully',
-                    'like_count': comment.like_count
-                },
-                status=status.HTTP_200_OK
-            )
-            
-        except Like.DoesNotExist:
-            return Response(
-                {
-                    'error': 'You have not liked this comment',
-                    'like_count': comment.like_count
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        results = apply_like_batch(
+            get_actor_id(request), serializer.validated_data['operations']
+        )
+        for result in results:
+            if result['status'] in ('liked', 'unliked'):
+                event_hub.publish_like(result['type'], result['id'], result['like_count'])
+        return Response({'results': results})
 
 
 class LeaderboardViewSet(viewsets.ViewSet):
     """
     ViewSet for the dynamic leaderboard
-    Shows top 5 users by karma earned in the last 24 hours
+    Shows top 5 users by karma earned in the last 24 hours (or ?window=),
+    deeper pages with ?offset=&limit=, and any user's rank
     """
     permission_classes = [permissions.AllowAny]
+    max_page_size = 100
+    
+    def get_window_key(self, request):
+        window_key = request.query_params.get('window', '24h')
+        if window_key not in KARMA_WINDOWS:
+            raise ValidationError({
+                'error': f"Unsupported window '{window_key}'",
+                'allowed_windows': list(KARMA_WINDOWS)
+            })
+        return window_key
+    
+    def get_page_bounds(self, request):
+        """``(offset, limit)`` from the query string, or None for the top 5"""
+        params = request.query_params
+        if 'offset' not in params and 'limit' not in params:
+            return None
+        try:
+            offset = int(params.get('offset', 0))
+            limit = int(params.get('limit', LEADERBOARD_SIZE))
+        except ValueError:
+            offset = limit = -1
+        if offset < 0 or limit < 1:
+            raise ValidationError({
+                'error': 'offset must be a non-negative integer and limit a positive one'
+            })
+        return offset, min(limit, self.max_page_size)
+    
+    def snapshot_response(self, request, snapshot, build):
+        """
+        Conditional response validated against the snapshot
+        ``build`` only runs (and only queries) when the client is out of date
+        """
+        etag, last_modified = leaderboard_validators(snapshot)
+        cached = not_modified(request, etag, last_modified)
+        if cached is not None:
+            return set_validators(cached, etag, last_modified)
+        
+        return set_validators(Response({
+            **build(),
+            'period': snapshot['period'],
+            'window': snapshot['window'],
+            'updated_at': snapshot['updated_at']
+        }), etag, last_modified)
     
     def list(self, request):
         """
-        Get top 5 users by karma earned in the last 24 hours
-        Uses efficient aggregation instead of stored daily karma
+        Get top 5 users by karma earned in a trailing window
+        ``?window=`` accepts 1h, 24h (default), 7d or 30d
+        Served in O(1) from a periodically refreshed snapshot
+        ``?offset=&limit=`` pages deeper through the full ranking
         """
-        top_users = get_leaderboard_users(limit=5)
-        serializer = LeaderboardUserSerializer(top_users, many=True)
+        window_key = self.get_window_key(request)
+        snapshot = get_leaderboard_snapshot(window_key)
+        bounds = self.get_page_bounds(request)
+        
+        if bounds is None:
+            return self.snapshot_response(
+                request, snapshot, lambda: {'leaderboard': snapshot['leaderboard']}
+            )
+        
+        offset, limit = bounds
+        
+        def build():
+            users = get_leaderboard_page(
+                window_key, offset, limit, stored=snapshot.get('ranking_stored', False)
+            )
+            return {
+                'leaderboard': LeaderboardUserSerializer(users, many=True).data,
+                'count': snapshot['ranked_users'],
+                'offset': offset,
+                'limit': limit
+            }
         
-        return Response({
-            'leaderboard': serializer.data,
-            'period': '24 hours',
-            'updated_at': timezone.now().isoformat()
-        })
+        return self.snapshot_response(request, snapshot, build)
+    
+    @action(detail=False, url_path=r'rank/(?P<user_id>\d+)')
+    def rank(self, request, user_id=None):
+        """
+        Get one user's rank and karma in a window
+        ``rank`` is null for users without karma in the window
+        """
+        window_key = self.get_window_key(request)
+        snapshot = get_leaderboard_snapshot(window_key)
+        
+        def build():
+            user = get_object_or_404(User, pk=user_id)
+            rank, karma = get_user_rank(
+                window_key, user.id, stored=snapshot.get('ranking_stored', False)
+            )
+            return {
+                'user': {'id': user.id, 'username': user.username},
+                'rank': rank,
+                'karma_24h': karma,
+                'ranked_users': snapshot['ranked_users']
+            }
+        
+        return self.snapshot_response(request, snapshot, build)
+
+
+@require_GET
+def metrics(request):
+    """Per-route request metrics for this process, in Prometheus text format"""
+    return HttpResponse(
+        request_metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
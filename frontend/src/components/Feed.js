@@ -7,14 +7,15 @@ const Feed = ({ refreshTrigger, user, onKarmaChange }) => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [hasMore, setHasMore] = useState(true);
-  const [currentPage, setCurrentPage] = useState(1);
+  const [nextUrl, setNextUrl] = useState(null);
 
-  const loadPosts = async (page = 1, reset = false) => {
+  const loadPosts = async (reset = false) => {
     setLoading(true);
     setError('');
 
     try {
-      const data = await feedAPI.getPosts(page);
+      // Cursor pagination keeps deep pages as cheap as the first one
+      const data = await feedAPI.getPostsByCursor(reset ? null : nextUrl);
       
       if (reset) {
         setPosts(data.results);
@@ -23,7 +24,7 @@ const Feed = ({ refreshTrigger, user, onKarmaChange }) => {
       }
       
       setHasMore(!!data.next);
-      setCurrentPage(page);
+      setNextUrl(data.next);
     } catch (err) {
       setError('Failed to load posts. Please try again.');
       console.error('Error loading posts:', err);
@@ -33,12 +34,12 @@ const Feed = ({ refreshTrigger, user, onKarmaChange }) => {
   };
 
   useEffect(() => {
-    loadPosts(1, true);
+    loadPosts(true);
   }, [refreshTrigger]);
 
   const handleLoadMore = () => {
     if (!loading && hasMore) {
-      loadPosts(currentPage + 1, false);
+      loadPosts(false);
     }
   };
 
@@ -55,7 +56,7 @@ const Feed = ({ refreshTrigger, user, onKarmaChange }) => {
       <div className="card" style={{ textAlign: 'center' }}>
         <p style={{ color: '#dc2626', marginBottom: '1rem' }}>{error}</p>
         <button
-          onClick={() => loadPosts(1, true)}
+          onClick={() => loadPosts(true)}
           className="btn btn-primary"
         >
           🔄 Retry
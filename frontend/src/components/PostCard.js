@@ -9,6 +9,8 @@ const PostCard = ({ post, user, onUpdate, onKarmaChange }) => {
   const [isLiked, setIsLiked] = useState(post.is_liked || false);
   const [commentCount, setCommentCount] = useState(post.comment_count || 0);
   const [localComments, setLocalComments] = useState(post.comments || []);
+  // The feed list only carries a comment preview; fetch the thread on first open
+  const [commentsLoaded, setCommentsLoaded] = useState(!!post.comments);
 
   const formatDate = (dateString) => {
     const date = new Date(dateString);
@@ -59,6 +61,20 @@ const PostCard = ({ post, user, onUpdate, onKarmaChange }) => {
     }
   };
 
+  const handleToggleComments = async () => {
+    const opening = !showComments;
+    setShowComments(opening);
+    if (opening && !commentsLoaded) {
+      try {
+        const fullPost = await feedAPI.getPost(post.id);
+        setLocalComments(fullPost.comments || []);
+        setCommentsLoaded(true);
+      } catch (err) {
+        console.error('Error loading comments:', err);
+      }
+    }
+  };
+
   const handleCommentCreated = (newComment) => {
     setLocalComments(prev => [...prev, newComment]);
     setCommentCount(prev => prev + 1);
@@ -196,7 +212,7 @@ const PostCard = ({ post, user, onUpdate, onKarmaChange }) => {
           </button>
 
           <button
-            onClick={() => setShowComments(!showComments)}
+            onClick={handleToggleComments}
             style={{
               display: 'flex',
               alignItems: 'center',
@@ -20,6 +20,14 @@ export const feedAPI = {
     return response.data;
   },
 
+  // Keyset pagination: pass the previous response's `next` link to continue
+  getPostsByCursor: async (nextUrl = null) => {
+    const response = nextUrl
+      ? await api.get(nextUrl)
+      : await api.get('/posts/?pagination=cursor');
+    return response.data;
+  },
+
   createPost: async (content) => {
     const response = await api.post('/posts/', { 
       content,
@@ -54,6 +62,21 @@ export const feedAPI = {
     return response.data;
   },
 
+  // Lazy thread loading: pass the previous response's `next` link to continue
+  getPostComments: async (postId, maxDepth = 2, nextUrl = null) => {
+    const response = await api.get(
+      nextUrl || `/posts/${postId}/comments/?max_depth=${maxDepth}`
+    );
+    return response.data;
+  },
+
+  getCommentReplies: async (commentId, maxDepth = 2, nextUrl = null) => {
+    const response = await api.get(
+      nextUrl || `/comments/${commentId}/replies/?max_depth=${maxDepth}`
+    );
+    return response.data;
+  },
+
   likeComment: async (commentId) => {
     const response = await api.post(`/comments/${commentId}/like/`);
     return response.data;
@@ -64,11 +87,27 @@ export const feedAPI = {
     return response.data;
   },
 
+  // operations: [{ action: 'like' | 'unlike', type: 'post' | 'comment', id }]
+  batchLikes: async (operations) => {
+    const response = await api.post('/likes/batch/', { operations });
+    return response.data;
+  },
+
   // Leaderboard
   getLeaderboard: async () => {
     const response = await api.get('/leaderboard/');
     return response.data;
   },
+
+  // Live deltas over Server-Sent Events; call .close() on the result to stop
+  subscribe: (onDelta, onResync) => {
+    const source = new EventSource(`${API_BASE_URL}/stream/`);
+    source.addEventListener('delta', (event) => onDelta(JSON.parse(event.data)));
+    if (onResync) {
+      source.addEventListener('resync', onResync);
+    }
+    return source;
+  },
 };
 
 export default api;
\ No newline at end of file